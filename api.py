@@ -0,0 +1,380 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from company_stats import COMPANIES, company_stats
+from cube import counts_by_type, cube_cells, monthly_counts, totals, year_type_counts
+from data_store import CSV_PATH, SNAPSHOT_PATH, data_version
+from engine import Engine, concentration, counts_concentration, graph_tables, relationship_counts, top_gestoras
+from engine_cache import load_engine
+from network import top_connected
+from result_cache import ResultCache, filter_key
+from sql_backend import SqlEngine, parquet_version
+
+# Seconds between checks of the data's content hash
+VERSION_CHECK_INTERVAL = float(os.environ.get('API_VERSION_CHECK_SECONDS', 5))
+MAX_LIMIT = 1000
+
+ENTITY_FIELDS = [
+    'entity_name', 'entity_type', 'entity_value', 'registro_oficial', 'fecha_registro',
+    'fecha_ultimo_folleto', 'folleto_url', 'n_classes', 'n_rows'
+]
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Dataset:
+    """The engine and a response cache for the current data version.
+
+    Shared by every request. The content hash is re-checked at most every
+    ``VERSION_CHECK_INTERVAL`` seconds; when it changes, the engine is
+    rebuilt and the response cache starts empty.
+
+    With ``parquet_dir``, the data is the Parquet dataset written by
+    ``sql_backend.py`` and every query runs in DuckDB over it
+    (``SQL_QUERIES``), for registries that do not fit in memory.
+    """
+
+    def __init__(self, csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH, parquet_dir=None):
+        self.csv_path = csv_path
+        self.snapshot_path = snapshot_path
+        self.parquet_dir = parquet_dir
+        self.queries = SQL_QUERIES if parquet_dir else QUERIES
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.version = None
+        self._load(self._data_version())
+
+    def _data_version(self):
+        if self.parquet_dir:
+            return parquet_version(self.parquet_dir)
+        return data_version(self.csv_path, self.snapshot_path)
+
+    def _load(self, version):
+        if self.parquet_dir:
+            self.engine = SqlEngine(self.parquet_dir)
+        else:
+            # Mapped from the host's engine file, shared with the dashboard's processes
+            self.engine = load_engine(version, lambda: Engine.load(self.csv_path, self.snapshot_path))
+        self.cache = ResultCache(
+            max_entries=int(os.environ.get('API_CACHE_MAX_ENTRIES', 1024)),
+            max_bytes=int(os.environ.get('API_CACHE_MAX_MB', 128)) * 1024 * 1024
+        )
+        self.version = version
+
+    def current(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= VERSION_CHECK_INTERVAL:
+                self._checked = now
+                version = self._data_version()
+                if version != self.version:
+                    self._load(version)
+            return self.engine, self.cache, self.version
+
+
+def _records(frame):
+    # NaN -> null, timestamps -> ISO dates
+    frame = frame.copy()
+    for col in frame.select_dtypes(include=['datetime64']).columns:
+        frame[col] = frame[col].dt.strftime('%Y-%m-%d')
+    return json.loads(frame.to_json(orient='records'))
+
+
+def _series(counts, key, value='count'):
+    return [{key: k, value: int(v)} for k, v in counts.items()]
+
+
+def _date(value, name):
+    try:
+        date = pd.Timestamp(value)
+    except ValueError:
+        date = pd.NaT
+    # An empty value parses to NaT rather than failing
+    if pd.isna(date):
+        raise BadRequest(f"Fecha no válida en '{name}': {value}")
+    return date.normalize()
+
+
+def _int(params, name, default, maximum=None):
+    value = params.get(name, default)
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' debe ser un entero")
+    if value < 0:
+        raise BadRequest(f"'{name}' no puede ser negativo")
+    return min(value, maximum) if maximum else value
+
+
+def _filters(engine, params):
+    # Same filters as the sidebar; names are the ones /api/options lists
+    entity_type = params.get('entity_type', 'Todos')
+    gestora = params.get('gestora', 'Todas')
+    depositaria = params.get('depositaria', 'Todas')
+    if entity_type != 'Todos' and entity_type not in engine.filter_options.entity_types:
+        raise BadRequest(f"Tipo de entidad desconocido: {entity_type}")
+    if gestora != 'Todas' and gestora not in engine.filter_options.gestoras('Todos'):
+        raise BadRequest(f"Gestora desconocida: {gestora}")
+    if depositaria != 'Todas' and depositaria not in engine.filter_options.depositarias('Todos', 'Todas'):
+        raise BadRequest(f"Depositaria desconocida: {depositaria}")
+
+    date_range = None
+    if 'date_from' in params or 'date_to' in params:
+        bounds = engine.filter_options.date_bounds('Todos')
+        date_range = (
+            _date(params['date_from'], 'date_from') if 'date_from' in params else bounds[0],
+            _date(params['date_to'], 'date_to') if 'date_to' in params else bounds[1]
+        )
+    return engine.filter_args(entity_type, gestora, depositaria, date_range)
+
+
+def _entity_ids(engine, cache, params, filter_args):
+    key = filter_key(
+        params.get('entity_type', 'Todos'), params.get('gestora', 'Todas'), params.get('depositaria', 'Todas'),
+        filter_args['date_range']
+    )
+    entity_ids = cache.get_or_compute(('entity_ids', key), lambda: engine.select(**filter_args))
+    query = params.get('q', '')
+    if not query:
+        return entity_ids
+    # Search hits in relevance order, restricted to the filters
+    hit_ids, _ = engine.search_index.search(query)
+    return hit_ids[np.isin(hit_ids, entity_ids)]
+
+
+def options(engine, cache, params):
+    entity_type = params.get('entity_type', 'Todos')
+    gestora = params.get('gestora', 'Todas')
+    start, end = engine.filter_options.date_bounds(entity_type)
+    return {
+        'entity_types': engine.filter_options.entity_types,
+        'gestoras': engine.filter_options.gestoras(entity_type),
+        'depositarias': engine.filter_options.depositarias(entity_type, gestora),
+        'date_bounds': [start.date().isoformat(), end.date().isoformat()]
+    }
+
+
+def _cells(engine, cache, params):
+    # Cube cells of the filters; with a search, built over the matching entities
+    filter_args = _filters(engine, params)
+    if not params.get('q'):
+        return engine.cells(**filter_args)
+    return cube_cells(engine.registry, _entity_ids(engine, cache, params, filter_args))
+
+
+def _metrics(result):
+    # Both engines return cube.totals' keys
+    result['latest'] = result['latest'].date().isoformat() if pd.notna(result['latest']) else None
+    return {k: v if isinstance(v, str) or v is None else int(v) for k, v in result.items()}
+
+
+def metrics(engine, cache, params):
+    return _metrics(totals(_cells(engine, cache, params)))
+
+
+def by_type(engine, cache, params):
+    return _series(counts_by_type(_cells(engine, cache, params)), 'entity_type')
+
+
+def _timeline(counts):
+    return [{'month': month.strftime('%Y-%m'), 'count': int(count)} for month, count in counts.items()]
+
+
+def timeline(engine, cache, params):
+    return _timeline(monthly_counts(_cells(engine, cache, params)))
+
+
+def _heatmap(pivot):
+    return {
+        'years': [int(y) for y in pivot.columns],
+        'entity_types': list(pivot.index),
+        'counts': pivot.to_numpy().astype(int).tolist()
+    }
+
+
+def heatmap(engine, cache, params):
+    return _heatmap(year_type_counts(_cells(engine, cache, params)))
+
+
+def gestoras(engine, cache, params):
+    filter_args = _filters(engine, params)
+    entity_ids = _entity_ids(engine, cache, params, filter_args)
+    return _series(top_gestoras(engine.registry, entity_ids, _int(params, 'n', 15, MAX_LIMIT)), 'gestora_nombre')
+
+
+def companies(engine, cache, params, company):
+    filter_args = _filters(engine, params)
+    stats = company_stats(engine.registry, _entity_ids(engine, cache, params, filter_args), company)
+    stats = stats.sort_values(['entidades', 'nombre'], ascending=[False, True]).drop(columns='company_id')
+    return _records(stats)
+
+
+def market(engine, cache, params):
+    # Tab 4: relationships, most connected gestoras and concentration
+    filter_args = _filters(engine, params)
+    entity_ids = _entity_ids(engine, cache, params, filter_args)
+    nodes, _ = graph_tables(engine.graph, entity_ids)
+    return _market(
+        relationship_counts(engine.registry, entity_ids), top_connected(nodes, _int(params, 'n', 5, MAX_LIMIT)),
+        concentration(engine.registry, entity_ids)
+    )
+
+
+def _market(relationships, most_connected, concentration):
+    connections, n_gestoras, n_depositarias = relationships
+    market_share, herfindahl_index = concentration
+    return {
+        'connections': connections,
+        'gestoras': n_gestoras,
+        'depositarias': n_depositarias,
+        'most_connected': _series(most_connected, 'gestora_nombre', 'depositarias'),
+        'top10_share': None if np.isnan(market_share) else float(market_share),
+        'herfindahl_index': float(herfindahl_index)
+    }
+
+
+def entities(engine, cache, params):
+    filter_args = _filters(engine, params)
+    entity_ids = _entity_ids(engine, cache, params, filter_args)
+    offset = _int(params, 'offset', 0)
+    limit = _int(params, 'limit', 100, MAX_LIMIT)
+    page = engine.registry.entities.take(entity_ids[offset:offset + limit])
+    registry = engine.registry
+    frame = page[ENTITY_FIELDS].copy()
+    frame['gestora_nombre'] = registry.gestoras['gestora_nombre'].reindex(page['gestora_id']).to_numpy()
+    frame['depositaria_nombre'] = registry.depositarias['depositaria_nombre'].reindex(page['depositaria_id']).to_numpy()
+    return {'total': int(len(entity_ids)), 'offset': offset, 'limit': limit, 'items': _records(frame)}
+
+
+# The same queries on a SqlEngine: filters and search go into the SQL, and
+# only aggregated rows or one page come back
+
+def _sql_filters(engine, params):
+    return dict(_filters(engine, params), query=params.get('q', ''))
+
+
+def sql_metrics(engine, cache, params):
+    return _metrics(engine.metrics(**_sql_filters(engine, params)))
+
+
+def sql_by_type(engine, cache, params):
+    return _series(engine.counts_by_type(**_sql_filters(engine, params)), 'entity_type')
+
+
+def sql_timeline(engine, cache, params):
+    return _timeline(engine.monthly_counts(**_sql_filters(engine, params)))
+
+
+def sql_heatmap(engine, cache, params):
+    return _heatmap(engine.year_type_counts(**_sql_filters(engine, params)))
+
+
+def sql_gestoras(engine, cache, params):
+    counts = engine.gestora_counts(**_sql_filters(engine, params))
+    return _series(counts.head(_int(params, 'n', 15, MAX_LIMIT)), 'gestora_nombre')
+
+
+def sql_companies(engine, cache, params, company):
+    return _records(engine.company_stats(company, **_sql_filters(engine, params)))
+
+
+def sql_market(engine, cache, params):
+    filter_args = _sql_filters(engine, params)
+    return _market(
+        engine.relationship_counts(**filter_args),
+        engine.top_connected(_int(params, 'n', 5, MAX_LIMIT), **filter_args),
+        counts_concentration(engine.gestora_counts(**filter_args))
+    )
+
+
+def sql_entities(engine, cache, params):
+    offset = _int(params, 'offset', 0)
+    limit = _int(params, 'limit', 100, MAX_LIMIT)
+    total, frame = engine.entity_page(offset, limit, **_sql_filters(engine, params))
+    return {'total': total, 'offset': offset, 'limit': limit, 'items': _records(frame)}
+
+
+QUERIES = {
+    'options': options,
+    'metrics': metrics,
+    'by_type': by_type,
+    'timeline': timeline,
+    'heatmap': heatmap,
+    'gestoras': gestoras,
+    'market': market,
+    'entities': entities,
+    **{f'companies/{company}': (lambda c: lambda *args: companies(*args, c))(company) for company in COMPANIES}
+}
+
+SQL_QUERIES = {
+    'options': options,
+    'metrics': sql_metrics,
+    'by_type': sql_by_type,
+    'timeline': sql_timeline,
+    'heatmap': sql_heatmap,
+    'gestoras': sql_gestoras,
+    'market': sql_market,
+    'entities': sql_entities,
+    **{f'companies/{company}': (lambda c: lambda *args: sql_companies(*args, c))(company) for company in COMPANIES}
+}
+
+
+def create_app(dataset=None):
+    dataset = dataset or Dataset()
+
+    def endpoint(name, query):
+        def handle(request):
+            # Sync handler: Starlette runs it in its thread pool
+            engine, cache, version = dataset.current()
+            params = dict(sorted(request.query_params.items()))
+            key = (name, tuple(params.items()))
+            # The body is a function of the data version and the query, so the
+            # ETag is known before computing anything
+            etag = '"' + hashlib.sha256(repr((version, key)).encode('utf-8')).hexdigest()[:32] + '"'
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Data-Version': version}
+            if etag in request.headers.get('if-none-match', ''):
+                return Response(status_code=304, headers=headers)
+            try:
+                body = cache.get_or_compute(
+                    key, lambda: json.dumps(query(engine, cache, params), ensure_ascii=False).encode('utf-8')
+                )
+            except BadRequest as error:
+                return JSONResponse({'error': str(error)}, status_code=400)
+            return Response(body, media_type='application/json', headers=headers)
+        return Route(f'/api/{name}', handle, methods=['GET'])
+
+    def version(request):
+        _, cache, version = dataset.current()
+        return JSONResponse({'version': version, 'cache': cache.stats()})
+
+    routes = [endpoint(name, query) for name, query in dataset.queries.items()]
+    routes.append(Route('/api/version', version, methods=['GET']))
+    return Starlette(routes=routes)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='API JSON de solo lectura sobre el registro')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument(
+        '--parquet', metavar='DIR',
+        help='Consulta con DuckDB el dataset Parquet de sql_backend.py en lugar de cargar el registro en memoria'
+    )
+    args = parser.parse_args()
+
+    # One process, so every request shares the same in-memory dataset
+    uvicorn.run(create_app(Dataset(parquet_dir=args.parquet)), host=args.host, port=args.port, log_level='warning')
@@ -0,0 +1,123 @@
+# Load test of the JSON API (api.py) on the real registry.
+#
+#   python benchmarks/bench_api.py --concurrency 32 --seconds 10
+#
+# The server runs in its own process. Three scenarios: "cold" sends queries
+# that are all cache misses, "warm" repeats a fixed mix served from the
+# response cache, and "304" repeats the mix with If-None-Match.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+import aiohttp
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MIX = [
+    '/api/metrics',
+    '/api/by_type',
+    '/api/timeline',
+    '/api/heatmap',
+    '/api/gestoras?n=15',
+    '/api/market',
+    '/api/companies/gestora',
+    '/api/companies/depositaria',
+    '/api/entities?limit=100',
+    '/api/metrics?entity_type=Fondos de capital-riesgo',
+    '/api/companies/gestora?entity_type=Sociedades de capital-riesgo',
+    '/api/entities?q=capital&limit=50'
+]
+
+
+def cold_urls():
+    # Every request gets a distinct date range, so none is a cache hit
+    day = 0
+    while True:
+        day += 1
+        start = np.datetime64('1990-01-01') + day % 9000
+        yield f"{MIX[day % len(MIX)]}{'&' if '?' in MIX[day % len(MIX)] else '?'}date_from={start}"
+
+
+def warm_urls():
+    i = 0
+    while True:
+        yield MIX[i % len(MIX)]
+        i += 1
+
+
+async def load(base_url, urls, concurrency, seconds, conditional=False):
+    latencies = []
+    statuses = {}
+    etags = {}
+    deadline = time.perf_counter() + seconds
+
+    async def client(session):
+        while time.perf_counter() < deadline:
+            url = next(urls)
+            headers = {'If-None-Match': etags[url]} if conditional and url in etags else {}
+            start = time.perf_counter()
+            async with session.get(base_url + quote(url, safe='/?=&'), headers=headers) as response:
+                await response.read()
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                if conditional:
+                    etags[url] = response.headers.get('ETag')
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, [50, 95, 99]), statuses
+
+
+async def wait_ready(base_url, timeout=120):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(base_url + '/api/version') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError('La API no arrancó')
+
+
+async def main(args):
+    base_url = f'http://127.0.0.1:{args.port}'
+    await wait_ready(base_url)
+    print(f"{'escenario':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  estados")
+    for name, urls, conditional in [
+        ('cold', cold_urls(), False),
+        ('warm', warm_urls(), False),
+        ('304', warm_urls(), True),
+    ]:
+        rate, (p50, p95, p99), statuses = await load(base_url, urls, args.concurrency, args.seconds, conditional)
+        print(f"{name:<10}{rate:>10.0f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}  {statuses}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8599)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    # Long version-check interval so the server does no extra work during the run
+    env = dict(os.environ, API_VERSION_CHECK_SECONDS='3600', API_CACHE_MAX_ENTRIES='100000')
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'api.py'), '--port', str(args.port)], cwd=ROOT, env=env
+    )
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,70 @@
+# Compares CSV parsing against the Arrow snapshot on a scaled copy of the registry.
+#
+#   python benchmarks/bench_snapshot.py --scale 100
+#
+# Each loader runs in a fresh interpreter so peak RSS is not shared between them.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_store import CSV_PATH, build_snapshot  # noqa: E402
+
+LOADER = '''
+import sys, time
+sys.path.insert(0, {root!r})
+from data_store import load_snapshot, read_registry_csv
+start = time.perf_counter()
+df = {call}
+elapsed = time.perf_counter() - start
+# VmHWM is reset on exec, unlike ru_maxrss which is inherited from the parent
+peak_kb = next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmHWM'))
+print(f"{{elapsed:.4f}} {{peak_kb}} {{len(df)}}")
+'''
+
+
+def scale_csv(src, dst, scale):
+    df = pd.read_csv(src)
+    scaled = pd.concat([df] * scale, ignore_index=True)
+    scaled.to_csv(dst, index=False)
+    return len(scaled)
+
+
+def run_loader(call, repeats):
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, '-c', LOADER.format(root=ROOT, call=call)],
+            check=True, capture_output=True, text=True
+        ).stdout.split()
+        runs.append((float(out[0]), int(out[1]) / 1024, int(out[2])))
+    return min(runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'scaled.csv')
+        snapshot_path = os.path.join(tmp, 'scaled.arrow')
+        n_rows = scale_csv(os.path.join(ROOT, CSV_PATH), csv_path, args.scale)
+        build_snapshot(csv_path, snapshot_path)
+
+        print(f"Filas: {n_rows:,} (x{args.scale})")
+        print(f"CSV: {os.path.getsize(csv_path) / 1e6:.1f} MB | snapshot: {os.path.getsize(snapshot_path) / 1e6:.1f} MB")
+        print(f"{'loader':<10}{'segundos':>10}{'RSS pico (MB)':>16}")
+        for name, call in [
+            ('csv', f'read_registry_csv({csv_path!r})'),
+            ('snapshot', f'load_snapshot({snapshot_path!r})'),
+        ]:
+            elapsed, peak_mb, _ = run_loader(call, args.repeats)
+            print(f"{name:<10}{elapsed:>10.3f}{peak_mb:>16.1f}")
@@ -0,0 +1,249 @@
+# Times each stage of a dashboard rerun on synthetic registries of growing size.
+#
+#   python benchmarks/bench_stages.py --rows 10k --rows 100k --rows 1m
+#   python benchmarks/bench_stages.py --rows 100k --compare
+#
+# Synthetic extracts (benchmarks/synthetic.py) are generated once per size and
+# seed under benchmarks/data/. Every stage is timed separately, best of
+# --repeats, and the results are appended to benchmarks/results.jsonl with the
+# commit they were measured on. --compare prints each stage next to the latest
+# earlier result for the same size and seed from another commit.
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from company_stats import company_stats  # noqa: E402
+from concentration import concentration_over_time  # noqa: E402
+from cube import RegistrationCube, counts_by_type, monthly_counts, totals, year_type_counts  # noqa: E402
+from data_store import load_snapshot, read_registry_csv, write_snapshot  # noqa: E402
+from engine import (  # noqa: E402
+    CLASS_SPECIFIC_COLS, concentration, entity_first_rows, graph_tables, group_rows_frame,
+    relationship_counts, sort_rows, top_gestoras
+)
+from export import row_chunks, write_chunks  # noqa: E402
+from filter_index import FilterIndex, FilterOptions  # noqa: E402
+from network import RelationshipGraph, top_connected  # noqa: E402
+from schema import build_registry  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+from synthetic import generate, size_arg  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results.jsonl')
+
+# Explorer defaults, as main.py shows them
+EXPLORER_COLS = ['entity_name', 'entity_type', 'gestora_nombre', 'fecha_registro', 'isin']
+# A stage this much slower than the baseline is flagged
+REGRESSION = 1.2
+
+
+def synthetic_csv(rows, seed):
+    path = os.path.join(DATA_DIR, f'synthetic_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        generate(rows, seed).to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def filter_states(registry):
+    # No filter, the largest entity type, the busiest gestora and the last
+    # five registration years: what a session clicks through first
+    entities = registry.entities
+    largest_type = entities['entity_type'].value_counts().index[0]
+    busiest_gestora = int(entities.loc[entities['gestora_id'] >= 0, 'gestora_id'].value_counts().index[0])
+    latest = entities['fecha_registro'].max()
+    return [
+        dict(entity_type=None, gestora_id=None, depositaria_id=None, date_range=None),
+        dict(entity_type=largest_type, gestora_id=None, depositaria_id=None, date_range=None),
+        dict(entity_type=None, gestora_id=busiest_gestora, depositaria_id=None, date_range=None),
+        dict(entity_type=None, gestora_id=None, depositaria_id=None, date_range=(latest - pd.DateOffset(years=5), latest))
+    ]
+
+
+class Timer:
+    """Best-of-``repeats`` wall time per stage; each call returns the stage's result."""
+
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.stages = {}
+
+    def __call__(self, stage, fn):
+        best = None
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        self.stages[stage] = round(best, 6)
+        return result
+
+
+def run_stages(csv_path, repeats):
+    timer = Timer(repeats)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, 'snapshot.arrow')
+        df = timer('load.csv', lambda: read_registry_csv(csv_path))
+        timer('load.snapshot_write', lambda: write_snapshot(df, snapshot_path))
+        df = timer('load.snapshot_read', lambda: load_snapshot(snapshot_path))
+        registry = timer('load.registry', lambda: build_registry(df))
+
+        timer('options', lambda: FilterOptions(registry))
+        filter_index = timer('index.filter', lambda: FilterIndex(registry.entities))
+        cube = timer('index.cube', lambda: RegistrationCube(registry))
+        timer('index.search', lambda: SearchIndex(registry))
+        graph = timer('index.graph', lambda: RelationshipGraph(registry))
+
+        # Rerun stages are summed over the filter states, as separate reruns
+        states = filter_states(registry)
+        selections = []
+
+        def select():
+            selections.clear()
+            for state in states:
+                entity_ids = filter_index.select(**state)
+                selections.append((state, entity_ids, registry.rows_for(entity_ids)))
+        timer('filter', select)
+
+        def tab1():
+            for state, _, _ in selections:
+                cells = cube.slice(**state)
+                totals(cells)
+                counts_by_type(cells)
+                monthly_counts(cells)
+        timer('tab1', tab1)
+
+        def tab2():
+            for state, entity_ids, _ in selections:
+                top_gestoras(registry, entity_ids, 15)
+                year_type_counts(cube.slice(**state))
+        timer('tab2', tab2)
+
+        sorted_rows = {}
+
+        def tab3_sort():
+            for i, (_, _, rows) in enumerate(selections):
+                sorted_rows[i] = sort_rows(registry, rows, 'entity_name')
+        timer('tab3.sort', tab3_sort)
+
+        def tab3_group_entity():
+            # Default view: one row per entity, class columns from the rollup
+            groupby_cols = [col for col in EXPLORER_COLS if col not in CLASS_SPECIFIC_COLS]
+            for rows in sorted_rows.values():
+                page = entity_first_rows(registry, rows)[:100]
+                display_df = registry.to_frame(page, groupby_cols)
+                display_df['isin'] = registry.class_rollup['isin'].to_numpy()[registry.row_entity[page]]
+        timer('tab3.group_entity', tab3_group_entity)
+
+        def tab3_group_columns():
+            # Grouping without the entity's name: aggregated over every row
+            show_cols = ['gestora_nombre', 'entity_type', 'isin']
+            for rows in sorted_rows.values():
+                group_rows_frame(registry.to_frame(rows, show_cols), show_cols[:2], show_cols[2:])
+        timer('tab3.group_columns', tab3_group_columns)
+
+        def tab4():
+            for state, entity_ids, _ in selections:
+                company_stats(registry, entity_ids, 'gestora')
+                company_stats(registry, entity_ids, 'depositaria')
+                relationship_counts(registry, entity_ids)
+                top_connected(graph_tables(graph, entity_ids)[0])
+                concentration(registry, entity_ids)
+                concentration_over_time(cube.slice(**state))
+        timer('tab4', tab4)
+
+        export_path = os.path.join(tmp, 'export.csv')
+        timer('export.csv', lambda: write_chunks(row_chunks(registry, sorted_rows[0], EXPLORER_COLS), export_path, 'CSV'))
+    return timer.stages, registry
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    # Uncommitted changes to tracked files make the result not reproducible from the commit
+    return commit + ('-dirty' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+
+def load_results(path=RESULTS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def baseline(results, record):
+    # Latest earlier result for the same size and seed from another commit
+    for previous in reversed(results):
+        if (
+            previous['rows'] == record['rows'] and previous['seed'] == record['seed']
+            and previous['commit'] != record['commit']
+        ):
+            return previous
+    return None
+
+
+def print_record(record, base=None):
+    print(f"\n{record['rows']:,} filas ({record['entities']:,} entidades) @ {record['commit']}")
+    if base is not None:
+        print(f"comparado con {base['commit']} ({base['timestamp']})")
+        print(f"{'etapa':<22}{'antes (s)':>12}{'ahora (s)':>12}{'ratio':>8}")
+    else:
+        print(f"{'etapa':<22}{'segundos':>12}")
+    for stage, seconds in record['stages'].items():
+        if base is None:
+            print(f"{stage:<22}{seconds:>12.4f}")
+            continue
+        before = base['stages'].get(stage)
+        if before is None:
+            print(f"{stage:<22}{'-':>12}{seconds:>12.4f}")
+            continue
+        ratio = seconds / before if before else np.inf
+        flag = '  <-- regresión' if ratio > REGRESSION else ''
+        print(f"{stage:<22}{before:>12.4f}{seconds:>12.4f}{ratio:>8.2f}{flag}")
+    total = sum(record['stages'].values())
+    print(f"{'total':<22}{total:>12.4f}" if base is None else f"{'total':<22}{sum(base['stages'].values()):>12.4f}{total:>12.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tiempos por etapa sobre registros sintéticos')
+    parser.add_argument('--rows', type=size_arg, action='append', help='Filas (o 10k, 100k, 1m); por defecto, 10k y 100k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--compare', action='store_true', help='Compara con el último resultado de otro commit')
+    parser.add_argument('--no-save', action='store_true', help='No añade los resultados a results.jsonl')
+    parser.add_argument('--results', default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = load_results(args.results)
+    commit = git_commit()
+    for rows in args.rows or [10_000, 100_000]:
+        stages, registry = run_stages(synthetic_csv(rows, args.seed), args.repeats)
+        record = {
+            'commit': commit,
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'rows': rows,
+            'seed': args.seed,
+            'entities': registry.n_entities,
+            'repeats': args.repeats,
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'stages': stages
+        }
+        print_record(record, baseline(results, record) if args.compare else None)
+        if not args.no_save:
+            with open(args.results, 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(record) + '\n')
+            results.append(record)
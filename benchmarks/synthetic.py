@@ -0,0 +1,150 @@
+# Synthetic versions of all_entities_detailed.csv at any size.
+#
+#   python benchmarks/synthetic.py --rows 100000 --out synthetic_100k.csv
+#
+# Distributions are taken from the real registry: entity types, classes per
+# fund, registration dates, and missing gestora/depositaria/folleto/ISIN
+# rates. The number of gestoras and depositarias grows sublinearly with the
+# number of funds, and funds are spread over them with the real registry's
+# heavy-tailed (Zipf-like) popularity.
+import argparse
+import os
+import string
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_store import CSV_PATH  # noqa: E402
+from schema import CLASS_COLS, DEPOSITARIA_COLS, ENTITY_COLS, GESTORA_COLS  # noqa: E402
+
+COLUMNS = ENTITY_COLS + GESTORA_COLS + DEPOSITARIA_COLS + CLASS_COLS
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+WORDS = [
+    'CAPITAL', 'INVERSIONES', 'PRIVATE EQUITY', 'VENTURES', 'GROWTH', 'INFRAESTRUCTURAS', 'RENOVABLES',
+    'TECH', 'IBERIA', 'GLOBAL', 'HORIZONTE', 'ATLANTICO', 'SUR', 'NORTE', 'DEUDA', 'IMPACTO'
+]
+
+
+def _zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _companies(rng, n, kind):
+    ids = np.arange(n)
+    names = [f"{kind.upper()} SINTETICA {i:05d}, S.A." for i in ids]
+    return pd.DataFrame({
+        f'{kind}_nombre': names,
+        f'{kind}_registro': pd.array(rng.permutation(n) + 1, dtype='Int64'),
+        f'{kind}_domicilio': [f"CALLE {WORDS[i % len(WORDS)]} {i % 200 + 1} - 280{i % 50:02d} MADRID (MADRID)" for i in ids],
+        f'{kind}_url': [
+            f"https://www.cnmv.es/portal/Consultas/iic/{kind}.aspx?nif=A-{i:08d}" for i in ids
+        ]
+    })
+
+
+def generate(rows, seed=0, source=CSV_PATH):
+    """Synthetic registry extract with ``rows`` rows, in the CSV's schema and formats."""
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(source)
+    # Real funds as profiles: class count, type, dates and which fields are
+    # missing are drawn together, so their correlations carry over
+    profiles = real.groupby('entity_value', sort=False).agg(
+        n_classes=('entity_value', 'size'),
+        entity_type=('entity_type', 'first'),
+        entity_name=('entity_name', 'first'),
+        fecha_registro=('fecha_registro', 'first'),
+        fecha_ultimo_folleto=('fecha_ultimo_folleto', 'first'),
+        has_folleto=('folleto_url', lambda s: s.notna().any()),
+        has_gestora=('gestora_nombre', lambda s: s.notna().any()),
+        has_depositaria=('depositaria_nombre', lambda s: s.notna().any())
+    )
+
+    # Enough funds to reach the row target, given the real classes-per-fund mix
+    n_funds = int(rows / profiles['n_classes'].mean() * 1.05) + 1
+    picks = rng.integers(0, len(profiles), n_funds)
+    n_funds = int(np.searchsorted(np.cumsum(profiles['n_classes'].to_numpy()[picks]), rows)) + 1
+    sample = profiles.iloc[picks[:n_funds]].reset_index(drop=True)
+    n_classes = sample['n_classes'].to_numpy()
+
+    scale = n_funds / len(profiles)
+    n_gestoras = max(1, int(real['gestora_nombre'].nunique() * scale ** 0.75))
+    n_depositarias = max(1, int(real['depositaria_nombre'].nunique() * scale ** 0.3))
+    gestoras = _companies(rng, n_gestoras, 'gestora')
+    depositarias = _companies(rng, n_depositarias, 'depositaria')
+
+    # Real dates jittered by up to two months, so larger extracts do not
+    # collapse onto the same few hundred days
+    # Legal-form suffix ("FCR", "SCR, S.A.") of the sampled real fund
+    suffixes = sample['entity_name'].str.extract(r',\s*([^,]+(?:, S\.A\.)?)$', expand=False).fillna('FCR')
+    jitter = pd.to_timedelta(rng.integers(-60, 61, n_funds), unit='D')
+    fecha_registro = pd.to_datetime(sample['fecha_registro'], format='%d/%m/%Y', errors='coerce') + jitter
+    fecha_folleto = pd.to_datetime(sample['fecha_ultimo_folleto'], format='%d/%m/%Y', errors='coerce') + jitter
+    has_date = fecha_registro.notna().to_numpy()
+    has_folleto = sample['has_folleto'].to_numpy()
+    has_gestora = sample['has_gestora'].to_numpy()
+    has_depositaria = sample['has_depositaria'].to_numpy()
+    gestora_ids = rng.choice(n_gestoras, n_funds, p=_zipf_weights(n_gestoras, 1.0))
+    depositaria_ids = rng.choice(n_depositarias, n_funds, p=_zipf_weights(n_depositarias, 1.5))
+
+    funds = pd.DataFrame({
+        'entity_type': sample['entity_type'],
+        'entity_name': [
+            f"{WORDS[i % len(WORDS)]} {WORDS[(i // len(WORDS)) % len(WORDS)]} {i:07d}, {suffix}"
+            for i, suffix in enumerate(suffixes)
+        ],
+        'entity_value': [f"V{i:08d}" for i in rng.permutation(n_funds) + 10_000_000],
+        'registro_oficial': rng.permutation(n_funds) + 1,
+        'fecha_registro': fecha_registro.dt.strftime('%d/%m/%Y'),
+        'fecha_ultimo_folleto': fecha_folleto.dt.strftime('%d/%m/%Y'),
+        'folleto_url': np.where(
+            has_folleto, [f"https://www.cnmv.es/webservices/verdocumento/ver?e=SYN{i:010d}" for i in range(n_funds)], None
+        )
+    })
+    funds['registro_oficial'] = pd.array(funds['registro_oficial'], dtype='Int64')
+    funds.loc[~has_date, 'registro_oficial'] = pd.NA
+    for kind, table, ids, present in [
+        ('gestora', gestoras, gestora_ids, has_gestora),
+        ('depositaria', depositarias, depositaria_ids, has_depositaria)
+    ]:
+        for col in table.columns:
+            funds[col] = table[col].take(ids).reset_index(drop=True)
+            funds.loc[~present, col] = pd.NA
+
+    # One row per class; single-row funds carry a class only as often as in the real data
+    fund_of_row = np.repeat(np.arange(n_funds), n_classes)
+    df = funds.iloc[fund_of_row].reset_index(drop=True)
+    numero = np.arange(len(df)) - np.repeat(np.cumsum(n_classes) - n_classes, n_classes) + 1
+    single = (n_classes == 1)[fund_of_row]
+    has_class = ~single | (rng.random(len(df)) > real.loc[~real['entity_value'].duplicated(keep=False), 'numero'].isna().mean())
+    letters = np.array(list(string.ascii_uppercase))
+    df['numero'] = pd.array(numero, dtype='Int64')
+    df.loc[~has_class, 'numero'] = pd.NA
+    df['denominacion'] = np.where(has_class, [f"CLASE {letters[(n - 1) % 26]}" for n in numero], None)
+    df['fecha_alta'] = np.nan
+    df['dfi'] = np.nan
+    has_isin = has_class & (rng.random(len(df)) > real.loc[real['numero'].notna(), 'isin'].isna().mean())
+    df['isin'] = np.where(has_isin, [f"ES{i:010d}" for i in rng.permutation(len(df)) + 1_000_000_000], None)
+    return df.iloc[:rows][COLUMNS]
+
+
+def size_arg(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera un registro sintético con el esquema del CSV')
+    parser.add_argument('--rows', type=size_arg, default='100k', help='Filas (o 10k, 100k, 1m)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    df = generate(args.rows, args.seed)
+    df.to_csv(args.out, index=False)
+    print(f"{len(df):,} filas ({df['entity_value'].nunique():,} entidades, "
+          f"{df['gestora_nombre'].nunique():,} gestoras, {df['depositaria_nombre'].nunique():,} depositarias) en {args.out}")
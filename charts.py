@@ -0,0 +1,290 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# Custom color palette for dark theme
+DARK_THEME_COLORS = [
+    '#a855f7', '#7c3aed', '#06b6d4', '#10b981',
+    '#f59e0b', '#ef4444', '#ec4899', '#8b5cf6',
+    '#3b82f6', '#14b8a6'
+]
+GRID_COLOR = 'rgba(42, 46, 57, 0.5)'
+COLORBAR = dict(
+    tickfont=dict(color='#e6e9ef'),
+    bgcolor='rgba(30, 33, 40, 0.8)',
+    bordercolor='#2a2e39',
+    borderwidth=1
+)
+
+# Dark theme shared by every figure, built once at import. It replaces
+# plotly's default template, which every figure would otherwise embed
+# (about 7 KB of JSON per chart, per rerun)
+DARK_TEMPLATE = go.layout.Template(
+    layout=dict(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#e6e9ef'),
+        colorway=DARK_THEME_COLORS,
+        xaxis=dict(gridcolor=GRID_COLOR),
+        yaxis=dict(gridcolor=GRID_COLOR)
+    ),
+    data=dict(
+        bar=[go.Bar(marker=dict(colorbar=COLORBAR))],
+        heatmap=[go.Heatmap(colorbar=COLORBAR)]
+    )
+)
+
+# Hover date format of each timeline grain (see cube.timeline_counts)
+TIMELINE_HOVER = {'M': '%b %Y', 'Q': 'T%q %Y', 'Y': '%Y'}
+
+
+def pie_figure(entity_counts):
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=entity_counts.index,
+        values=entity_counts.values,
+        hole=0.4,
+        marker=dict(
+            colors=DARK_THEME_COLORS[:len(entity_counts)],
+            line=dict(color='#1a1d25', width=2)
+        ),
+        textfont=dict(color='white', size=12),
+        hovertemplate='<b>%{label}</b><br>Cantidad: %{value}<br>Porcentaje: %{percent}<extra></extra>'
+    )])
+
+    fig_pie.update_layout(
+        template=DARK_TEMPLATE,
+        height=400,
+        margin=dict(t=20, b=20),
+        showlegend=True,
+        legend=dict(
+            font=dict(size=10),
+            orientation="v",
+            yanchor="middle",
+            y=0.5,
+            xanchor="left",
+            x=1.02
+        )
+    )
+    return fig_pie
+
+
+def timeline_figure(timeline_counts, grain='M'):
+    fig_timeline = go.Figure()
+    fig_timeline.add_trace(go.Scatter(
+        # Plain dates are shorter on the wire than full timestamps
+        x=timeline_counts['month_year'].dt.strftime('%Y-%m-%d'),
+        y=timeline_counts['count'],
+        mode='lines',
+        fill='tozeroy',
+        line=dict(color='#06b6d4', width=3),
+        fillcolor='rgba(6, 182, 212, 0.15)',
+        hovertemplate=f'<b>%{{x|{TIMELINE_HOVER[grain]}}}</b><br>Registros: %{{y}}<extra></extra>'
+    ))
+
+    fig_timeline.update_layout(
+        template=DARK_TEMPLATE,
+        height=400,
+        xaxis=dict(type='date', showgrid=True),
+        yaxis=dict(
+            showgrid=True,
+            title="Número de Registros"
+        ),
+        margin=dict(t=20, b=20)
+    )
+    return fig_timeline
+
+
+def top_gestoras_figure(top_gestoras):
+    fig_bar = go.Figure(data=[go.Bar(
+        y=top_gestoras.index,
+        x=top_gestoras.values,
+        orientation='h',
+        marker=dict(
+            color=top_gestoras.values,
+            colorscale=[[0, '#7c3aed'], [0.5, '#06b6d4'], [1, '#10b981']],
+            showscale=True,
+            colorbar=dict(
+                title=dict(
+                    text="Entidades",
+                    font=dict(color='#e6e9ef')
+                )
+            )
+        ),
+        text=top_gestoras.values,
+        textposition='outside',
+        textfont=dict(color='#e6e9ef', size=11),
+        hovertemplate='<b>%{y}</b><br>Entidades: %{x}<extra></extra>'
+    )])
+
+    fig_bar.update_layout(
+        template=DARK_TEMPLATE,
+        height=600,
+        xaxis=dict(
+            showgrid=True,
+            title="Número de Entidades"
+        ),
+        yaxis=dict(showgrid=False),
+        margin=dict(l=200, r=50, t=20, b=50)
+    )
+    return fig_bar
+
+
+def heatmap_figure(heatmap_pivot):
+    fig_heatmap = go.Figure(data=go.Heatmap(
+        z=heatmap_pivot.values,
+        x=heatmap_pivot.columns,
+        y=heatmap_pivot.index,
+        colorscale=[[0, '#1e2128'], [0.2, '#7c3aed'], [0.5, '#06b6d4'], [0.8, '#10b981'], [1, '#f59e0b']],
+        text=heatmap_pivot.values,
+        texttemplate='%{text:.0f}',
+        textfont={"size": 10, "color": "white"},
+        hovertemplate='<b>%{y}</b><br>Año: %{x}<br>Cantidad: %{z}<extra></extra>'
+    ))
+
+    fig_heatmap.update_layout(
+        template=DARK_TEMPLATE,
+        height=500,
+        xaxis=dict(title="Año", side="bottom"),
+        yaxis=dict(title="Tipo de Entidad"),
+        margin=dict(l=200, r=20, t=20, b=50)
+    )
+    return fig_heatmap
+
+
+def connected_figure(connected):
+    fig_connected = go.Figure(data=[go.Bar(
+        x=connected.index,
+        y=connected.values,
+        marker=dict(
+            color=connected.values,
+            colorscale=[[0, '#7c3aed'], [1, '#06b6d4']],
+            showscale=False
+        ),
+        text=connected.values,
+        textposition='outside',
+        textfont=dict(color='#e6e9ef', size=12),
+        hovertemplate='<b>%{x}</b><br>Depositarias Conectadas: %{y}<extra></extra>'
+    )])
+
+    fig_connected.update_layout(
+        template=DARK_TEMPLATE,
+        height=300,
+        xaxis=dict(
+            tickangle=-45,
+            showgrid=False
+        ),
+        yaxis=dict(
+            title="Número de Depositarias Conectadas",
+            showgrid=True
+        ),
+        margin=dict(b=100)
+    )
+    return fig_connected
+
+
+def network_figure(nodes, positions, edges, max_edges=5_000):
+    # WebGL traces: one for the edges (the heaviest max_edges), one per node kind
+    lookup = np.zeros((nodes['node'].max() + 1 if len(nodes) else 0, 2))
+    # Screen positions need no more than 4 decimals; full floats triple the payload
+    positions = positions.round(4)
+    lookup[nodes['node'].to_numpy()] = positions
+    edges = edges.nlargest(max_edges, 'funds') if len(edges) > max_edges else edges
+    # Segments separated by NaN gaps, so all edges are a single trace
+    segments = np.full((len(edges), 3, 2), np.nan)
+    segments[:, 0] = lookup[edges['source'].to_numpy()]
+    segments[:, 1] = lookup[edges['target'].to_numpy()]
+    segments = segments.reshape(-1, 2)
+
+    fig_network = go.Figure()
+    fig_network.add_trace(go.Scattergl(
+        x=segments[:, 0],
+        y=segments[:, 1],
+        mode='lines',
+        line=dict(color='rgba(139, 146, 168, 0.25)', width=1),
+        hoverinfo='skip',
+        showlegend=False
+    ))
+    for kind, label, color in [('gestora', 'Sociedades gestoras', '#06b6d4'), ('depositaria', 'Depositarias', '#f59e0b')]:
+        mask = (nodes['kind'] == kind).to_numpy()
+        subset = nodes[mask]
+        fig_network.add_trace(go.Scattergl(
+            x=positions[mask, 0],
+            y=positions[mask, 1],
+            mode='markers',
+            name=label,
+            marker=dict(
+                size=np.clip(4 + 3 * np.sqrt(subset['funds'].to_numpy()), 4, 40),
+                color=color,
+                opacity=0.85,
+                line=dict(color='#1a1d25', width=0.5)
+            ),
+            customdata=np.column_stack([subset['funds'], subset['degree'], subset['centrality'].round(3)]),
+            text=subset['name'],
+            hovertemplate='<b>%{text}</b><br>Fondos: %{customdata[0]}<br>Conexiones: %{customdata[1]}'
+                          '<br>Centralidad: %{customdata[2]:.3f}<extra></extra>'
+        ))
+
+    fig_network.update_layout(
+        template=DARK_TEMPLATE,
+        height=600,
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False, scaleanchor='x'),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0, xanchor='left', x=0),
+        margin=dict(l=10, r=10, t=30, b=10)
+    )
+    return fig_network
+
+
+def overlap_figure(overlap):
+    fig_overlap = go.Figure(data=go.Heatmap(
+        z=overlap.values,
+        x=overlap.columns,
+        y=overlap.index,
+        colorscale=[[0, '#1e2128'], [0.5, '#7c3aed'], [1, '#06b6d4']],
+        hovertemplate='<b>%{y}</b><br>%{x}<br>Depositarias compartidas: %{z}<extra></extra>'
+    ))
+
+    fig_overlap.update_layout(
+        template=DARK_TEMPLATE,
+        height=500,
+        xaxis=dict(tickangle=-45, showticklabels=False),
+        yaxis=dict(autorange='reversed'),
+        margin=dict(l=250, r=20, t=20, b=20)
+    )
+    return fig_overlap
+
+
+# Axis title and tick format of each concentration indicator (see concentration.py)
+CONCENTRATION_METRICS = {
+    'hhi': ('Índice Herfindahl', '.3f'),
+    'cr5': ('Cuota Top 5', '.0%'),
+    'cr10': ('Cuota Top 10', '.0%'),
+    'gini': ('Coeficiente de Gini', '.2f')
+}
+
+
+def concentration_figure(concentration, metric, total_type):
+    label, tickformat = CONCENTRATION_METRICS[metric]
+    fig_concentration = go.Figure()
+    # The market as a whole last, so it is drawn over the entity types
+    for entity_type, series in sorted(concentration.groupby('entity_type'), key=lambda item: item[0] == total_type):
+        is_total = entity_type == total_type
+        fig_concentration.add_trace(go.Scatter(
+            x=series['year'],
+            y=series[metric],
+            mode='lines+markers' if is_total else 'lines',
+            name=entity_type,
+            line=dict(width=3 if is_total else 1.5, color='#e6e9ef' if is_total else None),
+            customdata=series[['gestoras', 'total']],
+            hovertemplate=f'<b>{entity_type}</b><br>Año: %{{x}}<br>{label}: %{{y:{tickformat}}}'
+                          '<br>Gestoras: %{customdata[0]}<br>Registradas: %{customdata[1]}<extra></extra>'
+        ))
+
+    fig_concentration.update_layout(
+        template=DARK_TEMPLATE,
+        height=450,
+        xaxis=dict(title="Año", showgrid=True, dtick=5),
+        yaxis=dict(title=label, showgrid=True, tickformat=tickformat),
+        legend=dict(font=dict(size=10)),
+        margin=dict(t=20, b=50)
+    )
+    return fig_concentration
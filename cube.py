@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ['entity_type', 'gestora_id', 'depositaria_id', 'fecha_registro']
+MEASURES = ['n_entities', 'n_rows', 'n_isin', 'n_folleto']
+# The timeline falls back to coarser grains past this many points
+TIMELINE_MAX_POINTS = 240
+TIMELINE_GRAINS = ['M', 'Q', 'Y']
+
+
+class RegistrationCube:
+    """Counts pre-aggregated over (entity_type, gestora, depositaria, fecha_registro).
+
+    Every entity falls in exactly one cell, so distinct-entity counts add up
+    across cells like the row counts do. The registration day is kept as the
+    finest time grain so the sidebar's day-level date range slices exactly;
+    ``month`` is stored on each cell for the monthly rollups.
+    """
+
+    def __init__(self, registry):
+        self.cells = cube_cells(registry)
+
+    def slice(self, entity_type=None, gestora_id=None, depositaria_id=None, date_range=None):
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        if entity_type is not None:
+            mask &= (cells['entity_type'] == entity_type).to_numpy()
+        if gestora_id is not None:
+            mask &= (cells['gestora_id'] == gestora_id).to_numpy()
+        if depositaria_id is not None:
+            mask &= (cells['depositaria_id'] == depositaria_id).to_numpy()
+        if date_range is not None:
+            mask &= (
+                (cells['fecha_registro'] >= pd.Timestamp(date_range[0])) &
+                (cells['fecha_registro'] <= pd.Timestamp(date_range[1]))
+            ).to_numpy()
+        return cells[mask]
+
+
+def cube_cells(registry, entity_ids=None):
+    """The cube's cells over ``entity_ids`` only (all entities when None), e.g. a search's hits."""
+    entities = registry.entities
+    classes = registry.classes
+    n_rows = entities['n_rows'].to_numpy()
+    isin_owners = classes.loc[classes['isin'].notna(), 'entity_id'].to_numpy()
+
+    frame = pd.DataFrame({
+        'entity_type': entities['entity_type'],
+        'gestora_id': entities['gestora_id'],
+        'depositaria_id': entities['depositaria_id'],
+        'fecha_registro': entities['fecha_registro'],
+        'n_entities': np.ones(len(entities), dtype=np.int64),
+        'n_rows': n_rows.astype(np.int64),
+        'n_isin': np.bincount(isin_owners, minlength=len(entities)),
+        'n_folleto': np.where(entities['folleto_url'].notna(), n_rows, 0)
+    })
+    if entity_ids is not None:
+        frame = frame.take(np.sort(entity_ids))
+    cells = frame.groupby(DIMENSIONS, dropna=False, observed=True, sort=False)[MEASURES].sum().reset_index()
+    cells['month'] = cells['fecha_registro'].dt.to_period('M').dt.to_timestamp()
+    return cells
+
+
+def totals(cells):
+    return {
+        'n_entities': int(cells['n_entities'].sum()),
+        'n_rows': int(cells['n_rows'].sum()),
+        'n_isin': int(cells['n_isin'].sum()),
+        'n_folleto': int(cells['n_folleto'].sum()),
+        'n_rows_gestora': int(cells.loc[cells['gestora_id'] >= 0, 'n_rows'].sum()),
+        'n_rows_depositaria': int(cells.loc[cells['depositaria_id'] >= 0, 'n_rows'].sum()),
+        'n_types': cells['entity_type'].nunique(),
+        'n_gestoras': cells.loc[cells['gestora_id'] >= 0, 'gestora_id'].nunique(),
+        'n_depositarias': cells.loc[cells['depositaria_id'] >= 0, 'depositaria_id'].nunique(),
+        'latest': cells['fecha_registro'].max()
+    }
+
+
+def counts_by_type(cells, measure='n_rows'):
+    counts = cells.groupby('entity_type', observed=True)[measure].sum()
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+def monthly_counts(cells, measure='n_rows'):
+    counts = cells.groupby('month')[measure].sum()
+    return counts[counts > 0]
+
+
+def timeline_counts(cells, max_points=TIMELINE_MAX_POINTS, measure='n_rows'):
+    """Registrations per month, or per quarter or year when there would be more than ``max_points``.
+
+    Returns ``(counts, grain)`` with grain 'M', 'Q' or 'Y'; counts are indexed
+    by the first day of each period.
+    """
+    counts = monthly_counts(cells, measure)
+    for grain in TIMELINE_GRAINS:
+        if grain != 'M':
+            counts = counts.groupby(counts.index.to_period(grain).to_timestamp()).sum()
+        if len(counts) <= max_points:
+            break
+    return counts, grain
+
+
+def year_type_counts(cells, measure='n_rows'):
+    dated = cells[cells['fecha_registro'].notna()]
+    counts = dated.groupby([dated['fecha_registro'].dt.year.rename('year'), 'entity_type'], observed=True)[measure].sum()
+    return counts.unstack('year', fill_value=0)
@@ -0,0 +1,171 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CSV_PATH = 'all_entities_detailed.csv'
+SNAPSHOT_PATH = 'all_entities_detailed.arrow'
+
+# Entity types with many None values, left out of the dashboard
+EXCLUDE_TYPES = [
+    'Gestora de entidades de inversión de tipo cerrado',
+    'Fondo de inversión a largo plazo europeo'
+]
+
+DATE_COLS = ['fecha_registro', 'fecha_ultimo_folleto']
+
+# Low-cardinality columns stored as dictionary arrays (categoricals in pandas)
+CATEGORICAL_COLS = [
+    'entity_type',
+    'folleto_url',
+    'gestora_nombre',
+    'gestora_domicilio',
+    'gestora_url',
+    'depositaria_nombre',
+    'depositaria_domicilio',
+    'depositaria_url',
+    'denominacion'
+]
+
+
+def read_registry_csv(path=CSV_PATH):
+    df = pd.read_csv(path)
+    # Rows without an entity_value belong to no entity (build_registry keys
+    # every row on it), so they are dropped with the excluded types
+    df = df[~df['entity_type'].isin(EXCLUDE_TYPES) & df['entity_value'].notna()].reset_index(drop=True)
+
+    for col in DATE_COLS:
+        df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
+    for col in CATEGORICAL_COLS:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def row_hashes(df):
+    # Per-row hash of the values; numbers are compared as floats so an int
+    # column in one extract matches the same column parsed as float in another
+    values = df.copy()
+    for col in values.columns:
+        if pd.api.types.is_numeric_dtype(values[col]) and not isinstance(values[col].dtype, pd.CategoricalDtype):
+            values[col] = values[col].astype('float64')
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def content_hash(df):
+    # Independent of row order, so a merged snapshot hashes like a full rebuild
+    return hashlib.sha256(np.sort(row_hashes(df)).tobytes()).hexdigest()[:16]
+
+
+def write_snapshot(df, path=SNAPSHOT_PATH, source_hash=None):
+    # Uncompressed Arrow IPC file so it can be memory-mapped on load; the
+    # content hash, and the hash of the CSV it was built from, are kept in
+    # the schema metadata
+    version = content_hash(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**table.schema.metadata, b'content_hash': version.encode()}
+    if source_hash:
+        metadata[b'source_hash'] = source_hash.encode()
+    table = table.replace_schema_metadata(metadata)
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return version
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+_file_hashes = {}
+
+
+def file_hash(path):
+    # Hash of the file's bytes; re-read only when its mtime or size change,
+    # so a checkout that merely touches the CSV costs one pass
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_hashes.get(os.path.abspath(path))
+    if cached is None or cached[0] != key:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(chunk)
+        cached = _file_hashes[os.path.abspath(path)] = (key, digest.hexdigest()[:16])
+    return cached[1]
+
+
+def _snapshot_metadata(path, key):
+    # Reads only the file footer; None for snapshots written without the key
+    with pa.memory_map(path, 'r') as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    value = metadata.get(key)
+    return value.decode() if value else None
+
+
+def snapshot_hash(path=SNAPSHOT_PATH):
+    return _snapshot_metadata(path, b'content_hash')
+
+
+def snapshot_is_stale(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    # Stale when the CSV's bytes differ from those the snapshot was built
+    # from; modification times alone change on every checkout or pull
+    if not os.path.exists(snapshot_path):
+        return True
+    if not os.path.exists(csv_path):
+        return False
+    return _snapshot_metadata(snapshot_path, b'source_hash') != file_hash(csv_path)
+
+
+def _stat_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def data_version(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    """Content hash of the current data, used to key every cache built on it.
+
+    A CSV whose contents differ from the snapshot's source is converted
+    first, so a replaced extract is picked up on the next rerun instead of
+    the next process restart.
+    """
+    if snapshot_is_stale(csv_path, snapshot_path):
+        try:
+            build_snapshot(csv_path, snapshot_path)
+        except OSError:
+            # Read-only deployments fall back to the file's mtime and size
+            return _stat_version(csv_path)
+    return snapshot_hash(snapshot_path) or _stat_version(snapshot_path)
+
+
+def build_snapshot(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    df = read_registry_csv(csv_path)
+    write_snapshot(df, snapshot_path, file_hash(csv_path))
+    return df
+
+
+def load_registry(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    # Parse the CSV only when the snapshot is missing or was built from other contents
+    if not snapshot_is_stale(csv_path, snapshot_path):
+        return load_snapshot(snapshot_path)
+    try:
+        return build_snapshot(csv_path, snapshot_path)
+    except OSError:
+        # Read-only deployments still work, just without the snapshot
+        return read_registry_csv(csv_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera el snapshot Arrow a partir del CSV del registro')
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    df = build_snapshot(args.csv, args.snapshot)
+    print(f"{len(df):,} filas escritas en {args.snapshot}")
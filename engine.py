@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+from cube import RegistrationCube, totals
+from data_store import CSV_PATH, SNAPSHOT_PATH, load_registry
+from filter_index import FilterIndex, FilterOptions
+from network import RelationshipGraph
+from schema import build_registry, count_distinct
+from search_index import SearchIndex
+
+
+class Engine:
+    """The registry and every index built on it, usable without Streamlit.
+
+    Filters are given the way the sidebar shows them (names, with 'Todos' /
+    'Todas' meaning no filter) and resolved to the integer ids the indexes
+    work on.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.filter_index = FilterIndex(registry.entities)
+        self.filter_options = FilterOptions(registry)
+        self.cube = RegistrationCube(registry)
+        self.search_index = SearchIndex(registry)
+        self.graph = RelationshipGraph(registry)
+
+    @classmethod
+    def load(cls, csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+        return cls(build_registry(load_registry(csv_path, snapshot_path)))
+
+    @classmethod
+    def load_version(cls, store, version):
+        # A past extract, rebuilt from the version store (see versions.py)
+        return cls(build_registry(store.frame(version)))
+
+    def filter_args(self, entity_type='Todos', gestora='Todas', depositaria='Todas', date_range=None):
+        # All filters are fund-level, so they resolve on the entity index
+        return dict(
+            entity_type=entity_type if entity_type != 'Todos' else None,
+            gestora_id=self.registry.gestora_ids[gestora] if gestora != 'Todas' else None,
+            depositaria_id=self.registry.depositaria_ids[depositaria] if depositaria != 'Todas' else None,
+            date_range=tuple(date_range) if date_range is not None and len(date_range) == 2 else None
+        )
+
+    def select(self, **filter_args):
+        return self.filter_index.select(**filter_args)
+
+    def rows(self, entity_ids):
+        return self.registry.rows_for(entity_ids)
+
+    def frame(self, rows=None, columns=None):
+        return self.registry.to_frame(rows, columns)
+
+    def cells(self, **filter_args):
+        return self.cube.slice(**filter_args)
+
+    def metrics(self, **filter_args):
+        return totals(self.cells(**filter_args))
+
+
+def gestora_counts(registry, entity_ids):
+    # Rows per gestora, largest first (ties by name), summed over the entity
+    # table rather than counted over the rows
+    entities = registry.entities
+    gestora_ids = entities['gestora_id'].to_numpy()[entity_ids]
+    n_rows = entities['n_rows'].to_numpy()[entity_ids]
+    managed = gestora_ids >= 0
+    counts = np.bincount(gestora_ids[managed], weights=n_rows[managed], minlength=len(registry.gestoras)).astype(np.int64)
+    present = np.flatnonzero(counts)
+    names = registry.gestoras['gestora_nombre'].astype(object).to_numpy()[present]
+    order = np.lexsort((names, -counts[present]))
+    return pd.Series(counts[present][order], index=pd.Index(names[order], name='gestora_nombre'), name='count')
+
+
+def top_gestoras(registry, entity_ids, n=15):
+    return gestora_counts(registry, entity_ids).head(n)
+
+
+def relationship_counts(registry, entity_ids):
+    # Rows with both companies set, and the distinct gestoras/depositarias among them
+    entities = registry.entities
+    gestora_ids = entities['gestora_id'].to_numpy()[entity_ids]
+    depositaria_ids = entities['depositaria_id'].to_numpy()[entity_ids]
+    linked = (gestora_ids >= 0) & (depositaria_ids >= 0) & entities['entity_name'].notna().to_numpy()[entity_ids]
+    return (
+        int(entities['n_rows'].to_numpy()[entity_ids][linked].sum()),
+        count_distinct(gestora_ids[linked]),
+        count_distinct(depositaria_ids[linked])
+    )
+
+
+def graph_tables(graph, entity_ids):
+    # Nodes and edges of the relationship graph restricted to the given funds
+    weights = graph.weights(entity_ids)
+    return graph.nodes(weights), graph.edges(weights)
+
+
+def concentration(registry, entity_ids):
+    # Top-10 share of rows (in %) and Herfindahl index over gestoras
+    return counts_concentration(gestora_counts(registry, entity_ids))
+
+
+def counts_concentration(counts):
+    # The same from the rows per gestora, largest first
+    managed = counts.sum()
+    market_share = counts.loc[lambda c: c > 0].head(10).sum() / managed * 100
+    herfindahl_index = ((counts / managed) ** 2).sum()
+    return market_share, herfindahl_index
+
+
+# Class-level columns: summarised per entity when the explorer groups by entity
+CLASS_SPECIFIC_COLS = ['denominacion', 'numero', 'isin', 'fecha_alta', 'dfi']
+
+
+def sort_rows(registry, rows, sort_by, ascending=True, hit_ids=None):
+    # Explorer order of `rows`; 'Relevancia' puts the best search match
+    # (earliest in `hit_ids`) first regardless of `ascending`
+    if sort_by == 'Relevancia':
+        rank = np.empty(registry.n_entities, dtype=np.int32)
+        rank[hit_ids] = np.arange(len(hit_ids))
+        return rows[np.argsort(rank[registry.row_entity[rows]], kind='stable')]
+    # Only the sort column is gathered; its index maps back to `rows`
+    order = registry.to_frame(rows, [sort_by]).sort_values(sort_by, ascending=ascending).index.to_numpy()
+    return rows[order]
+
+
+def entity_first_rows(registry, sorted_rows):
+    # One group per entity: its first row in the current sort order
+    first = ~pd.Series(registry.row_entity[sorted_rows]).duplicated().to_numpy()
+    return sorted_rows[first]
+
+
+def group_rows_frame(frame, groupby_cols, agg_cols):
+    # Explorer grouping on columns other than the entity's name or NIF
+    agg_dict = {}
+    for col in agg_cols:
+        if col in ['denominacion', 'numero']:
+            agg_dict[col] = lambda x: f"{len(x)} clases"
+        elif col == 'isin':
+            agg_dict[col] = lambda x: ', '.join([str(i) for i in x.dropna().unique()[:3]]) + ('...' if len(x.dropna().unique()) > 3 else '')
+        else:
+            agg_dict[col] = 'first'
+    # Only aggregate if there are columns to aggregate
+    if agg_dict:
+        return frame.groupby(groupby_cols, dropna=False, as_index=False, observed=True, sort=False).agg(agg_dict)
+    # If no columns to aggregate, just drop duplicates
+    return frame.drop_duplicates().reset_index(drop=True)
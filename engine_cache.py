@@ -0,0 +1,131 @@
+import glob
+import hashlib
+import importlib.util
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# One file per data version, shared by every process on the host
+ENGINE_CACHE_DIR = os.environ.get('DASHBOARD_ENGINE_CACHE', '.engine_cache')
+# Modules whose objects make up an engine; editing any of them invalidates the files
+ENGINE_MODULES = ['engine', 'schema', 'filter_index', 'cube', 'search_index', 'network']
+# Libraries whose pickled objects the files hold; upgrading any of them does too
+ENGINE_LIBRARIES = [np, pd, pa]
+# Older files beyond this many are removed when a new one is written
+MAX_FILES = 4
+
+MAGIC = b'ENGINEv1'
+# Magic, length of the pickle stream, number of out-of-band buffers
+HEADER = struct.Struct('<8sQQ')
+# Buffers start on cache-line boundaries, as numpy allocates them
+ALIGN = 64
+
+_code_version = None
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for library in ENGINE_LIBRARIES:
+            digest.update(f"{library.__name__}=={library.__version__}\n".encode('utf-8'))
+        for name in ENGINE_MODULES:
+            with open(importlib.util.find_spec(name).origin, 'rb') as handle:
+                digest.update(handle.read())
+        _code_version = digest.hexdigest()[:12]
+    return _code_version
+
+
+def write_mapped(obj, path):
+    """Pickle ``obj`` with its array data laid out so ``read_mapped`` can map it back.
+
+    Pickle protocol 5 hands numpy, pandas and Arrow buffers over out of
+    band; they are written after the pickle stream, each on an aligned
+    offset listed in a table after the header.
+    """
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+
+    offsets = np.empty(len(views), dtype='<u8')
+    offset = HEADER.size + 16 * len(views) + len(payload)
+    for i, view in enumerate(views):
+        offset += -offset % ALIGN
+        offsets[i] = offset
+        offset += view.nbytes
+    table = np.column_stack([offsets, [view.nbytes for view in views]]).astype('<u8')
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, len(payload), len(views)))
+        handle.write(table.tobytes())
+        handle.write(payload)
+        for view, start in zip(views, offsets):
+            handle.write(b'\0' * (int(start) - handle.tell()))
+            handle.write(view)
+    os.replace(tmp_path, path)
+
+
+def read_mapped(path):
+    """Unpickle a ``write_mapped`` file with its arrays pointing into a read-only map of it.
+
+    Only the pickle stream (dicts, lists, Python strings) is copied into
+    the process; array data stays in the page cache, shared by every
+    process that maps the same file. The arrays are read-only.
+    """
+    with open(path, 'rb') as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, payload_size, n_buffers = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"{path} no es un fichero de motor")
+    table = np.frombuffer(view, dtype='<u8', count=2 * n_buffers, offset=HEADER.size).reshape(-1, 2)
+    start = HEADER.size + 16 * n_buffers
+    if start + payload_size > len(view) or (n_buffers and int(table.sum(axis=1).max()) > len(view)):
+        raise ValueError(f"{path} está truncado")
+    buffers = [view[offset:offset + size] for offset, size in table.tolist()]
+    return pickle.loads(view[start:start + payload_size], buffers=buffers)
+
+
+def _prune(cache_dir, keep=MAX_FILES):
+    # Processes still mapping a removed file keep their pages until they let go
+    paths = sorted(glob.glob(os.path.join(cache_dir, 'engine-*.bin')), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_engine(version, build, cache_dir=ENGINE_CACHE_DIR):
+    """The engine of data ``version``, mapped from this host's file of it.
+
+    The first process to need a version builds it with ``build()`` and
+    writes the file; every other process, and every later restart, maps the
+    file instead of building. The builder then maps it too, dropping its
+    private copy, so one copy of the array data serves all of them. A file
+    that cannot be read back (truncated, corrupt, or pickled by code it no
+    longer matches) is a miss: the engine is built and the file replaced.
+    """
+    path = os.path.join(cache_dir, f'engine-{version}-{code_version()}.bin')
+    try:
+        return read_mapped(path)
+    except Exception:
+        # Missing, or unreadable in any of the ways unpickling can fail
+        # (ValueError, struct.error, UnpicklingError, AttributeError...)
+        pass
+
+    engine = build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_mapped(engine, path)
+        _prune(cache_dir)
+    except OSError:
+        # Read-only deployments keep the private copy
+        return engine
+    return read_mapped(path)
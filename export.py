@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import openpyxl
+except ImportError:  # XLSX export is optional
+    openpyxl = None
+
+# Label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+}
+
+CHUNK_ROWS = 50_000
+# Under the app's static/ folder so Streamlit streams the files from disk
+# (server.enableStaticServing in .streamlit/config.toml); they are never
+# read into the app's memory
+EXPORT_DIR = os.environ.get(
+    'EXPORT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'exports')
+)
+EXPORT_URL = 'app/static/exports'
+# Exports are written here and moved into EXPORT_DIR once complete, so the
+# static server never exposes a half-written file; on the same filesystem
+EXPORT_TMP_DIR = os.environ.get(
+    'EXPORT_TMP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.export_tmp')
+)
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_MB', 512)) * 1024 * 1024
+# Streamlit's static file server refuses larger files (MAX_APP_STATIC_FILE_SIZE)
+EXPORT_MAX_BYTES = 200 * 1024 * 1024
+# Exports used this recently are never pruned: a session may not have downloaded its link yet
+EXPORT_MIN_AGE_SECONDS = int(os.environ.get('EXPORT_MIN_AGE_SECONDS', 900))
+
+
+def available_formats():
+    return [label for label in EXPORT_FORMATS if label != 'Excel' or openpyxl is not None]
+
+
+def _chunks(frame):
+    # At least one chunk, so an empty export still has its header
+    for start in range(0, max(len(frame), 1), CHUNK_ROWS):
+        yield frame.iloc[start:start + CHUNK_ROWS]
+
+
+def row_chunks(registry, rows, columns):
+    """Frames of ``columns`` for ``rows`` of ``registry``, ``CHUNK_ROWS`` rows at a time.
+
+    Only one chunk exists at a time, so writing an export takes memory for
+    a chunk rather than for the whole export.
+    """
+    for start in range(0, max(len(rows), 1), CHUNK_ROWS):
+        yield registry.to_frame(rows[start:start + CHUNK_ROWS], columns)
+
+
+def _write_csv(chunks, handle):
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(handle, index=False, header=i == 0)
+
+
+def _write_parquet(chunks, path):
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_xlsx(chunks, path):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('entidades')
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            sheet.append(list(chunk.columns))
+        # Missing values become empty cells, timestamps native Excel dates
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append([v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in row])
+    workbook.save(path)
+
+
+def write_chunks(chunks, path, label):
+    # ``chunks``: the export's frames in order, all with the same columns
+    ext = EXPORT_FORMATS[label][0]
+    if ext == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as handle:
+            _write_csv(chunks, handle)
+    elif ext == 'csv.gz':
+        with gzip.open(path, 'wt', newline='', encoding='utf-8') as handle:
+            _write_csv(chunks, handle)
+    elif ext == 'parquet':
+        _write_parquet(chunks, path)
+    elif ext == 'xlsx':
+        if openpyxl is None:
+            raise RuntimeError('La exportación a Excel requiere openpyxl')
+        _write_xlsx(chunks, path)
+    else:
+        raise ValueError(f'Formato de exportación desconocido: {label}')
+
+
+def write_export(frame, path, label):
+    write_chunks(_chunks(frame), path, label)
+
+
+def export_key(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _prune(directory, max_bytes, keep=()):
+    # Drop the least recently used exports once the cache exceeds its budget,
+    # except those in ``keep`` and those used in the last EXPORT_MIN_AGE_SECONDS
+    now = time.time()
+    files = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Pruned by a concurrent request
+            continue
+        files.append((stat.st_atime, stat.st_size, path))
+    files.sort(reverse=True)
+    total = 0
+    for atime, size, path in files:
+        total += size
+        if total > max_bytes and path not in keep and now - atime >= EXPORT_MIN_AGE_SECONDS:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def export_file(build_chunks, key_parts, label, directory=EXPORT_DIR, write=None, tmp_dir=None):
+    """Path of the export for ``key_parts`` in format ``label``, built on first request.
+
+    ``build_chunks()``, only called on a cache miss, returns the export's
+    frames in order (``row_chunks``). The file is written chunk by chunk
+    to a temporary path in ``tmp_dir`` (``EXPORT_TMP_DIR`` by default) and
+    moved into place, so neither concurrent requests nor the static server
+    ever see a partial export.
+    ``write(path, label)``, when given, writes the file instead, for
+    exports that never exist as frames (``SqlEngine.export``). The path
+    returned is never pruned by the request that returns it.
+    """
+    tmp_dir = EXPORT_TMP_DIR if tmp_dir is None else tmp_dir
+    os.makedirs(directory, exist_ok=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    ext = EXPORT_FORMATS[label][0]
+    path = os.path.join(directory, f"{export_key(*key_parts, label)}.{ext}")
+    try:
+        # Marks it used, so concurrent prunes leave it alone
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=f'.{ext}')
+    os.close(fd)
+    try:
+        if write is None:
+            write_chunks(build_chunks(), tmp_path, label)
+        else:
+            write(tmp_path, label)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _prune(directory, EXPORT_CACHE_MAX_BYTES, keep=[path])
+    return path
+
+
+def export_url(path):
+    # Where Streamlit's static file server streams an export in EXPORT_DIR from
+    return f"{EXPORT_URL}/{os.path.basename(path)}"
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+
+def _positions_by_value(values):
+    # Sorted entity positions for every distinct value (missing values are skipped)
+    codes, uniques = pd.factorize(values, sort=False)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {
+        uniques[i]: order[bounds[i]:bounds[i + 1]].astype(np.int32)
+        for i in range(len(uniques))
+    }
+
+
+def _company_ids(ids):
+    # -1 (no company) becomes a missing value so it gets no index entry
+    return ids.where(ids >= 0).astype('Int32')
+
+
+class FilterIndex:
+    """Precomputed lookups for the sidebar filters over the entity table.
+
+    Categorical filters map each value to the sorted positions of the
+    entities holding it. ``fecha_registro`` is kept as a sorted permutation,
+    so a date range is two binary searches. Combining filters intersects
+    position arrays instead of masking the whole table.
+    """
+
+    def __init__(self, entities):
+        self.n_entities = len(entities)
+        self.by_type = _positions_by_value(entities['entity_type'])
+        self.by_gestora = _positions_by_value(_company_ids(entities['gestora_id']))
+        self.by_depositaria = _positions_by_value(_company_ids(entities['depositaria_id']))
+
+        dates = entities['fecha_registro'].to_numpy()
+        dated = np.flatnonzero(~pd.isna(dates))
+        order = dated[np.argsort(dates[dated], kind='stable')]
+        self.date_order = order.astype(np.int32)
+        self.sorted_dates = dates[order]
+
+    def date_range(self, start, end):
+        lo = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(end)), side='right')
+        return np.sort(self.date_order[lo:hi])
+
+    def select(self, entity_type=None, gestora_id=None, depositaria_id=None, date_range=None):
+        empty = np.array([], dtype=np.int32)
+        candidates = []
+        if entity_type is not None:
+            candidates.append(self.by_type.get(entity_type, empty))
+        if gestora_id is not None:
+            candidates.append(self.by_gestora.get(gestora_id, empty))
+        if depositaria_id is not None:
+            candidates.append(self.by_depositaria.get(depositaria_id, empty))
+        if date_range is not None:
+            candidates.append(self.date_range(*date_range))
+
+        if not candidates:
+            return np.arange(self.n_entities, dtype=np.int32)
+
+        # Intersect starting from the most selective set
+        candidates.sort(key=len)
+        result = candidates[0]
+        for positions in candidates[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+
+def _company_names(names, ids):
+    return pd.Series(pd.api.extensions.take(names.astype(object).to_numpy(), ids.to_numpy(), allow_fill=True))
+
+
+def _option_list(first, values):
+    return [first] + sorted(values.dropna().unique().tolist())
+
+
+def _cascade(frame, keys, value):
+    # Sorted distinct ``value``s under every combination of ``keys``, from one
+    # sort: each combination's options are the slice between two searchsorted
+    # bounds of its code
+    pairs = frame[keys + [value]].dropna().drop_duplicates().sort_values(keys + [value], ignore_index=True)
+    codes, uniques = pd.MultiIndex.from_frame(pairs[keys]).factorize()
+    bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+    values = pairs[value].tolist()
+    return {
+        key if len(keys) > 1 else key[0]: ['Todas'] + values[bounds[i]:bounds[i + 1]]
+        for i, key in enumerate(uniques)
+    }
+
+
+class FilterOptions:
+    """Sidebar option lists and date bounds, precomputed per entity type.
+
+    Depositaria options cascade on the selected gestora as well.
+    """
+
+    def __init__(self, registry):
+        entities = registry.entities
+        self._build(pd.DataFrame({
+            'entity_type': entities['entity_type'].astype(object),
+            'gestora': _company_names(registry.gestoras['gestora_nombre'], entities['gestora_id']),
+            'depositaria': _company_names(registry.depositarias['depositaria_nombre'], entities['depositaria_id']),
+            'fecha_registro': entities['fecha_registro']
+        }))
+
+    @classmethod
+    def from_frame(cls, frame):
+        # Options from any frame with entity_type, gestora, depositaria and
+        # fecha_registro columns, e.g. aggregated by a SQL backend
+        options = cls.__new__(cls)
+        options._build(frame)
+        return options
+
+    def _build(self, frame):
+        self.entity_types = _option_list('Todos', frame['entity_type'])
+        # Every distinct (type, gestora, depositaria), once per type and once under 'Todos'
+        triples = frame[['entity_type', 'gestora', 'depositaria']].drop_duplicates()
+        triples = pd.concat([triples.assign(entity_type='Todos'), triples.dropna(subset='entity_type')], ignore_index=True)
+
+        self._gestoras = _cascade(triples, ['entity_type'], 'gestora')
+        self._depositarias = {
+            (entity_type, 'Todas'): options
+            for entity_type, options in _cascade(triples, ['entity_type'], 'depositaria').items()
+        }
+        self._depositarias.update(_cascade(triples, ['entity_type', 'gestora'], 'depositaria'))
+
+        bounds = frame.groupby('entity_type', sort=False)['fecha_registro'].agg(['min', 'max'])
+        self._date_bounds = {'Todos': (frame['fecha_registro'].min(), frame['fecha_registro'].max())}
+        self._date_bounds.update(zip(bounds.index, zip(bounds['min'], bounds['max'])))
+
+    def gestoras(self, entity_type):
+        return self._gestoras.get(entity_type, ['Todas'])
+
+    def depositarias(self, entity_type, gestora):
+        return self._depositarias.get((entity_type, gestora), ['Todas'])
+
+    def date_bounds(self, entity_type):
+        bounds = self._date_bounds.get(entity_type)
+        if bounds is None or pd.isna(bounds[0]):
+            return self._date_bounds['Todos']
+        return bounds
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from data_store import load_registry
+from harvester import CNMV_URL, Harvester
+from schema import build_registry
+
+# Under the app's static/ folder so Streamlit serves the cached copies
+# (server.enableStaticServing in .streamlit/config.toml)
+FOLLETO_DIR = os.environ.get(
+    'FOLLETO_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'folletos')
+)
+FOLLETO_CACHE_MAX_BYTES = int(os.environ.get('FOLLETO_CACHE_MAX_MB', 2048)) * 1024 * 1024
+# Downloads recorded in the manifest at a time, so an interrupted run keeps them
+FOLLETO_BATCH = 50
+STATIC_URL = 'app/static/folletos'
+
+
+def funds_with_folleto(entities):
+    # One row per fund with a prospectus; the date is what triggers a re-download
+    funds = entities.loc[entities['folleto_url'].notna(), ['entity_value', 'folleto_url', 'fecha_ultimo_folleto']]
+    return pd.DataFrame({
+        'entity_value': funds['entity_value'].astype(str).to_numpy(),
+        'folleto_url': funds['folleto_url'].astype(str).to_numpy(),
+        'fecha_ultimo_folleto': funds['fecha_ultimo_folleto'].dt.strftime('%Y-%m-%d').fillna('').to_numpy()
+    })
+
+
+class FolletoCache:
+    """Content-addressed on-disk store of prospectus PDFs.
+
+    Files live under ``objects/`` named by their SHA-256, so funds sharing a
+    document share one copy. ``manifest.json`` maps each fund to its digest
+    and the ``fecha_ultimo_folleto`` it was fetched for; a fund is fetched
+    again only when that date changes or its file was evicted. Files are
+    evicted least recently fetched first once the store exceeds ``max_bytes``.
+    """
+
+    def __init__(self, directory=FOLLETO_DIR, max_bytes=FOLLETO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._lock = threading.Lock()
+        self._manifest = {}
+        self._manifest_mtime = None
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], f'{digest}.pdf')
+
+    def manifest(self):
+        # Re-read only when another process (the bulk fetcher) rewrote it,
+        # or deleted it, in which case nothing is cached any more
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.manifest_path)
+                if mtime != self._manifest_mtime:
+                    with open(self.manifest_path, encoding='utf-8') as handle:
+                        self._manifest = json.load(handle)
+            except FileNotFoundError:
+                mtime = None
+                self._manifest = {}
+            self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        with self._lock:
+            # What was just written need not be read back
+            self._manifest = manifest
+            self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    def pending(self, funds):
+        manifest = self.manifest()
+        stale = [
+            entity_value not in manifest
+            or manifest[entity_value]['fecha_ultimo_folleto'] != fecha
+            or not os.path.exists(self.object_path(manifest[entity_value]['sha256']))
+            for entity_value, fecha in zip(funds['entity_value'], funds['fecha_ultimo_folleto'])
+        ]
+        return funds[np.array(stale, dtype=bool)]
+
+    def store(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A name of its own, as another run may be storing the same document
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(content)
+            os.replace(tmp_path, path)
+        return digest
+
+    def update(self, fetched):
+        # fetched: {entity_value: record}; records of evicted files are dropped
+        manifest = dict(self.manifest())
+        manifest.update(fetched)
+        evicted = self.evict(manifest)
+        manifest = {k: v for k, v in manifest.items() if v['sha256'] not in evicted}
+        self._save(manifest)
+        return evicted
+
+    def evict(self, manifest):
+        files = {}
+        for record in manifest.values():
+            digest = record['sha256']
+            files[digest] = max(files.get(digest, 0), record['fetched_at'])
+        total = 0
+        evicted = set()
+        for digest in sorted(files, key=files.get, reverse=True):
+            path = self.object_path(digest)
+            if not os.path.exists(path):
+                continue
+            total += os.path.getsize(path)
+            if total > self.max_bytes:
+                os.remove(path)
+                evicted.add(digest)
+        return evicted
+
+    def local_urls(self, entity_values):
+        # Static-serving URL of each fund's cached copy, None when not cached
+        manifest = self.manifest()
+        return [
+            f"{STATIC_URL}/objects/{manifest[v]['sha256'][:2]}/{manifest[v]['sha256']}.pdf" if v in manifest else None
+            for v in entity_values
+        ]
+
+
+async def fetch_folletos(cache, funds, base_url=CNMV_URL, concurrency=8, rate=4.0, retries=4, batch=FOLLETO_BATCH):
+    """Download the prospectuses of ``funds`` not already cached for their date.
+
+    Requests share the harvester's pooled session, per-host rate limit and
+    retry policy. Every ``batch`` downloads are recorded in the manifest as
+    they complete, so an interrupted run loses at most one batch. Returns
+    ``(fetched, failed)`` counts.
+    """
+    harvester = Harvester(base_url, concurrency, rate, retries)
+    todo = cache.pending(funds)
+    fetched = {}
+    n_fetched = failed = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=harvester.timeout) as session:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(entity_value, url, fecha):
+            nonlocal fetched, n_fetched, failed
+            async with semaphore:
+                try:
+                    content = await harvester.fetch(session, url, binary=True)
+                except (RuntimeError, aiohttp.ClientError):
+                    failed += 1
+                    return
+            if not content.startswith(b'%PDF'):
+                # Error or consent pages are not cached as prospectuses
+                failed += 1
+                return
+            fetched[entity_value] = {
+                'sha256': cache.store(content),
+                'folleto_url': url,
+                'fecha_ultimo_folleto': fecha,
+                'size': len(content),
+                'fetched_at': time.time()
+            }
+            n_fetched += 1
+            if len(fetched) >= batch:
+                # No await in between, so no other download sees a half-recorded batch
+                cache.update(fetched)
+                fetched = {}
+
+        await asyncio.gather(*(
+            fetch_one(*fund) for fund in todo[['entity_value', 'folleto_url', 'fecha_ultimo_folleto']].itertuples(index=False)
+        ))
+    if fetched:
+        cache.update(fetched)
+    return n_fetched, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Descarga los folletos de los fondos a la caché local')
+    parser.add_argument('--base-url', default=CNMV_URL, help='Servidor a consultar (p. ej. uno local de pruebas)')
+    parser.add_argument('--dir', default=FOLLETO_DIR)
+    parser.add_argument('--max-mb', type=int, default=FOLLETO_CACHE_MAX_BYTES // (1024 * 1024))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=4.0, help='Peticiones por segundo y host')
+    args = parser.parse_args()
+
+    cache = FolletoCache(args.dir, args.max_mb * 1024 * 1024)
+    funds = funds_with_folleto(build_registry(load_registry()).entities)
+    start = time.perf_counter()
+    fetched, failed = asyncio.run(fetch_folletos(cache, funds, args.base_url, args.concurrency, args.rate))
+    print(
+        f"{len(funds):,} fondos con folleto: {fetched:,} descargados, {failed:,} fallidos, "
+        f"{len(funds) - fetched - failed:,} ya en caché ({time.perf_counter() - start:.1f} s)"
+    )
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urljoin, urlsplit, urlunsplit
+
+import aiohttp
+import pandas as pd
+
+from data_store import CSV_PATH
+from schema import CLASS_COLS, DEPOSITARIA_COLS, ENTITY_COLS, GESTORA_COLS
+from search_index import normalize
+
+CNMV_URL = 'https://www.cnmv.es'
+COLUMNS = ENTITY_COLS + GESTORA_COLS + DEPOSITARIA_COLS + CLASS_COLS
+
+# Registry listing page of each entity type, relative to CNMV_URL
+LIST_PAGES = {
+    'Fondos de capital-riesgo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=1',
+    'Fondos de capital-riesgo pyme': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=6',
+    'Fondos de capital-riesgo europeo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=4',
+    'Fondos de emprendimiento social europeo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=5',
+    'Fondos de inversión colectiva de tipo cerrado': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=8',
+    'Fondo de inversión a largo plazo europeo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=10',
+    'Sociedades de capital-riesgo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=0',
+    'Sociedad de capital-riesgo pyme': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=7',
+    'Sociedades de inversión colectiva de tipo cerrado': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=9',
+    'Gestora de entidades de inversión de tipo cerrado': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=3'
+}
+
+# Normalized label prefixes of the "Label: value" pairs on detail pages ("Nº"
+# normalizes to "no")
+REGISTRO_LABELS = ['no registro oficial', 'n registro oficial', 'numero de registro oficial', 'registro oficial']
+ENTITY_LABELS = {
+    'entity_value': ['nif'],
+    'registro_oficial': REGISTRO_LABELS,
+    'fecha_registro': ['fecha registro oficial', 'fecha de registro oficial', 'fecha de inscripcion'],
+    'fecha_ultimo_folleto': ['fecha ultimo folleto', 'fecha del ultimo folleto']
+}
+COMPANY_LABELS = {
+    'registro': REGISTRO_LABELS,
+    'domicilio': ['domicilio']
+}
+CLASS_HEADERS = {
+    'numero': ['no', 'n', 'numero'],
+    'denominacion': ['denominacion', 'clase'],
+    'fecha_alta': ['fecha alta', 'fecha de alta'],
+    'dfi': ['dfi'],
+    'isin': ['isin']
+}
+GESTORA_LINKS = ['gestora.aspx', 'sgiic.aspx', 'sg-fia']
+DEPOSITARIA_LINKS = ['depositaria.aspx']
+FOLLETO_LINKS = ['verdocumento']
+DETAIL_PARAM = 'nif'
+NEXT_PAGE = 'siguiente'
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PageParser(HTMLParser):
+    """Flattens a page into its text tokens, links and tables.
+
+    CNMV detail pages lay out fields as a label ending in ':' followed by the
+    value, so consecutive text tokens are enough to recover them.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self.links = []
+        self.tables = []
+        self._href = None
+        self._link_text = []
+        self._rows = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._href = dict(attrs).get('href')
+            self._link_text = []
+        elif tag == 'table':
+            self._rows = []
+        elif tag == 'tr' and self._rows is not None:
+            self._rows.append([])
+        elif tag in ('td', 'th') and self._rows is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._href is not None:
+            self.links.append((self._href, ' '.join(self._link_text)))
+            self._href = None
+        elif tag in ('td', 'th') and self._cell is not None:
+            if self._rows:
+                self._rows[-1].append(' '.join(self._cell))
+            self._cell = None
+        elif tag == 'table' and self._rows is not None:
+            self.tables.append([row for row in self._rows if row])
+            self._rows = None
+
+    def handle_data(self, data):
+        text = ' '.join(data.split())
+        if not text:
+            return
+        self.tokens.append(text)
+        if self._href is not None:
+            self._link_text.append(text)
+        if self._cell is not None:
+            self._cell.append(text)
+
+
+def parse_page(html):
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def _labelled_values(page, labels):
+    # Value of the first token following each matching "Label:" token
+    values = {}
+    for label, value in zip(page.tokens, page.tokens[1:]):
+        if not label.endswith(':'):
+            continue
+        key = normalize(label)
+        for field, prefixes in labels.items():
+            if field not in values and any(key.startswith(p) for p in prefixes):
+                values[field] = value
+    return values
+
+
+def _find_link(page, patterns):
+    for href, text in page.links:
+        if href and any(p in href.lower() for p in patterns):
+            return href, text
+    return None, None
+
+
+def _canonical(url, base_url):
+    # Links are stored against cnmv.es whatever host the pages came from
+    if url is None:
+        return None
+    absolute = urlsplit(urljoin(base_url + '/', url))
+    cnmv = urlsplit(CNMV_URL)
+    return urlunsplit((cnmv.scheme, cnmv.netloc, absolute.path, absolute.query, ''))
+
+
+def _rebase(url, base_url):
+    base = urlsplit(base_url)
+    parts = urlsplit(urljoin(base_url + '/', url))
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, ''))
+
+
+def parse_entity_list(html):
+    # (name, detail link) of every entity, plus the next listing page if any
+    page = parse_page(html)
+    entities = []
+    next_page = None
+    for href, text in page.links:
+        if not href:
+            continue
+        if DETAIL_PARAM in parse_qs(urlsplit(href).query):
+            entities.append((text, href))
+        elif normalize(text) == NEXT_PAGE:
+            next_page = href
+    return entities, next_page
+
+
+def parse_classes(page):
+    for table in page.tables:
+        headers = [normalize(cell) for cell in table[0]]
+        if 'isin' not in headers:
+            continue
+        columns = {}
+        for field, names in CLASS_HEADERS.items():
+            for i, header in enumerate(headers):
+                if header in names and field not in columns:
+                    columns[field] = i
+        return [
+            {field: (row[i] if i < len(row) and row[i] else None) for field, i in columns.items()}
+            for row in table[1:]
+        ]
+    return []
+
+
+def parse_entity(html, base_url):
+    page = parse_page(html)
+    fields = _labelled_values(page, ENTITY_LABELS)
+    folleto, _ = _find_link(page, FOLLETO_LINKS)
+    gestora, gestora_name = _find_link(page, GESTORA_LINKS)
+    depositaria, depositaria_name = _find_link(page, DEPOSITARIA_LINKS)
+    return {
+        'fields': fields,
+        'folleto_url': _canonical(folleto, base_url),
+        'gestora': (gestora, gestora_name) if gestora else None,
+        'depositaria': (depositaria, depositaria_name) if depositaria else None,
+        'classes': parse_classes(page)
+    }
+
+
+def parse_company(html):
+    return _labelled_values(parse_page(html), COMPANY_LABELS)
+
+
+class RateLimiter:
+    """Spaces out requests to each host to at most ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host):
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+class Harvester:
+    """Concurrent crawler of the CNMV registry that emits the registry CSV schema.
+
+    Listing pages give each entity's detail page; gestora and depositaria
+    pages are fetched once each and shared. Finished entities are appended to
+    a JSONL checkpoint, so an interrupted run resumes where it stopped.
+    ``base_url`` points the crawler at another host (e.g. a local server with
+    recorded pages); emitted links always refer to cnmv.es.
+    """
+
+    def __init__(self, base_url=CNMV_URL, concurrency=16, rate=8.0, retries=4, timeout=30, checkpoint=None):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.checkpoint = checkpoint
+        self.stats = {'requests': 0, 'retries': 0, 'failed': 0}
+        self._companies = {}
+
+    async def fetch(self, session, url, binary=False):
+        url = _rebase(url, self.base_url)
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait(host)
+            self.stats['requests'] += 1
+            try:
+                async with session.get(url) as response:
+                    if response.status not in RETRY_STATUS:
+                        response.raise_for_status()
+                        return await (response.read() if binary else response.text())
+                    retry_after = response.headers.get('Retry-After')
+            except aiohttp.ClientResponseError:
+                # A status that retrying will not change (404...)
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Connection dropped, truncated body, server disconnected...
+                retry_after = None
+            if attempt == self.retries:
+                break
+            self.stats['retries'] += 1
+            # Exponential backoff with jitter, unless the server says how long
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt * 0.5
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        raise RuntimeError(f"Sin respuesta tras {self.retries + 1} intentos: {url}")
+
+    async def list_entities(self, session, entity_type, path):
+        entities = []
+        url = path
+        while url:
+            page, next_page = parse_entity_list(await self.fetch(session, url))
+            entities.extend((entity_type, name, href) for name, href in page)
+            url = next_page
+        return entities
+
+    async def company(self, session, link):
+        # Shared task per company page, so concurrent entities fetch it once
+        href, name = link
+        task = self._companies.get(href)
+        if task is None:
+            task = self._companies[href] = asyncio.ensure_future(self.fetch(session, href))
+        try:
+            html = await task
+        except (RuntimeError, aiohttp.ClientError):
+            # Not cached: the next entity of this company fetches the page afresh
+            if self._companies.get(href) is task:
+                del self._companies[href]
+            raise
+        fields = parse_company(html)
+        return {
+            'nombre': name or None,
+            'registro': fields.get('registro'),
+            'domicilio': fields.get('domicilio'),
+            'url': _canonical(href, self.base_url)
+        }
+
+    async def entity_rows(self, session, entity_type, name, href):
+        detail = parse_entity(await self.fetch(session, href), self.base_url)
+        fields = detail['fields']
+        entity = {
+            'entity_type': entity_type,
+            'entity_name': name,
+            'entity_value': fields.get('entity_value') or parse_qs(urlsplit(href).query)[DETAIL_PARAM][0],
+            'registro_oficial': fields.get('registro_oficial'),
+            'fecha_registro': fields.get('fecha_registro'),
+            'fecha_ultimo_folleto': fields.get('fecha_ultimo_folleto'),
+            'folleto_url': detail['folleto_url']
+        }
+        for prefix in ('gestora', 'depositaria'):
+            if detail[prefix]:
+                company = await self.company(session, detail[prefix])
+                for key, value in company.items():
+                    entity[f'{prefix}_{key}'] = value
+        # One row per share class, or a single row when the entity has none
+        return [{**entity, **cls} for cls in detail['classes']] or [entity]
+
+    def _load_checkpoint(self):
+        done = {}
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as handle:
+                for line in handle:
+                    if line.strip():
+                        record = json.loads(line)
+                        done[record['url']] = record['rows']
+        return done
+
+    async def run(self, list_pages=LIST_PAGES):
+        done = self._load_checkpoint()
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            listings = await asyncio.gather(*(
+                self.list_entities(session, entity_type, path) for entity_type, path in list_pages.items()
+            ))
+            entities = [entity for listing in listings for entity in listing]
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            checkpoint = open(self.checkpoint, 'a', encoding='utf-8') if self.checkpoint else None
+
+            async def harvest(entity_type, name, href):
+                if href in done:
+                    return done[href]
+                async with semaphore:
+                    try:
+                        rows = await self.entity_rows(session, entity_type, name, href)
+                    except (RuntimeError, aiohttp.ClientError):
+                        # One failed entity, whatever went wrong with its pages
+                        self.stats['failed'] += 1
+                        return []
+                if checkpoint:
+                    checkpoint.write(json.dumps({'url': href, 'rows': rows}, ensure_ascii=False) + '\n')
+                    checkpoint.flush()
+                return rows
+
+            try:
+                results = await asyncio.gather(*(harvest(*entity) for entity in entities))
+            finally:
+                if checkpoint:
+                    checkpoint.close()
+
+        # Listing order is kept whatever order the pages completed in
+        rows = [row for entity_rows in results for row in entity_rows]
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Descarga el registro de entidades de capital riesgo de la CNMV')
+    parser.add_argument('--out', default=CSV_PATH)
+    parser.add_argument('--base-url', default=CNMV_URL, help='Servidor a consultar (p. ej. uno local con páginas grabadas)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=8.0, help='Peticiones por segundo y host')
+    parser.add_argument('--retries', type=int, default=4)
+    parser.add_argument('--checkpoint', default='harvest_checkpoint.jsonl', help='Fichero para reanudar una descarga interrumpida')
+    args = parser.parse_args()
+
+    harvester = Harvester(args.base_url, args.concurrency, args.rate, args.retries, checkpoint=args.checkpoint)
+    start = time.perf_counter()
+    df = asyncio.run(harvester.run())
+    stats = harvester.stats
+    summary = (
+        f"{time.perf_counter() - start:.1f} s ({stats['requests']:,} peticiones, {stats['retries']:,} reintentos, "
+        f"{stats['failed']:,} entidades fallidas)"
+    )
+    if stats['failed']:
+        # A partial extract would replace the registry and drop the failed
+        # entities from the dashboard; the checkpoint keeps what was fetched
+        raise SystemExit(f"Descarga incompleta en {summary}; {args.out} no se ha modificado. Vuelve a ejecutar para reanudar.")
+    tmp_path = f'{args.out}.{os.getpid()}.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, args.out)
+    print(f"{len(df):,} filas escritas en {args.out} en {summary}")
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
@@ -1,10 +1,31 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
+from datetime import date, datetime
+import functools
+import os
+import uuid
 import numpy as np
 
+from charts import (
+    CONCENTRATION_METRICS, concentration_figure, connected_figure, heatmap_figure, network_figure, overlap_figure, pie_figure, timeline_figure, top_gestoras_figure
+)
+from company_stats import company_stats
+from concentration import TOTAL_TYPE, concentration_over_time
+from cube import counts_by_type, timeline_counts, totals, year_type_counts
+from data_store import data_version
+from engine import (
+    CLASS_SPECIFIC_COLS, Engine, concentration, counts_concentration, entity_first_rows, group_rows_frame,
+    relationship_counts, sort_rows, top_gestoras
+)
+from engine_cache import load_engine
+from export import EXPORT_FORMATS, EXPORT_MAX_BYTES, available_formats, export_file, export_url, row_chunks
+from folletos import FolletoCache
+from network import component_sizes, radial_layout, top_connected
+from profiling import PROFILE_ALL, RerunProfiler, rollup, section_frame
+from result_cache import ResultCache, filter_key
+from sql_backend import PARQUET_DIR, SqlEngine, parquet_version
+from versions import VersionStore, diff_summary, registry_diff
+
 # Page config with dark theme
 st.set_page_config(
     page_title="Dashboard de Entidades de Capital Riesgo Españolas",
@@ -157,23 +178,41 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Backend: the registry in memory (default), or queried in place from the
+# Parquet dataset of sql_backend.py with DuckDB (DASHBOARD_BACKEND=sql), for
+# registries too large for memory. The SQL backend has no typo-tolerant
+# search ranking and no as-of versions
+SQL_BACKEND = os.environ.get('DASHBOARD_BACKEND', 'memory') == 'sql'
+
 # Load data
-@st.cache_data
-def load_data():
-    df = pd.read_csv('all_entities_detailed.csv')
-    
-    # Exclude entity types with many None values
-    exclude_types = [
-        'Gestora de entidades de inversión de tipo cerrado',
-        'Fondo de inversión a largo plazo europeo'
-    ]
-    df = df[~df['entity_type'].isin(exclude_types)]
-    
-    # Convert date columns
-    date_cols = ['fecha_registro', 'fecha_ultimo_folleto']
-    for col in date_cols:
-        df[col] = pd.to_datetime(df[col], format='%d/%m/%Y', errors='coerce')
-    return df
+@st.cache_resource(max_entries=2)
+def load_data(version, stored=False):
+    # Typed Arrow snapshot, rebuilt from the CSV only when the CSV changes,
+    # split into entity/class/gestora/depositaria tables plus the filter
+    # index, the sidebar option lists, the count cube and the search index.
+    # Keyed by the data's content hash, so a refresh replaces it on the next rerun.
+    # Past versions (stored=True) are rebuilt from the version store; one of
+    # them is kept next to the current data.
+    # One read-only engine per process, shared by every session, with its
+    # arrays mapped from the host's engine file (see engine_cache.py), so
+    # every worker process shares them too. Must not be mutated
+    if stored:
+        return load_engine(version, lambda: Engine.load_version(get_version_store(), version))
+    return load_engine(version, Engine.load)
+
+@st.cache_resource(max_entries=2)
+def load_sql_engine(version):
+    # Keyed by the dataset's files, so a rebuild is picked up on the next rerun
+    return SqlEngine(PARQUET_DIR)
+
+@st.cache_resource
+def get_version_store():
+    return VersionStore()
+
+@st.cache_data(max_entries=8)
+def load_diff(start_version, end_version):
+    store = get_version_store()
+    return registry_diff(store.frame(start_version), store.frame(end_version))
 
 # Entity type descriptions
 ENTITY_DESCRIPTIONS = {
@@ -187,8 +226,65 @@ ENTITY_DESCRIPTIONS = {
     'Sociedades de inversión colectiva de tipo cerrado': 'Sociedades de inversión con capital fijo y sin derecho de reembolso hasta el vencimiento.'
 }
 
+@st.cache_resource(max_entries=2)
+def get_result_cache(version):
+    return ResultCache(
+        max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256)),
+        max_bytes=int(os.environ.get('RESULT_CACHE_MAX_MB', 256)) * 1024 * 1024
+    )
+
+@st.cache_resource
+def get_folleto_cache():
+    return FolletoCache()
+
+# Section timings: shown in a sidebar panel with ?debug=1, and logged for
+# every session with DASHBOARD_PROFILE=1 (see profiling.py)
+show_profile = st.query_params.get('debug') == '1'
+if 'profile_session' not in st.session_state:
+    st.session_state['profile_session'] = uuid.uuid4().hex[:12]
+profiler = RerunProfiler(show_profile or PROFILE_ALL, st.session_state['profile_session'])
+
+def profiled(name):
+    # Times a whole tab, including when its fragment reruns on its own
+    def decorate(render):
+        @functools.wraps(render)
+        def wrapper(*args, **kwargs):
+            with profiler.section(name):
+                return render(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Stored extracts (see versions.py): the dashboard can be rebuilt as of any of them
+stored_versions = get_version_store().versions
+as_of_entry = None
+if len(stored_versions) > 1 and not SQL_BACKEND:
+    with st.sidebar:
+        st.markdown('<h3 style="color: #f59e0b;">🕓 Versión de los Datos</h3>', unsafe_allow_html=True)
+        as_of = st.date_input(
+            "Datos a fecha",
+            value=None,
+            min_value=date.fromisoformat(stored_versions[0]['as_of']),
+            max_value=date.today(),
+            format="DD/MM/YYYY",
+            help="Reconstruye el registro tal como estaba en esa fecha; vacío muestra los datos actuales"
+        )
+    if as_of is not None and as_of.isoformat() < stored_versions[-1]['as_of']:
+        as_of_entry = get_version_store().version_at(as_of)
+
 # Load the data
-df = load_data()
+with profiler.section('load'):
+    if SQL_BACKEND:
+        version = parquet_version(PARQUET_DIR)
+        engine = load_sql_engine(version)
+    elif as_of_entry is None:
+        version = data_version()
+        engine = load_data(version)
+    else:
+        version = as_of_entry['version']
+        engine = load_data(version, stored=True)
+filter_options = engine.filter_options
+if not SQL_BACKEND:
+    registry, search_index = engine.registry, engine.search_index
 
 # Title with gradient
 st.markdown('<h1>Dashboard de Entidades de Capital Riesgo Españolas</h1>', unsafe_allow_html=True)
@@ -220,13 +316,14 @@ with st.expander("ℹ️ **Acerca de este Dashboard**"):
 
 # Sidebar filters
 with st.sidebar:
+    if as_of_entry is not None:
+        st.info(f"Mostrando el extracto del {date.fromisoformat(as_of_entry['as_of']).strftime('%d/%m/%Y')}")
     st.markdown('<h3 style="color: #06b6d4;">🔍 Filtros</h3>', unsafe_allow_html=True)
     
     # Entity type filter
-    entity_types = ['Todos'] + sorted(df['entity_type'].unique().tolist())
     selected_entity = st.selectbox(
         "Tipo de Entidad",
-        entity_types,
+        filter_options.entity_types,
         help="Filtrar por tipo de entidad de capital riesgo o inversión colectiva"
     )
     
@@ -235,30 +332,22 @@ with st.sidebar:
         st.info(f"**{selected_entity}**: {ENTITY_DESCRIPTIONS[selected_entity]}")
     
     # Management company filter
-    if selected_entity != 'Todos':
-        filtered_df = df[df['entity_type'] == selected_entity]
-    else:
-        filtered_df = df.copy()
-    
-    gestoras = ['Todas'] + sorted([g for g in filtered_df['gestora_nombre'].dropna().unique()])
     selected_gestora = st.selectbox(
         "Sociedad Gestora",
-        gestoras,
+        filter_options.gestoras(selected_entity),
         help="Filtrar por sociedad gestora"
     )
     
-    # Depository filter
-    depositarias = ['Todas'] + sorted([d for d in filtered_df['depositaria_nombre'].dropna().unique()])
+    # Depository filter (cascades on the selected gestora)
     selected_depositaria = st.selectbox(
         "Entidad Depositaria",
-        depositarias,
+        filter_options.depositarias(selected_entity, selected_gestora),
         help="Filtrar por entidad depositaria"
     )
     
     # Date range filter
     st.markdown('<h4 style="color: #10b981; margin-top: 1rem;">📅 Rango de Fechas</h4>', unsafe_allow_html=True)
-    min_date = df['fecha_registro'].min()
-    max_date = df['fecha_registro'].max()
+    min_date, max_date = filter_options.date_bounds(selected_entity)
     date_range = st.date_input(
         "Fecha de Registro",
         value=(min_date, max_date),
@@ -279,18 +368,24 @@ with st.sidebar:
     )
 
 # Apply filters
-filtered_df = df.copy()
-if selected_entity != 'Todos':
-    filtered_df = filtered_df[filtered_df['entity_type'] == selected_entity]
-if selected_gestora != 'Todas':
-    filtered_df = filtered_df[filtered_df['gestora_nombre'] == selected_gestora]
-if selected_depositaria != 'Todas':
-    filtered_df = filtered_df[filtered_df['depositaria_nombre'] == selected_depositaria]
-if len(date_range) == 2:
-    filtered_df = filtered_df[
-        (filtered_df['fecha_registro'] >= pd.Timestamp(date_range[0])) &
-        (filtered_df['fecha_registro'] <= pd.Timestamp(date_range[1]))
-    ]
+filter_args = engine.filter_args(selected_entity, selected_gestora, selected_depositaria, date_range)
+
+# Derived frames and figures are cached per filter state and shared across sessions.
+# Cached values must not be mutated.
+result_cache = get_result_cache(version)
+filters = filter_key(selected_entity, selected_gestora, selected_depositaria, filter_args['date_range'])
+# The SQL backend has no entity ids or rows: every tab queries it with filter_args
+entity_ids = filtered_rows = None
+if not SQL_BACKEND:
+    with profiler.section('filters'):
+        entity_ids = result_cache.get_or_compute(('entity_ids', filters), lambda: engine.select(**filter_args))
+        filtered_rows = result_cache.get_or_compute(('filtered_rows', filters), lambda: engine.rows(entity_ids))
+
+# Metrics and tab1/tab2 charts are rollups of the matching cube cells, which
+# the SQL backend aggregates in the same shape
+with profiler.section('filters'):
+    cube_cells = result_cache.get_or_compute(('cube_cells', filters), lambda: engine.cells(**filter_args))
+    cube_totals = result_cache.get_or_compute(('cube_totals', filters), lambda: totals(cube_cells))
 
 # Key metrics
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -298,122 +393,62 @@ col1, col2, col3, col4, col5 = st.columns(5)
 with col1:
     st.metric(
         label="Total Entidades",
-        value=f"{filtered_df['entity_name'].nunique():,}",
-        delta=f"{len(filtered_df):,} registros"
+        value=f"{cube_totals['n_entities']:,}",
+        delta=f"{cube_totals['n_rows']:,} registros"
     )
 
 with col2:
     st.metric(
         label="Tipos de Entidad",
-        value=filtered_df['entity_type'].nunique(),
+        value=cube_totals['n_types'],
         delta="categorías"
     )
 
 with col3:
     st.metric(
         label="Gestoras",
-        value=filtered_df['gestora_nombre'].nunique(),
+        value=cube_totals['n_gestoras'],
         delta="únicas"
     )
 
 with col4:
     st.metric(
         label="Depositarias",
-        value=filtered_df['depositaria_nombre'].nunique(),
+        value=cube_totals['n_depositarias'],
         delta="instituciones"
     )
 
 with col5:
-    latest_date = filtered_df['fecha_registro'].max()
+    latest_date = cube_totals['latest']
     st.metric(
         label="Último Registro",
         value=latest_date.strftime('%b %Y') if pd.notna(latest_date) else "N/A",
         delta="más reciente"
     )
 
-# Tabs for different views
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Análisis", "📈 Visualizaciones", "🔍 Explorador de Datos", "🏢 Empresas"])
+def timeline_chart(cube_cells):
+    # Monthly points, coarsened to quarters or years for long date ranges
+    counts, grain = timeline_counts(cube_cells)
+    return timeline_figure(counts.rename_axis('month_year').reset_index(name='count'), grain)
 
-with tab1:
+# Tab 1: distribution, timeline and summary
+@st.fragment
+@profiled('tab1')
+def render_analysis(cube_cells, cube_totals, filters):
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown('<h3 style="color: #e6e9ef;">Distribución por Tipo de Entidad</h3>', unsafe_allow_html=True)
-        entity_counts = filtered_df['entity_type'].value_counts()
-        
-        # Custom color palette for dark theme
-        dark_theme_colors = [
-            '#a855f7', '#7c3aed', '#06b6d4', '#10b981', 
-            '#f59e0b', '#ef4444', '#ec4899', '#8b5cf6',
-            '#3b82f6', '#14b8a6'
-        ]
-        
-        fig_pie = go.Figure(data=[go.Pie(
-            labels=entity_counts.index,
-            values=entity_counts.values,
-            hole=0.4,
-            marker=dict(
-                colors=dark_theme_colors[:len(entity_counts)],
-                line=dict(color='#1a1d25', width=2)
-            ),
-            textfont=dict(color='white', size=12),
-            hovertemplate='<b>%{label}</b><br>Cantidad: %{value}<br>Porcentaje: %{percent}<extra></extra>'
-        )])
-        
-        fig_pie.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#e6e9ef'),
-            height=400,
-            margin=dict(t=20, b=20),
-            showlegend=True,
-            legend=dict(
-                font=dict(size=10),
-                orientation="v",
-                yanchor="middle",
-                y=0.5,
-                xanchor="left",
-                x=1.02
-            )
-        )
+        with profiler.section('figures'):
+            fig_pie = result_cache.get_or_compute(('fig_pie', filters), lambda: pie_figure(counts_by_type(cube_cells)))
         st.plotly_chart(fig_pie, use_container_width=True)
     
     with col2:
         st.markdown('<h3 style="color: #e6e9ef;">Evolución Temporal de Registros</h3>', unsafe_allow_html=True)
         
         # Group by month and year
-        timeline_df = filtered_df[filtered_df['fecha_registro'].notna()].copy()
-        timeline_df['month_year'] = timeline_df['fecha_registro'].dt.to_period('M')
-        timeline_counts = timeline_df.groupby('month_year').size().reset_index(name='count')
-        timeline_counts['month_year'] = timeline_counts['month_year'].dt.to_timestamp()
-        
-        fig_timeline = go.Figure()
-        fig_timeline.add_trace(go.Scatter(
-            x=timeline_counts['month_year'],
-            y=timeline_counts['count'],
-            mode='lines',
-            fill='tozeroy',
-            line=dict(color='#06b6d4', width=3),
-            fillcolor='rgba(6, 182, 212, 0.15)',
-            hovertemplate='<b>%{x|%b %Y}</b><br>Registros: %{y}<extra></extra>'
-        ))
-        
-        fig_timeline.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#e6e9ef'),
-            height=400,
-            xaxis=dict(
-                gridcolor='rgba(42, 46, 57, 0.5)',
-                showgrid=True
-            ),
-            yaxis=dict(
-                gridcolor='rgba(42, 46, 57, 0.5)',
-                showgrid=True,
-                title="Número de Registros"
-            ),
-            margin=dict(t=20, b=20)
-        )
+        with profiler.section('figures'):
+            fig_timeline = result_cache.get_or_compute(('fig_timeline', filters), lambda: timeline_chart(cube_cells))
         st.plotly_chart(fig_timeline, use_container_width=True)
     
     # Statistics summary
@@ -422,127 +457,65 @@ with tab1:
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_with_isin = filtered_df['isin'].notna().sum()
-        perc_isin = (total_with_isin / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
+        total_with_isin = cube_totals['n_isin']
+        perc_isin = (total_with_isin / cube_totals['n_rows'] * 100) if cube_totals['n_rows'] > 0 else 0
         st.markdown(f'<div style="background: linear-gradient(135deg, #7c3aed20 0%, #06b6d420 100%); padding: 1rem; border-radius: 8px; border: 1px solid #7c3aed50;"><b>Entidades con ISIN</b><br>{total_with_isin:,} ({perc_isin:.1f}%)</div>', unsafe_allow_html=True)
     
     with col2:
-        total_with_folleto = filtered_df['folleto_url'].notna().sum()
-        perc_folleto = (total_with_folleto / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
+        total_with_folleto = cube_totals['n_folleto']
+        perc_folleto = (total_with_folleto / cube_totals['n_rows'] * 100) if cube_totals['n_rows'] > 0 else 0
         st.markdown(f'<div style="background: linear-gradient(135deg, #06b6d420 0%, #10b98120 100%); padding: 1rem; border-radius: 8px; border: 1px solid #06b6d450;"><b>Con Folleto Disponible</b><br>{total_with_folleto:,} ({perc_folleto:.1f}%)</div>', unsafe_allow_html=True)
     
     with col3:
-        total_with_gestora = filtered_df['gestora_nombre'].notna().sum()
-        perc_gestora = (total_with_gestora / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
+        total_with_gestora = cube_totals['n_rows_gestora']
+        perc_gestora = (total_with_gestora / cube_totals['n_rows'] * 100) if cube_totals['n_rows'] > 0 else 0
         st.markdown(f'<div style="background: linear-gradient(135deg, #10b98120 0%, #f59e0b20 100%); padding: 1rem; border-radius: 8px; border: 1px solid #10b98150;"><b>Con Gestora Asignada</b><br>{total_with_gestora:,} ({perc_gestora:.1f}%)</div>', unsafe_allow_html=True)
     
     with col4:
-        total_with_depositaria = filtered_df['depositaria_nombre'].notna().sum()
-        perc_depositaria = (total_with_depositaria / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
+        total_with_depositaria = cube_totals['n_rows_depositaria']
+        perc_depositaria = (total_with_depositaria / cube_totals['n_rows'] * 100) if cube_totals['n_rows'] > 0 else 0
         st.markdown(f'<div style="background: linear-gradient(135deg, #f59e0b20 0%, #ef444420 100%); padding: 1rem; border-radius: 8px; border: 1px solid #f59e0b50;"><b>Con Depositaria</b><br>{total_with_depositaria:,} ({perc_depositaria:.1f}%)</div>', unsafe_allow_html=True)
 
-with tab2:
+# Tab 2: top gestoras and year x type heatmap
+@st.fragment
+@profiled('tab2')
+def render_visualizations(entity_ids, cube_cells, filters):
     st.markdown('<h3 style="color: #e6e9ef;">Top 15 Sociedades Gestoras</h3>', unsafe_allow_html=True)
     
     # Top management companies
-    top_gestoras = filtered_df['gestora_nombre'].value_counts().head(15)
-    
-    fig_bar = go.Figure(data=[go.Bar(
-        y=top_gestoras.index,
-        x=top_gestoras.values,
-        orientation='h',
-        marker=dict(
-            color=top_gestoras.values,
-            colorscale=[[0, '#7c3aed'], [0.5, '#06b6d4'], [1, '#10b981']],
-            showscale=True,
-            colorbar=dict(
-                title=dict(
-                    text="Entidades",
-                    font=dict(color='#e6e9ef')
-                ),
-                tickfont=dict(color='#e6e9ef'),
-                bgcolor='rgba(30, 33, 40, 0.8)',
-                bordercolor='#2a2e39',
-                borderwidth=1
+    with profiler.section('figures'):
+        fig_bar = result_cache.get_or_compute(
+            ('fig_bar', filters),
+            lambda: top_gestoras_figure(
+                engine.gestora_counts(**filter_args).head(15) if SQL_BACKEND
+                else top_gestoras(registry, entity_ids, 15)
             )
-        ),
-        text=top_gestoras.values,
-        textposition='outside',
-        textfont=dict(color='#e6e9ef', size=11),
-        hovertemplate='<b>%{y}</b><br>Entidades: %{x}<extra></extra>'
-    )])
-    
-    fig_bar.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='#e6e9ef'),
-        height=600,
-        xaxis=dict(
-            gridcolor='rgba(42, 46, 57, 0.5)',
-            showgrid=True,
-            title="Número de Entidades"
-        ),
-        yaxis=dict(
-            gridcolor='rgba(42, 46, 57, 0.5)',
-            showgrid=False
-        ),
-        margin=dict(l=200, r=50, t=20, b=50)
-    )
+        )
     st.plotly_chart(fig_bar, use_container_width=True)
     
     # Heatmap of entity types by year
-    if not timeline_df.empty:
+    with profiler.section('figures'):
+        heatmap_pivot = result_cache.get_or_compute(('heatmap_pivot', filters), lambda: year_type_counts(cube_cells))
+    if not heatmap_pivot.empty:
         st.markdown('<h3 style="color: #e6e9ef;">Mapa de Calor: Registros por Tipo y Año</h3>', unsafe_allow_html=True)
         
-        timeline_df['year'] = timeline_df['fecha_registro'].dt.year
-        heatmap_data = timeline_df.groupby(['year', 'entity_type']).size().reset_index(name='count')
-        heatmap_pivot = heatmap_data.pivot(index='entity_type', columns='year', values='count').fillna(0)
-        
-        fig_heatmap = go.Figure(data=go.Heatmap(
-            z=heatmap_pivot.values,
-            x=heatmap_pivot.columns,
-            y=heatmap_pivot.index,
-            colorscale=[[0, '#1e2128'], [0.2, '#7c3aed'], [0.5, '#06b6d4'], [0.8, '#10b981'], [1, '#f59e0b']],
-            text=heatmap_pivot.values,
-            texttemplate='%{text:.0f}',
-            textfont={"size": 10, "color": "white"},
-            hovertemplate='<b>%{y}</b><br>Año: %{x}<br>Cantidad: %{z}<extra></extra>',
-            colorbar=dict(
-                tickfont=dict(color='#e6e9ef'),
-                bgcolor='rgba(30, 33, 40, 0.8)',
-                bordercolor='#2a2e39',
-                borderwidth=1
-            )
-        ))
-        
-        fig_heatmap.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#e6e9ef'),
-            height=500,
-            xaxis=dict(title="Año", side="bottom"),
-            yaxis=dict(title="Tipo de Entidad"),
-            margin=dict(l=200, r=20, t=20, b=50)
-        )
+        with profiler.section('figures'):
+            fig_heatmap = result_cache.get_or_compute(('fig_heatmap', filters), lambda: heatmap_figure(heatmap_pivot))
         st.plotly_chart(fig_heatmap, use_container_width=True)
 
-with tab3:
+# Tab 3: data explorer
+@st.fragment
+@profiled('tab3')
+def render_explorer(filtered_rows, entity_ids, filters, filter_state):
     st.markdown('<h3 style="color: #e6e9ef;">Buscar y Filtrar Datos</h3>', unsafe_allow_html=True)
     
     # Search functionality
     search_term = st.text_input(
-        "🔍 Buscar entidades por nombre",
+        "🔍 Buscar entidades por nombre, gestora, depositaria, ISIN o NIF",
         placeholder="Escriba para buscar...",
-        help="Busque entidades específicas por nombre"
+        help="Búsqueda sin distinguir acentos ni puntuación" + ("" if SQL_BACKEND else " y tolerante a erratas")
     )
     
-    if search_term:
-        search_df = filtered_df[
-            filtered_df['entity_name'].str.contains(search_term, case=False, na=False)
-        ]
-    else:
-        search_df = filtered_df
-    
     # Display settings
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -550,13 +523,14 @@ with tab3:
         default_cols = ['entity_name', 'entity_type', 'gestora_nombre', 'fecha_registro', 'isin']
         show_cols = st.multiselect(
             "Seleccionar columnas a mostrar",
-            df.columns.tolist(),
+            engine.columns if SQL_BACKEND else registry.columns,
             default=default_cols
         )
     with col2:
+        sort_options = show_cols if show_cols else ['entity_name']
         sort_by = st.selectbox(
             "Ordenar por",
-            show_cols if show_cols else ['entity_name'],
+            ['Relevancia'] + sort_options if search_term and not SQL_BACKEND else sort_options,
             index=0
         )
     with col3:
@@ -573,92 +547,195 @@ with tab3:
             help="Agrupa los registros por entidad cuando no se muestran las clases"
         )
     
-    # Apply sorting
-    ascending = sort_order == 'Ascendente'
-    search_df = search_df.sort_values(sort_by, ascending=ascending)
+    # Identify columns to group by (exclude class-specific columns)
+    groupby_cols = [col for col in show_cols if col not in CLASS_SPECIFIC_COLS]
+    agg_cols = [col for col in show_cols if col not in groupby_cols]
+    grouped = group_by_entity and bool(groupby_cols)
     
-    # Handle grouping to avoid duplicates
-    if group_by_entity and len(show_cols) > 0:
-        # Identify columns to group by (exclude class-specific columns)
-        class_specific_cols = ['denominacion', 'numero', 'isin', 'fecha_alta', 'dfi']
-        groupby_cols = [col for col in show_cols if col not in class_specific_cols]
-        
-        if groupby_cols:
-            # Create aggregation dict only for non-groupby columns
-            agg_cols = [col for col in show_cols if col not in groupby_cols]
-            agg_dict = {}
-            
-            for col in agg_cols:
-                if col in ['denominacion', 'numero']:
-                    agg_dict[col] = lambda x: f"{len(x)} clases"
-                elif col == 'isin':
-                    agg_dict[col] = lambda x: ', '.join([str(i) for i in x.dropna().unique()[:3]]) + ('...' if len(x.dropna().unique()) > 3 else '')
-                else:
-                    agg_dict[col] = 'first'
-            
-            # Only aggregate if there are columns to aggregate
-            if agg_dict:
-                display_df = search_df[show_cols].groupby(groupby_cols, dropna=False, as_index=False).agg(agg_dict)
+    filter_state_key = filter_key(*filter_state, search_term)
+    explorer_key = (filter_state_key, tuple(show_cols), sort_by, sort_order, group_by_entity)
+    if SQL_BACKEND:
+        # Search, sort, grouping (always by entity) and paging all run in
+        # DuckDB; only the counts and the visible page come back
+        sql_args = dict(
+            filter_args, query=search_term, sort_by=sort_by, ascending=sort_order == 'Ascendente', grouped=grouped
+        )
+        with profiler.section('order'):
+            explorer_totals = result_cache.get_or_compute(
+                ('explorer_totals', filter_state_key), lambda: engine.metrics(**filter_args, query=search_term)
+            )
+        n_rows = explorer_totals['n_rows']
+        n_display = explorer_totals['n_entities'] if grouped else n_rows
+    else:
+        def explorer_order():
+            hit_ids = None
+            if search_term:
+                # Ranked entity ids from the trigram index, restricted to the sidebar filters
+                hit_ids, _ = search_index.search(search_term)
+                hit_ids = hit_ids[np.isin(hit_ids, entity_ids)]
+                rows = registry.rows_for(np.sort(hit_ids))
             else:
-                # If no columns to aggregate, just drop duplicates
-                display_df = search_df[show_cols].drop_duplicates()
-            
+                rows = filtered_rows
+            return sort_rows(registry, rows, sort_by, sort_order == 'Ascendente', hit_ids)
+    
+        # The sort order is cached per filter state, search term and sort settings,
+        # so paging, column changes and grouping reuse it
+        with profiler.section('order'):
+            sorted_rows = result_cache.get_or_compute(('explorer_order', filter_state_key, sort_by, sort_order), explorer_order)
+
+        with profiler.section('group'):
+            if grouped and ('entity_name' in groupby_cols or 'entity_value' in groupby_cols):
+                group_rows = result_cache.get_or_compute(
+                    ('explorer_groups', filter_state_key, sort_by, sort_order), lambda: entity_first_rows(registry, sorted_rows)
+                )
+                n_display = len(group_rows)
+            elif grouped:
+                group_rows = None
+                grouped_df = result_cache.get_or_compute(
+                    ('explorer_grouped',) + explorer_key,
+                    lambda: group_rows_frame(registry.to_frame(sorted_rows, show_cols), groupby_cols, agg_cols)
+                )
+                n_display = len(grouped_df)
+            else:
+                n_display = len(sorted_rows)
+            n_rows = len(sorted_rows)
+    
+    # Display record count
+    if group_by_entity and ('denominacion' not in show_cols and 'numero' not in show_cols):
+        st.markdown(f'<p style="color: #8b92a8;">Mostrando {n_display:,} entidades únicas ({n_rows:,} registros totales)</p>', 
+                   unsafe_allow_html=True)
+    else:
+        st.markdown(f'<p style="color: #8b92a8;">Mostrando {n_display:,} registros</p>', unsafe_allow_html=True)
+    
+    # Pagination - only the visible page is built, formatted and sent to the browser
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("Filas por página", [50, 100, 250, 500], index=1)
+    n_pages = max(1, -(-n_display // page_size))
+    with col2:
+        page = st.number_input(f"Página (de {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1)
+    page_slice = slice((page - 1) * page_size, page * page_size)
+    
+    # The SQL page carries the NIF for the prospectus links, dropped once they are built
+    show_folletos = 'folleto_url' in show_cols
+    page_cols = show_cols + ['entity_value'] if show_folletos and 'entity_value' not in show_cols else show_cols
+    with profiler.section('page'):
+        page_rows = None
+        if SQL_BACKEND:
+            display_df = engine.explorer_page(page_cols, page_slice.start, page_size, **sql_args)
+        elif not grouped:
+            page_rows = sorted_rows[page_slice]
+            display_df = registry.to_frame(page_rows, show_cols)
+        elif group_rows is not None:
+            # Entity columns from the group's first row, class columns from the
+            # rollup precomputed at load time
+            page_rows = group_rows[page_slice]
+            display_df = registry.to_frame(page_rows, groupby_cols)
+            for col in agg_cols:
+                display_df[col] = registry.class_rollup[col].to_numpy()[registry.row_entity[page_rows]]
+        else:
+            display_df = grouped_df.iloc[page_slice].reset_index(drop=True)
+    
+        if grouped:
             # Rename class columns if they exist
             rename_dict = {}
             if 'denominacion' in display_df.columns:
                 rename_dict['denominacion'] = 'clases'
             if 'numero' in display_df.columns:
                 rename_dict['numero'] = 'clases'
-            
+        
             if rename_dict:
                 display_df = display_df.rename(columns=rename_dict)
-        else:
-            display_df = search_df[show_cols].copy()
-    else:
-        display_df = search_df[show_cols].copy()
     
-    # Display record count
-    if group_by_entity and ('denominacion' not in show_cols and 'numero' not in show_cols):
-        unique_entities = search_df['entity_name'].nunique()
-        st.markdown(f'<p style="color: #8b92a8;">Mostrando {len(display_df):,} entidades únicas ({len(search_df):,} registros totales)</p>', 
-                   unsafe_allow_html=True)
-    else:
-        st.markdown(f'<p style="color: #8b92a8;">Mostrando {len(display_df):,} registros</p>', unsafe_allow_html=True)
+        # Format datetime columns for display
+        for col in display_df.select_dtypes(include=['datetime64']).columns:
+            display_df[col] = display_df[col].dt.strftime('%d/%m/%Y')
     
-    # Format datetime columns for display
-    for col in display_df.select_dtypes(include=['datetime64']).columns:
-        display_df[col] = display_df[col].dt.strftime('%d/%m/%Y')
+    # Links to the local copies of the prospectuses downloaded by folletos.py
+    column_config = {}
+    if show_folletos and (SQL_BACKEND or page_rows is not None):
+        if SQL_BACKEND:
+            entity_values = display_df['entity_value'].to_numpy()
+            if 'entity_value' not in show_cols:
+                display_df = display_df.drop(columns='entity_value')
+        else:
+            entity_values = registry.entities['entity_value'].to_numpy()[registry.row_entity[page_rows]]
+        display_df['folleto_local'] = get_folleto_cache().local_urls(entity_values)
+        column_config['folleto_local'] = st.column_config.LinkColumn('Folleto (copia local)', display_text='Abrir PDF')
     
     # Display the dataframe
     st.dataframe(
         display_df,
         use_container_width=True,
         height=500,
-        hide_index=True
+        hide_index=True,
+        column_config=column_config
     )
     
-    # Download button - use original search_df for download
-    csv = search_df[show_cols].to_csv(index=False)
-    st.download_button(
-        label="⬇️ Descargar datos filtrados como CSV",
-        data=csv,
-        file_name=f"entidades_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        mime="text/csv"
-    )
+    # Download - the file is only generated when asked for, kept on disk per
+    # filter state, columns, sort and format, and streamed from there by
+    # Streamlit's static file server rather than through the app's memory
+    export_format = st.selectbox("Formato de descarga", available_formats(), key='export_format')
+    extension = EXPORT_FORMATS[export_format][0]
+    # Exports are never grouped, so the grouping is not part of the key
+    export_parts = (version, filter_state_key, tuple(show_cols), sort_by, sort_order)
+    if st.button(f"⬇️ Preparar descarga ({export_format})", key='export_prepare'):
+        with st.spinner("Generando el fichero..."):
+            if SQL_BACKEND:
+                # Written straight from DuckDB, never held as a frame; every
+                # row, as in memory, whatever the table's grouping
+                export_args = {key: value for key, value in sql_args.items() if key != 'grouped'}
+                export_path = export_file(
+                    None, export_parts, export_format, write=lambda path, label: engine.export(path, label, show_cols, **export_args)
+                )
+            else:
+                export_path = export_file(lambda: row_chunks(registry, sorted_rows, show_cols), export_parts, export_format)
+        export_mb = os.path.getsize(export_path) / 1024 / 1024
+        if export_mb > EXPORT_MAX_BYTES / 1024 / 1024:
+            st.warning(
+                f"El fichero ocupa {export_mb:,.0f} MB y el límite de descarga es de {EXPORT_MAX_BYTES // 1024 // 1024} MB. "
+                "Acota los filtros o las columnas, o elige Parquet o CSV (gzip)."
+            )
+        else:
+            file_name = f"entidades_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+            st.markdown(
+                f'<a href="{export_url(export_path)}" download="{file_name}" style="color: #06b6d4; font-weight: 600;">'
+                f'⬇️ Descargar {file_name} ({export_mb:,.1f} MB)</a>',
+                unsafe_allow_html=True
+            )
 
-with tab4:
+# Tab 4: company analysis
+@st.fragment
+@profiled('tab4')
+def render_companies(entity_ids, cube_cells, filters):
     st.markdown('<h3 style="color: #e6e9ef;">Análisis de Empresas</h3>', unsafe_allow_html=True)
     
+    def compute_company_stats(company):
+        if SQL_BACKEND:
+            return engine.company_stats(company, **filter_args)
+        return company_stats(registry, entity_ids, company)
+    
+    def company_summary(company, columns):
+        with profiler.section('company_stats'):
+            stats = result_cache.get_or_compute(('company_stats', company, filters), lambda: compute_company_stats(company))
+        stats = stats.sort_values(['entidades', 'nombre'], ascending=[False, True])
+        stats = stats[['nombre', 'entidades', 'clases', 'tipo_principal', 'primer_registro', 'ultimo_registro']]
+        stats.columns = columns
+        for col in columns[-2:]:
+            stats[col] = stats[col].dt.strftime('%d/%m/%Y')
+        return stats
+    
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown('<h4 style="color: #06b6d4;">Resumen de Sociedades Gestoras</h4>', unsafe_allow_html=True)
-        gestora_stats = filtered_df.groupby('gestora_nombre').agg({
-            'entity_name': 'nunique',
-            'entity_type': lambda x: x.value_counts().index[0] if len(x) > 0 else 'N/A'
-        }).reset_index()
-        gestora_stats.columns = ['Sociedad Gestora', 'Entidades Gestionadas', 'Tipo Principal']
-        gestora_stats = gestora_stats.sort_values('Entidades Gestionadas', ascending=False).head(10)
+        gestora_stats = result_cache.get_or_compute(
+            ('gestora_stats', filters),
+            lambda: company_summary(
+                'gestora',
+                ['Sociedad Gestora', 'Entidades Gestionadas', 'Clases', 'Tipo Principal', 'Primer Registro', 'Último Registro']
+            ).head(10)
+        )
         
         st.dataframe(
             gestora_stats,
@@ -668,12 +745,13 @@ with tab4:
     
     with col2:
         st.markdown('<h4 style="color: #10b981;">Resumen de Entidades Depositarias</h4>', unsafe_allow_html=True)
-        dep_stats = filtered_df.groupby('depositaria_nombre').agg({
-            'entity_name': 'nunique',
-            'entity_type': lambda x: x.value_counts().index[0] if len(x) > 0 else 'N/A'
-        }).reset_index()
-        dep_stats.columns = ['Entidad Depositaria', 'Entidades Custodiadas', 'Tipo Principal']
-        dep_stats = dep_stats.sort_values('Entidades Custodiadas', ascending=False)
+        dep_stats = result_cache.get_or_compute(
+            ('dep_stats', filters),
+            lambda: company_summary(
+                'depositaria',
+                ['Entidad Depositaria', 'Entidades Custodiadas', 'Clases', 'Tipo Principal', 'Primer Registro', 'Último Registro']
+            )
+        )
         
         st.dataframe(
             dep_stats,
@@ -681,18 +759,28 @@ with tab4:
             hide_index=True
         )
     
-    # Network visualization placeholder
+    # Gestora-depositaria network
     st.markdown('<h4 style="color: #f59e0b;">Relaciones entre Entidades</h4>', unsafe_allow_html=True)
     
-    # Create a simple relationship analysis
-    relationships = filtered_df[['entity_name', 'gestora_nombre', 'depositaria_nombre']].dropna()
+    with profiler.section('market'):
+        total_connections, unique_managers, unique_depositaries = result_cache.get_or_compute(
+            ('relationships', filters),
+            lambda: engine.relationship_counts(**filter_args) if SQL_BACKEND
+            else relationship_counts(registry, entity_ids)
+        )
+    with profiler.section('network'):
+        # Edge weights of the filtered funds on the graph built at load time,
+        # or on a graph of just the filtered funds' pairs from the SQL backend
+        graph, weights = result_cache.get_or_compute(
+            ('graph', filters),
+            lambda: engine.relationship_graph(**filter_args) if SQL_BACKEND
+            else (engine.graph, engine.graph.weights(entity_ids))
+        )
+        network_nodes, network_edges = result_cache.get_or_compute(
+            ('network', filters), lambda: (graph.nodes(weights), graph.edges(weights))
+        )
     
-    if not relationships.empty:
-        # Count unique combinations
-        unique_managers = relationships['gestora_nombre'].nunique()
-        unique_depositaries = relationships['depositaria_nombre'].nunique()
-        total_connections = len(relationships)
-        
+    if total_connections > 0:
         col1, col2, col3 = st.columns(3)
         with col1:
             st.markdown(f'<div style="background: linear-gradient(135deg, #7c3aed20 0%, #06b6d420 100%); padding: 1rem; border-radius: 8px; border: 1px solid #7c3aed50; text-align: center;">🔗 <b>{total_connections:,}</b><br>conexiones totales</div>', unsafe_allow_html=True)
@@ -703,45 +791,69 @@ with tab4:
         
         # Most connected entities
         st.markdown('<h5 style="color: #e6e9ef;">Gestoras Más Conectadas</h5>', unsafe_allow_html=True)
-        connected = filtered_df.groupby('gestora_nombre')['depositaria_nombre'].nunique().sort_values(ascending=False).head(5)
+        with profiler.section('network'):
+            fig_connected = result_cache.get_or_compute(
+                ('fig_connected', filters),
+                lambda: connected_figure(top_connected(network_nodes, 5))
+            )
+        st.plotly_chart(fig_connected, use_container_width=True)
         
-        fig_connected = go.Figure(data=[go.Bar(
-            x=connected.index,
-            y=connected.values,
-            marker=dict(
-                color=connected.values,
-                colorscale=[[0, '#7c3aed'], [1, '#06b6d4']],
-                showscale=False
-            ),
-            text=connected.values,
-            textposition='outside',
-            textfont=dict(color='#e6e9ef', size=12),
-            hovertemplate='<b>%{x}</b><br>Depositarias Conectadas: %{y}<extra></extra>'
-        )])
+        st.markdown('<h5 style="color: #e6e9ef;">Red de Gestoras y Depositarias</h5>', unsafe_allow_html=True)
+        sizes = component_sizes(network_nodes)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(label="Nodos", value=f"{len(network_nodes):,}")
+        with col2:
+            st.metric(label="Enlaces", value=f"{len(network_edges):,}", delta="pares gestora-depositaria")
+        with col3:
+            st.metric(label="Componentes", value=f"{len(sizes):,}")
+        with col4:
+            st.metric(label="Mayor Componente", value=f"{sizes.iloc[0] / len(network_nodes) * 100:.0f}%", delta="de los nodos")
         
-        fig_connected.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#e6e9ef'),
-            height=300,
-            xaxis=dict(
-                tickangle=-45,
-                showgrid=False
-            ),
-            yaxis=dict(
-                title="Número de Depositarias Conectadas",
-                gridcolor='rgba(42, 46, 57, 0.5)',
-                showgrid=True
-            ),
-            margin=dict(b=100)
-        )
-        st.plotly_chart(fig_connected, use_container_width=True)
+        with profiler.section('network'):
+            fig_network = result_cache.get_or_compute(
+                ('fig_network', filters),
+                lambda: network_figure(network_nodes, radial_layout(network_nodes, network_edges), network_edges)
+            )
+        st.plotly_chart(fig_network, use_container_width=True)
+        st.caption("Cada enlace une una gestora con una depositaria que custodia alguno de sus fondos; el tamaño de los nodos refleja el número de fondos.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown('<h5 style="color: #e6e9ef;">Centralidad</h5>', unsafe_allow_html=True)
+            central = network_nodes.nlargest(10, 'centrality')
+            st.dataframe(
+                pd.DataFrame({
+                    'Entidad': central['name'],
+                    'Tipo': central['kind'].map({'gestora': 'Gestora', 'depositaria': 'Depositaria'}),
+                    'Fondos': central['funds'],
+                    'Conexiones': central['degree'],
+                    'Centralidad': central['centrality'].round(3)
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+        with col2:
+            st.markdown('<h5 style="color: #e6e9ef;">Depositarias Compartidas entre Gestoras</h5>', unsafe_allow_html=True)
+            with profiler.section('network'):
+                fig_overlap = result_cache.get_or_compute(
+                    ('fig_overlap', filters),
+                    lambda: overlap_figure(graph.overlap(
+                        weights,
+                        network_nodes[network_nodes['kind'] == 'gestora'].nlargest(10, ['degree', 'funds'])['node'].to_numpy()
+                    ))
+                )
+            st.plotly_chart(fig_overlap, use_container_width=True)
     
     # Market concentration analysis
     st.markdown('<h4 style="color: #ef4444;">Concentración del Mercado</h4>', unsafe_allow_html=True)
     
-    top_10_gestoras = filtered_df['gestora_nombre'].value_counts().head(10)
-    market_share = (top_10_gestoras.sum() / filtered_df['gestora_nombre'].notna().sum() * 100)
+    with profiler.section('market'):
+        market_share, herfindahl_index = result_cache.get_or_compute(
+            ('concentration', filters),
+            lambda: counts_concentration(engine.gestora_counts(**filter_args)) if SQL_BACKEND
+            else concentration(registry, entity_ids)
+        )
     
     col1, col2 = st.columns(2)
     with col1:
@@ -751,12 +863,144 @@ with tab4:
             delta="de todas las entidades gestionadas"
         )
     with col2:
-        herfindahl_index = ((filtered_df['gestora_nombre'].value_counts() / filtered_df['gestora_nombre'].notna().sum()) ** 2).sum()
         st.metric(
             label="Índice Herfindahl",
             value=f"{herfindahl_index:.4f}",
             delta="concentración del mercado"
         )
+    
+    # Concentration year by year, on what each gestora had registered by then
+    st.markdown('<h5 style="color: #e6e9ef;">Evolución de la Concentración</h5>', unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        concentration_metric = st.radio(
+            "Indicador",
+            list(CONCENTRATION_METRICS),
+            format_func=lambda metric: CONCENTRATION_METRICS[metric][0],
+            horizontal=True,
+            key='concentration_metric'
+        )
+    with col2:
+        concentration_unit = st.radio(
+            "Contar",
+            ['entity', 'class'],
+            format_func={'entity': 'Entidades', 'class': 'Clases'}.get,
+            horizontal=True,
+            key='concentration_unit'
+        )
+    
+    with profiler.section('concentration'):
+        fig_concentration = result_cache.get_or_compute(
+            ('fig_concentration', concentration_metric, concentration_unit, filters),
+            lambda: concentration_figure(
+                result_cache.get_or_compute(
+                    ('concentration_time', concentration_unit, filters),
+                    lambda: concentration_over_time(cube_cells, concentration_unit)
+                ),
+                concentration_metric,
+                TOTAL_TYPE
+            )
+        )
+    st.plotly_chart(fig_concentration, use_container_width=True)
+    st.caption("Cuotas acumuladas: cada año cuenta lo registrado por cada gestora hasta ese año. No incluye entidades sin gestora o sin fecha de registro.")
+
+@st.fragment
+@profiled('tab5')
+def render_changes(stored_versions):
+    st.markdown('<h3 style="color: #e6e9ef;">Cambios en el Registro</h3>', unsafe_allow_html=True)
+    if len(stored_versions) < 2:
+        st.info(
+            "Aún no hay extractos anteriores guardados. "
+            "`python refresh.py extracto.csv --as-of AAAA-MM-DD` guarda cada extracto como una nueva versión."
+        )
+        return
+    
+    first, latest = (date.fromisoformat(stored_versions[i]['as_of']) for i in (0, -1))
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.date_input(
+            "Desde", value=date.fromisoformat(stored_versions[-2]['as_of']),
+            min_value=first, max_value=date.today(), format="DD/MM/YYYY", key='changes_start'
+        )
+    with col2:
+        end = st.date_input(
+            "Hasta", value=latest, min_value=first, max_value=date.today(), format="DD/MM/YYYY", key='changes_end'
+        )
+    start, end = sorted([start, end])
+    store = get_version_store()
+    start_entry, end_entry = store.version_at(start), store.version_at(end)
+    start_label, end_label = (date.fromisoformat(entry['as_of']).strftime('%d/%m/%Y') for entry in (start_entry, end_entry))
+    if start_entry['version'] == end_entry['version']:
+        st.info(f"Las dos fechas corresponden al mismo extracto (del {start_label}).")
+        return
+    
+    with profiler.section('diff'):
+        diff = load_diff(start_entry['version'], end_entry['version'])
+    st.caption(f"Extracto del {end_label} frente al del {start_label}")
+    
+    sections = [
+        ('altas', "Altas", "entidades nuevas"),
+        ('bajas', "Bajas", "entidades dadas de baja"),
+        ('gestora', "Cambios de Gestora", "entidades"),
+        ('depositaria', "Cambios de Depositaria", "entidades"),
+        ('folletos', "Nuevos Folletos", "entidades"),
+        ('clases_altas', "Clases Nuevas", "ISIN"),
+        ('clases_bajas', "Clases Eliminadas", "ISIN")
+    ]
+    counts = diff_summary(diff)
+    for col, (kind, label, unit) in zip(st.columns(len(sections)), sections):
+        with col:
+            st.metric(label=label, value=f"{counts[kind]:,}", delta=unit)
+    
+    column_labels = {
+        'entity_value': 'Código', 'entity_name': 'Entidad', 'entity_type': 'Tipo',
+        'gestora_nombre': 'Sociedad Gestora', 'depositaria_nombre': 'Entidad Depositaria',
+        'fecha_ultimo_folleto': 'Último Folleto', 'folleto_url': 'Folleto', 'isin': 'ISIN',
+        'denominacion': 'Clase', 'antes': 'Antes', 'despues': 'Después'
+    }
+    for kind, label, _ in sections:
+        if counts[kind]:
+            with st.expander(f"{label} ({counts[kind]:,})"):
+                st.dataframe(
+                    diff[kind].rename(columns=column_labels),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        'Folleto': st.column_config.LinkColumn('Folleto', display_text='Ver folleto'),
+                        'Último Folleto': st.column_config.DateColumn('Último Folleto', format='DD/MM/YYYY')
+                    }
+                )
+
+# Tabs for different views. Only the selected tab runs, and each one is a
+# fragment so its own widgets rerun just that tab
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["📊 Análisis", "📈 Visualizaciones", "🔍 Explorador de Datos", "🏢 Empresas", "🕓 Cambios"],
+    key='vista',
+    on_change='rerun'
+)
+
+with tab1:
+    if tab1.open:
+        render_analysis(cube_cells, cube_totals, filters)
+
+with tab2:
+    if tab2.open:
+        render_visualizations(entity_ids, cube_cells, filters)
+
+with tab3:
+    if tab3.open:
+        render_explorer(
+            filtered_rows, entity_ids, filters,
+            (selected_entity, selected_gestora, selected_depositaria, filter_args['date_range'])
+        )
+
+with tab4:
+    if tab4.open:
+        render_companies(entity_ids, cube_cells, filters)
+
+with tab5:
+    if tab5.open:
+        render_changes(stored_versions)
 
 # Footer
 st.markdown("---")
@@ -765,10 +1009,38 @@ st.markdown(
     '<p style="text-align: center; color: #e6e9ef; font-size: 0.9rem; margin: 0;">'
     '📊 <b>Dashboard de Capital Riesgo Español</b><br>'
     '<span style="color: #8b92a8;">Última Actualización de Datos: ' + 
-    df['fecha_registro'].max().strftime('%B %Y') + '</span></p>'
+    filter_options.date_bounds('Todos')[1].strftime('%B %Y') + '</span></p>'
     '<p style="text-align: center; margin: 1rem 0 0 0;">'
     '<a href="https://twitter.com/Gsnchez" target="_blank" style="color: #06b6d4; text-decoration: none; font-weight: 600; margin-right: 2rem;">🐦 @Gsnchez</a>'
     '<a href="https://bquantfinance.com" target="_blank" style="color: #10b981; text-decoration: none; font-weight: 600;">🌐 bquantfinance.com</a>'
     '</p></div>',
     unsafe_allow_html=True
 )
+
+# Debug panel (?debug=1): this rerun's sections, then p50/p95 over the logged reruns
+profile_record = profiler.finish(version=version, tab=st.session_state.get('vista'))
+if show_profile and profile_record is not None:
+    with st.sidebar:
+        with st.expander("⏱️ Rendimiento", expanded=True):
+            current = section_frame(profile_record)
+            st.dataframe(
+                pd.DataFrame({
+                    'Sección': current['section'],
+                    'ms': current['seconds'] * 1000,
+                    'Pico MB': current['peak_bytes'] / 1024 / 1024
+                }),
+                use_container_width=True,
+                hide_index=True,
+                column_config={'ms': st.column_config.NumberColumn(format='%.1f'), 'Pico MB': st.column_config.NumberColumn(format='%.2f')}
+            )
+            st.caption("p50/p95 de las últimas ejecuciones registradas (todas las sesiones)")
+            st.dataframe(
+                rollup().rename(columns={'section': 'Sección', 'runs': 'Ejecuciones', 'p95_peak_mb': 'p95 pico MB'}),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    'p50_ms': st.column_config.NumberColumn(format='%.1f'),
+                    'p95_ms': st.column_config.NumberColumn(format='%.1f'),
+                    'p95 pico MB': st.column_config.NumberColumn(format='%.2f')
+                }
+            )
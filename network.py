@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+
+class RelationshipGraph:
+    """Bipartite graph of gestoras and depositarias, linked through their funds.
+
+    Built once from the entity table. Node ids are integers: gestoras keep
+    their ``gestora_id`` and depositarias follow at ``n_gestoras +
+    depositaria_id``. Every distinct (gestora, depositaria) pair is an edge,
+    and ``fund_edge`` maps each entity to its edge (-1 when it lacks either
+    company).
+
+    A filter only changes how many of each edge's funds are selected, so
+    ``weights(entity_ids)`` is a single bincount over the selected funds and
+    every metric below is computed from those edge weights. Nothing is rebuilt
+    from the row-level frame when the filters change.
+    """
+
+    def __init__(self, registry):
+        entities = registry.entities
+        gestora_ids = entities['gestora_id'].to_numpy()
+        depositaria_ids = entities['depositaria_id'].to_numpy()
+        self.n_gestoras = len(registry.gestoras)
+        self.n_depositarias = len(registry.depositarias)
+        self.n_nodes = self.n_gestoras + self.n_depositarias
+
+        linked = (gestora_ids >= 0) & (depositaria_ids >= 0)
+        codes = gestora_ids[linked].astype(np.int64) * self.n_depositarias + depositaria_ids[linked]
+        # Sorted by gestora, then depositaria
+        edge_codes, fund_edges = np.unique(codes, return_inverse=True)
+        self.edge_gestora = (edge_codes // self.n_depositarias).astype(np.int32)
+        self.edge_depositaria = (edge_codes % self.n_depositarias).astype(np.int32)
+        self.fund_edge = np.full(len(entities), -1, dtype=np.int32)
+        self.fund_edge[linked] = fund_edges
+        self.n_edges = len(edge_codes)
+
+        self.node_names = np.concatenate([
+            registry.gestoras['gestora_nombre'].astype(object).to_numpy(),
+            registry.depositarias['depositaria_nombre'].astype(object).to_numpy()
+        ])
+        self.node_kind = np.repeat(['gestora', 'depositaria'], [self.n_gestoras, self.n_depositarias])
+
+    @classmethod
+    def from_edges(cls, edges):
+        """``(graph, weights)`` from an edge list, e.g. aggregated by a SQL backend.
+
+        ``edges`` has one row per (gestora_nombre, depositaria_nombre) pair
+        with its number of ``funds``. The graph holds only those pairs and has
+        no ``fund_edge``: its weights are the ``funds`` column, in edge order.
+        """
+        gestora_codes, gestora_names = pd.factorize(edges['gestora_nombre'], sort=True)
+        depositaria_codes, depositaria_names = pd.factorize(edges['depositaria_nombre'], sort=True)
+        graph = cls.__new__(cls)
+        graph.n_gestoras = len(gestora_names)
+        graph.n_depositarias = len(depositaria_names)
+        graph.n_nodes = graph.n_gestoras + graph.n_depositarias
+
+        order = np.lexsort((depositaria_codes, gestora_codes))
+        graph.edge_gestora = gestora_codes[order].astype(np.int32)
+        graph.edge_depositaria = depositaria_codes[order].astype(np.int32)
+        graph.fund_edge = np.empty(0, dtype=np.int32)
+        graph.n_edges = len(order)
+
+        graph.node_names = np.concatenate([np.asarray(gestora_names, dtype=object), np.asarray(depositaria_names, dtype=object)])
+        graph.node_kind = np.repeat(['gestora', 'depositaria'], [graph.n_gestoras, graph.n_depositarias])
+        return graph, edges['funds'].to_numpy()[order].astype(np.int64)
+
+    @property
+    def edge_nodes(self):
+        return self.edge_gestora, self.edge_depositaria + self.n_gestoras
+
+    def weights(self, entity_ids):
+        # Selected funds per edge; edges with weight 0 are absent under the filter
+        edges = self.fund_edge[entity_ids]
+        return np.bincount(edges[edges >= 0], minlength=self.n_edges)
+
+    def degrees(self, weights):
+        # Distinct partners and funds of every node
+        active = weights > 0
+        source, target = self.edge_nodes
+        nodes = np.concatenate([source[active], target[active]])
+        funds = np.concatenate([weights[active], weights[active]])
+        return (
+            np.bincount(nodes, minlength=self.n_nodes),
+            np.bincount(nodes, weights=funds, minlength=self.n_nodes).astype(np.int64)
+        )
+
+    def components(self, weights):
+        """Component label of every node (its smallest node id); -1 for nodes without edges."""
+        active = weights > 0
+        source, target = (nodes[active] for nodes in self.edge_nodes)
+        labels = np.arange(self.n_nodes)
+        while True:
+            # Each edge pulls both ends down to the smaller label, then labels
+            # are shortcut to their own label's label until stable
+            smaller = np.minimum(labels[source], labels[target])
+            updated = labels.copy()
+            np.minimum.at(updated, source, smaller)
+            np.minimum.at(updated, target, smaller)
+            while True:
+                jumped = updated[updated]
+                if np.array_equal(jumped, updated):
+                    break
+                updated = jumped
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+        connected = np.zeros(self.n_nodes, dtype=bool)
+        connected[source] = True
+        connected[target] = True
+        return np.where(connected, labels, -1)
+
+    def centrality(self, weights, max_iter=200, tol=1e-10):
+        """Eigenvector centrality on the fund-weighted graph, scaled so the top node is 1."""
+        active = weights > 0
+        source, target = (nodes[active] for nodes in self.edge_nodes)
+        w = weights[active].astype(float)
+        x = np.zeros(self.n_nodes)
+        x[source] = 1.0
+        x[target] = 1.0
+        if not active.any():
+            return x
+        for _ in range(max_iter):
+            # (A + I) x: the shift keeps the iteration from oscillating, as
+            # bipartite graphs have eigenvalues in +/- pairs
+            nxt = x + np.bincount(source, weights=w * x[target], minlength=self.n_nodes)
+            nxt += np.bincount(target, weights=w * x[source], minlength=self.n_nodes)
+            nxt /= np.linalg.norm(nxt)
+            done = np.abs(nxt - x).sum() < tol * self.n_nodes
+            x = nxt
+            if done:
+                break
+        return x / x.max()
+
+    def overlap(self, weights, gestora_ids):
+        """Depositarias shared by every pair of ``gestora_ids`` (co-custody), as a square frame."""
+        gestora_ids = np.asarray(gestora_ids)
+        position = np.full(self.n_gestoras, -1)
+        position[gestora_ids] = np.arange(len(gestora_ids))
+        active = (weights > 0) & (position[self.edge_gestora] >= 0)
+        custody = np.zeros((len(gestora_ids), self.n_depositarias), dtype=np.int32)
+        custody[position[self.edge_gestora[active]], self.edge_depositaria[active]] = 1
+        names = self.node_names[gestora_ids]
+        return pd.DataFrame(custody @ custody.T, index=names, columns=names)
+
+    def nodes(self, weights):
+        """One row per node with edges under the filter: kind, name, degree, funds, component, centrality."""
+        degree, funds = self.degrees(weights)
+        component = self.components(weights)
+        centrality = self.centrality(weights)
+        present = np.flatnonzero(degree > 0)
+        return pd.DataFrame({
+            'node': present,
+            'kind': self.node_kind[present],
+            'name': self.node_names[present],
+            'degree': degree[present],
+            'funds': funds[present],
+            'component': component[present],
+            'centrality': centrality[present]
+        })
+
+    def edges(self, weights):
+        active = np.flatnonzero(weights > 0)
+        source, target = self.edge_nodes
+        return pd.DataFrame({'source': source[active], 'target': target[active], 'funds': weights[active]})
+
+
+def top_connected(nodes, n=5):
+    # Gestoras working with the most distinct depositarias
+    gestoras = nodes[nodes['kind'] == 'gestora']
+    top = gestoras.sort_values(['degree', 'funds', 'name'], ascending=[False, False, True]).head(n)
+    return pd.Series(top['degree'].to_numpy(), index=top['name'].to_numpy(), name='depositarias')
+
+
+def component_sizes(nodes):
+    # Nodes per component, largest first
+    return nodes.groupby('component').size().sort_values(ascending=False)
+
+
+def radial_layout(nodes, edges):
+    """Node positions: depositarias on a circle, gestoras around their depositarias.
+
+    Each gestora sits at the fund-weighted mean of its depositarias'
+    positions, spread in a sunflower pattern around the depositaria holding
+    most of its funds. Deterministic, and linear in nodes and edges.
+    """
+    node_ids = nodes['node'].to_numpy()
+    is_depositaria = (nodes['kind'] == 'depositaria').to_numpy()
+    positions = np.zeros((node_ids.max() + 1 if len(node_ids) else 0, 2))
+
+    depositarias = nodes[is_depositaria].sort_values('funds', ascending=False)['node'].to_numpy()
+    angles = 2 * np.pi * np.arange(len(depositarias)) / max(len(depositarias), 1)
+    positions[depositarias] = np.column_stack([np.cos(angles), np.sin(angles)])
+    if len(depositarias) == 1:
+        positions[depositarias] = 0.0
+
+    source = edges['source'].to_numpy()
+    target = edges['target'].to_numpy()
+    funds = edges['funds'].to_numpy().astype(float)
+    size = len(positions)
+    total = np.bincount(source, weights=funds, minlength=size)
+    centre = np.column_stack([
+        np.bincount(source, weights=funds * positions[target, axis], minlength=size) for axis in range(2)
+    ]) / np.maximum(total, 1)[:, None]
+
+    # Main depositaria of each gestora: the target of its heaviest edge
+    order = np.lexsort((-funds, source))
+    first = np.r_[True, source[order][1:] != source[order][:-1]]
+    main = np.zeros(size, dtype=np.int64)
+    main[source[order][first]] = target[order][first]
+
+    gestoras = node_ids[~is_depositaria]
+    groups = main[gestoras]
+    group_order = np.argsort(groups, kind='stable')
+    starts = np.r_[0, np.flatnonzero(np.diff(groups[group_order])) + 1]
+    counts = np.diff(np.r_[starts, len(group_order)])
+    rank = np.empty(len(gestoras))
+    rank[group_order] = np.arange(len(gestoras)) - np.repeat(starts, counts)
+    group_size = np.empty(len(gestoras))
+    group_size[group_order] = np.repeat(counts, counts)
+
+    # Sunflower: golden-angle steps, radius growing with the square root of the rank
+    theta = rank * np.pi * (3 - np.sqrt(5))
+    radius = 0.35 * np.sqrt((rank + 0.5) / group_size) * min(1.0, 2 * np.pi / max(len(depositarias), 1))
+    positions[gestoras] = 0.6 * centre[gestoras] + np.column_stack([radius * np.cos(theta), radius * np.sin(theta)])
+    return positions[node_ids]
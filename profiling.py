@@ -0,0 +1,203 @@
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+
+import pandas as pd
+
+# One JSON line per rerun (or fragment rerun) with its section timings
+PROFILE_LOG = os.environ.get('DASHBOARD_PROFILE_LOG', 'profile_log.jsonl')
+# Profile every session, not just the ones showing the debug panel
+PROFILE_ALL = os.environ.get('DASHBOARD_PROFILE', '0') == '1'
+# Peak allocation needs tracemalloc, which slows allocation-heavy code down
+TRACE_MEMORY = os.environ.get('DASHBOARD_PROFILE_MEMORY', '1') == '1'
+# Rollups read at most this many of the latest log lines
+ROLLUP_LINES = 10_000
+
+_DISABLED = contextlib.nullcontext()
+_log_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+class RerunProfiler:
+    """Wall time and peak allocation of the named sections of one rerun.
+
+    ``section(name)`` is a context manager; nested sections are recorded as
+    ``outer/inner`` and a name used twice in a rerun adds up. When disabled,
+    ``section`` returns a shared no-op context, so instrumented code costs one
+    attribute check per section.
+
+    Peak allocation is the most traced (Python and numpy) memory allocated
+    above the section's starting point, from ``tracemalloc``. Tracing is
+    process-wide, so with several sessions profiled at once the figures
+    overlap. Arrow buffers are not traced.
+
+    ``finish()`` writes the rerun to the JSON-lines log. Sections entered
+    afterwards come from a fragment rerunning on its own and are logged as
+    a record of their own.
+    """
+
+    def __init__(self, enabled, session_id=None, log_path=PROFILE_LOG, trace_memory=TRACE_MEMORY):
+        self.enabled = enabled
+        self.session_id = session_id
+        self.log_path = log_path
+        self.trace_memory = enabled and trace_memory
+        self.sections = {}
+        self._stack = []
+        self._start = None
+        self._finalizer = None
+        if enabled:
+            self._begin()
+
+    def _begin(self):
+        self._start = time.perf_counter()
+        if self.trace_memory:
+            _start_tracing()
+            # Reruns that stop early never reach finish(); tracing is released
+            # when the profiler is dropped instead
+            self._finalizer = weakref.finalize(self, _stop_tracing)
+
+    def _end(self):
+        total = time.perf_counter() - self._start
+        self._start = None
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        return total
+
+    def section(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return self._section(name)
+
+    def _memory(self):
+        return tracemalloc.get_traced_memory() if self.trace_memory else (0, 0)
+
+    @contextlib.contextmanager
+    def _section(self, name):
+        standalone = self._start is None
+        if standalone:
+            self.sections = {}
+            self._begin()
+        parent = self._stack[-1] if self._stack else None
+        current, peak = self._memory()
+        if parent is not None:
+            parent['peak'] = max(parent['peak'], peak)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        path = f"{parent['path']}/{name}" if parent else name
+        entry = {'path': path, 'base': current, 'peak': current}
+        self._stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            peak = max(entry['peak'], self._memory()[1])
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], peak)
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+            totals = self.sections.setdefault(path, {'seconds': 0.0, 'peak_bytes': 0})
+            totals['seconds'] += seconds
+            totals['peak_bytes'] = max(totals['peak_bytes'], peak - entry['base'])
+            if standalone:
+                self._write('fragment', self._end())
+
+    def finish(self, **context):
+        """Log the rerun; ``context`` (data version, open tab...) is stored with it."""
+        if not self.enabled or self._start is None:
+            return None
+        return self._write('rerun', self._end(), **context)
+
+    def _write(self, kind, total, **context):
+        record = {
+            'timestamp': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'session': self.session_id,
+            'kind': kind,
+            **context,
+            'total_seconds': round(total, 6),
+            'sections': {
+                path: {'seconds': round(values['seconds'], 6), 'peak_bytes': int(values['peak_bytes'])}
+                for path, values in self.sections.items()
+            }
+        }
+        try:
+            with _log_lock, open(self.log_path, 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError:
+            # Read-only deployments still get the in-page panel
+            pass
+        return record
+
+
+def _section_rows(record):
+    yield 'total', record['total_seconds'], None
+    for path, values in record['sections'].items():
+        yield path, values['seconds'], values['peak_bytes']
+
+
+def section_frame(record):
+    # One row per section of a logged record, plus its total
+    return pd.DataFrame(list(_section_rows(record)), columns=['section', 'seconds', 'peak_bytes'])
+
+
+def rollup(log_path=PROFILE_LOG, max_lines=ROLLUP_LINES):
+    """p50/p95 of every section's time and peak allocation over the latest logged reruns."""
+    rows = []
+    try:
+        with open(log_path, encoding='utf-8') as handle:
+            lines = collections.deque(handle, maxlen=max_lines)
+    except FileNotFoundError:
+        lines = []
+    for line in lines:
+        try:
+            rows.extend(_section_rows(json.loads(line)))
+        except (ValueError, KeyError):
+            # A line cut short by a concurrent writer or a crash
+            continue
+    samples = pd.DataFrame(rows, columns=['section', 'seconds', 'peak_bytes'])
+    grouped = samples.groupby('section', sort=False)
+    return pd.DataFrame({
+        'runs': grouped.size(),
+        'p50_ms': grouped['seconds'].quantile(0.5) * 1000,
+        'p95_ms': grouped['seconds'].quantile(0.95) * 1000,
+        'p95_peak_mb': grouped['peak_bytes'].quantile(0.95) / 1024 / 1024
+    }).reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Percentiles p50/p95 por sección del registro de rendimiento')
+    parser.add_argument('--log', default=PROFILE_LOG)
+    parser.add_argument('--lines', type=int, default=ROLLUP_LINES, help='Últimas líneas del registro a considerar')
+    args = parser.parse_args()
+
+    summary = rollup(args.log, args.lines)
+    if summary.empty:
+        print(f"Sin datos en {args.log}")
+    else:
+        print(summary.sort_values('p95_ms', ascending=False).to_string(index=False, float_format=lambda v: f'{v:.1f}'))
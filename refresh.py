@@ -0,0 +1,156 @@
+import argparse
+import datetime
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_store import (
+    CATEGORICAL_COLS, CSV_PATH, SNAPSHOT_PATH, content_hash, file_hash, load_registry, read_registry_csv,
+    row_hashes, write_snapshot
+)
+
+# A row is one share class of one entity; rows without a class keep NaN keys
+ENTITY_KEY = ['entity_value', 'registro_oficial']
+CLASS_KEY = ['numero', 'isin']
+ROW_KEY = ENTITY_KEY + CLASS_KEY
+
+
+def row_keys(df):
+    # One string per row; NaN parts render as '' so they compare equal
+    parts = [df[col].astype(object).where(df[col].notna(), '').astype(str) for col in ROW_KEY]
+    return pd.Index(parts[0].str.cat(parts[1:], sep='\x1f'))
+
+
+class Delta:
+    """Rows of a new extract compared with the stored snapshot by key and row hash.
+
+    ``added`` and ``changed`` hold positions in the new extract, ``removed``
+    and ``changed_old`` positions in the snapshot (``changed_old[i]`` is the
+    stored version of ``changed[i]``).
+    """
+
+    def __init__(self, old, new):
+        old_keys, new_keys = row_keys(old), row_keys(new)
+        duplicated = new_keys.duplicated()
+        if duplicated.any():
+            raise ValueError(f"Claves de fila duplicadas en el extracto: {list(new_keys[duplicated][:5])}")
+
+        positions = old_keys.get_indexer(new_keys)
+        matched = positions >= 0
+        self.added = np.flatnonzero(~matched)
+        self.removed = np.flatnonzero(~np.isin(np.arange(len(old)), positions[matched]))
+
+        new_hashes = row_hashes(new[old.columns])
+        old_hashes = row_hashes(old)
+        both = np.flatnonzero(matched)
+        differs = new_hashes[both] != old_hashes[positions[both]]
+        self.changed = both[differs]
+        self.changed_old = positions[both][differs]
+        self.unchanged = int((~differs).sum())
+
+        old_entities = set(old['entity_value'])
+        new_entities = set(new['entity_value'])
+        self.entities_added = sorted(new_entities - old_entities)
+        self.entities_removed = sorted(old_entities - new_entities)
+
+    @property
+    def empty(self):
+        return not (len(self.added) or len(self.removed) or len(self.changed))
+
+    def summary(self):
+        return {
+            'added': len(self.added),
+            'removed': len(self.removed),
+            'changed': len(self.changed),
+            'unchanged': self.unchanged,
+            'entities_added': len(self.entities_added),
+            'entities_removed': len(self.entities_removed)
+        }
+
+
+def _plain(df):
+    return df.astype({col: object for col in CATEGORICAL_COLS})
+
+
+def apply_delta(old, new, delta):
+    # Stored rows stay in place (changed ones take the new values), new rows
+    # are appended, then rows are regrouped so each entity stays contiguous
+    merged = _plain(old)
+    updates = _plain(new.iloc[delta.changed][old.columns])
+    for col in old.columns:
+        values = merged[col].to_numpy(copy=True)
+        values[delta.changed_old] = updates[col].to_numpy()
+        merged[col] = values
+    keep = np.ones(len(old), dtype=bool)
+    keep[delta.removed] = False
+    merged = pd.concat([merged[keep], _plain(new.iloc[delta.added][old.columns])], ignore_index=True)
+
+    entity_order, _ = pd.factorize(merged['entity_value'], sort=False)
+    merged = merged.iloc[np.argsort(entity_order, kind='stable')].reset_index(drop=True)
+    for col in CATEGORICAL_COLS:
+        merged[col] = merged[col].astype('category')
+    return merged
+
+
+def _install_extract(extract_path, csv_path):
+    # The extract becomes the registry CSV, the source every snapshot is
+    # rebuilt from; copied next to it first so the swap is atomic
+    if os.path.exists(csv_path) and os.path.samefile(extract_path, csv_path):
+        return
+    tmp_path = f'{csv_path}.{os.getpid()}.tmp'
+    shutil.copyfile(extract_path, tmp_path)
+    os.replace(tmp_path, csv_path)
+
+
+def refresh(extract_path, csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH, dry_run=False, store=None, as_of=None):
+    """Merge a new registry extract into the stored snapshot.
+
+    Only added, removed and changed rows are touched. When something
+    changed, the extract replaces the registry CSV and the snapshot is
+    rewritten with the merged rows, its new content hash and the CSV's hash,
+    so the snapshot stays in step with the CSV it would otherwise be rebuilt
+    from. The dashboard picks the hash up on its next rerun and rebuilds its
+    indexes and caches for the new data. With a ``store``
+    (``versions.VersionStore``) the result is also kept as the version of
+    ``as_of``.
+    """
+    old = load_registry(csv_path, snapshot_path)
+    new = read_registry_csv(extract_path)
+    delta = Delta(old, new)
+    if dry_run:
+        return delta, content_hash(old)
+
+    if delta.empty:
+        merged, version = old, content_hash(old)
+    else:
+        merged = apply_delta(old, new, delta)
+        _install_extract(extract_path, csv_path)
+        version = write_snapshot(merged, snapshot_path, file_hash(csv_path))
+    if store is not None:
+        store.add(merged, as_of)
+    return delta, version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aplica un nuevo extracto del registro al CSV y al snapshot Arrow')
+    parser.add_argument('extract')
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='Solo muestra los cambios')
+    parser.add_argument('--as-of', default=datetime.date.today().isoformat(), help='Fecha del extracto (AAAA-MM-DD)')
+    parser.add_argument('--no-version', action='store_true', help='No guarda el extracto como versión (ver versions.py)')
+    args = parser.parse_args()
+
+    # Imported here: versions.py builds on this module
+    from versions import VersionStore
+    store = None if args.no_version else VersionStore()
+    delta, version = refresh(args.extract, args.csv, args.snapshot, args.dry_run, store, args.as_of)
+    summary = delta.summary()
+    print(
+        f"{summary['added']:,} filas nuevas, {summary['changed']:,} modificadas, "
+        f"{summary['removed']:,} eliminadas, {summary['unchanged']:,} sin cambios "
+        f"({summary['entities_added']:,} entidades nuevas, {summary['entities_removed']:,} eliminadas)"
+    )
+    print(f"Versión de los datos: {version}")
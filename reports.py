@@ -0,0 +1,202 @@
+import argparse
+import html
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from charts import pie_figure, timeline_figure
+from company_stats import company_stats
+from cube import counts_by_type, timeline_counts, totals
+from data_store import CSV_PATH, SNAPSHOT_PATH, data_version
+from engine import Engine, concentration
+from engine_cache import load_engine
+from search_index import normalize
+
+REPORT_DIR = 'reports'
+FORMATS = ['html', 'parquet']
+
+PAGE = '''<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ background: #0e1117; color: #e6e9ef; font-family: sans-serif; margin: 2rem; }}
+h1 {{ color: #a855f7; }} h2 {{ color: #06b6d4; margin-top: 2rem; }}
+table {{ border-collapse: collapse; font-size: 0.9rem; }}
+th, td {{ border-bottom: 1px solid #2a2e39; padding: 0.3rem 0.8rem; text-align: left; }}
+a {{ color: #10b981; }}
+</style></head><body>
+<h1>{title}</h1>
+{body}
+</body></html>
+'''
+
+# Set in each worker process by _init_worker
+_engine = None
+
+
+def _init_worker(version, csv_path, snapshot_path):
+    # One engine per process, mapped from the engine file the parent wrote, so
+    # workers neither rebuild the indexes nor hold their own copy of them
+    global _engine
+    _engine = load_engine(version, lambda: Engine.load(csv_path, snapshot_path))
+
+
+def slug(name):
+    # "Fondos de capital-riesgo" -> "fondos-de-capital-riesgo"
+    return '-'.join(normalize(re.sub(r'\W+', ' ', name)).split()) or 'sin-nombre'
+
+
+def _table(frame, date_cols=()):
+    frame = frame.copy()
+    for col in date_cols:
+        frame[col] = frame[col].dt.strftime('%d/%m/%Y')
+    return frame.to_html(index=False, border=0, na_rep='')
+
+
+def _metrics_table(metrics):
+    rows = [
+        ('Entidades', f"{metrics['n_entities']:,}"),
+        ('Registros', f"{metrics['n_rows']:,}"),
+        ('Con ISIN', f"{metrics['n_isin']:,}"),
+        ('Con folleto', f"{metrics['n_folleto']:,}"),
+        ('Sociedades gestoras', f"{metrics['n_gestoras']:,}"),
+        ('Depositarias', f"{metrics['n_depositarias']:,}")
+    ]
+    return '<table>' + ''.join(f'<tr><th>{k}</th><td>{v}</td></tr>' for k, v in rows) + '</table>'
+
+
+def _company_table(engine, entity_ids, company, label):
+    stats = company_stats(engine.registry, entity_ids, company)
+    stats = stats.sort_values(['entidades', 'nombre'], ascending=[False, True])
+    stats = stats[['nombre', 'entidades', 'clases', 'tipo_principal', 'primer_registro', 'ultimo_registro']]
+    stats.columns = [label, 'Entidades', 'Clases', 'Tipo Principal', 'Primer Registro', 'Último Registro']
+    return _table(stats, ['Primer Registro', 'Último Registro'])
+
+
+def report_body(engine, kind, name):
+    """HTML sections and row-level frame of the report for one gestora or entity type."""
+    if kind == 'gestora':
+        filter_args = engine.filter_args(gestora=name)
+    else:
+        filter_args = engine.filter_args(entity_type=name)
+    entity_ids = engine.select(**filter_args)
+    cells = engine.cells(**filter_args)
+    frame = engine.frame(engine.rows(entity_ids))
+
+    timeline, grain = timeline_counts(cells)
+    timeline = timeline.rename_axis('month_year').reset_index(name='count')
+    sections = [
+        ('Resumen', _metrics_table(totals(cells))),
+        ('Evolución temporal de registros', timeline_figure(timeline, grain).to_html(full_html=False, include_plotlyjs='cdn'))
+    ]
+    if kind == 'gestora':
+        sections.append(('Distribución por tipo de entidad', pie_figure(counts_by_type(cells)).to_html(full_html=False, include_plotlyjs=False)))
+        sections.append(('Entidades depositarias', _company_table(engine, entity_ids, 'depositaria', 'Entidad Depositaria')))
+        entities = engine.registry.entities.take(entity_ids)
+        sections.append(('Entidades gestionadas', _table(
+            entities[['entity_name', 'entity_type', 'entity_value', 'fecha_registro', 'n_classes']]
+            .sort_values('entity_name')
+            .rename(columns={
+                'entity_name': 'Entidad', 'entity_type': 'Tipo', 'entity_value': 'NIF',
+                'fecha_registro': 'Fecha Registro', 'n_classes': 'Clases'
+            }),
+            ['Fecha Registro']
+        )))
+    else:
+        market_share, herfindahl_index = concentration(engine.registry, entity_ids)
+        sections.append(('Concentración del mercado', (
+            f'<table><tr><th>Cuota de mercado top 10</th><td>{market_share:.1f}%</td></tr>'
+            f'<tr><th>Índice Herfindahl</th><td>{herfindahl_index:.4f}</td></tr></table>'
+        )))
+        sections.append(('Sociedades gestoras', _company_table(engine, entity_ids, 'gestora', 'Sociedad Gestora')))
+
+    body = ''.join(f'<h2>{title}</h2>\n{content}\n' for title, content in sections)
+    return body, frame
+
+
+def generate(job):
+    # Runs in a worker: writes one report in every requested format
+    kind, name, file_slug, out_dir, formats = job
+    start = time.perf_counter()
+    body, frame = report_body(_engine, kind, name)
+    directory = os.path.join(out_dir, kind)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    if 'html' in formats:
+        path = os.path.join(directory, f'{file_slug}.html')
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(PAGE.format(title=html.escape(name), body=body))
+        paths.append(path)
+    if 'parquet' in formats:
+        path = os.path.join(directory, f'{file_slug}.parquet')
+        frame.to_parquet(path, index=False)
+        paths.append(path)
+    return kind, name, paths, time.perf_counter() - start
+
+
+def report_jobs(engine, kinds, out_dir, formats):
+    # Slugs are made unique per kind, since different names can normalize alike
+    jobs = []
+    names = {
+        'gestora': sorted(engine.registry.gestora_ids),
+        'entity_type': list(engine.filter_options.entity_types[1:])
+    }
+    for kind in kinds:
+        seen = {}
+        for name in names[kind]:
+            base = slug(name)
+            seen[base] = seen.get(base, 0) + 1
+            file_slug = base if seen[base] == 1 else f'{base}-{seen[base]}'
+            jobs.append((kind, name, file_slug, out_dir, formats))
+    return jobs
+
+
+def write_index(out_dir, results):
+    links = {}
+    for kind, name, paths, _ in results:
+        html_paths = [p for p in paths if p.endswith('.html')]
+        if html_paths:
+            href = os.path.relpath(html_paths[0], out_dir)
+            links.setdefault(kind, []).append(f'<li><a href="{html.escape(href)}">{html.escape(name)}</a></li>')
+    titles = {'entity_type': 'Por tipo de entidad', 'gestora': 'Por sociedad gestora'}
+    body = ''.join(f'<h2>{titles[kind]}</h2><ul>{"".join(items)}</ul>' for kind, items in links.items())
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as handle:
+        handle.write(PAGE.format(title='Informes de Capital Riesgo', body=body))
+
+
+def run(kinds=('entity_type', 'gestora'), out_dir=REPORT_DIR, formats=FORMATS, workers=None,
+        csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    """Generate every report across a pool of ``workers`` processes (all cores by default)."""
+    # Build the snapshot and the engine file once up front so workers only map them
+    version = data_version(csv_path, snapshot_path)
+    _init_worker(version, csv_path, snapshot_path)
+    jobs = report_jobs(_engine, kinds, out_dir, formats)
+
+    if workers == 1:
+        results = [generate(job) for job in jobs]
+    else:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(version, csv_path, snapshot_path)) as pool:
+            results = list(pool.map(generate, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    if 'html' in formats:
+        write_index(out_dir, results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera informes por sociedad gestora y por tipo de entidad')
+    parser.add_argument('--out', default=REPORT_DIR)
+    parser.add_argument('--kind', choices=['entity_type', 'gestora'], action='append', help='Por defecto, ambos')
+    parser.add_argument('--format', choices=FORMATS, action='append', help='Por defecto, html y parquet')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos (por defecto, uno por núcleo)')
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run(
+        args.kind or ['entity_type', 'gestora'], args.out, args.format or FORMATS, args.workers,
+        args.csv, args.snapshot
+    )
+    n_files = sum(len(paths) for _, _, paths, _ in results)
+    print(f"{len(results):,} informes ({n_files:,} ficheros) en {args.out} en {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,98 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from search_index import normalize
+
+
+def estimate_bytes(value):
+    # Rough in-memory size used for the byte budget
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        size = value.memory_usage(deep=True)
+        return int(size.sum()) if isinstance(value, pd.DataFrame) else int(size)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sum(estimate_bytes(k) + estimate_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_bytes(v) for v in value)
+    if hasattr(value, 'to_plotly_json'):
+        # A plotly figure: its trace and layout properties, read in place
+        # rather than serialized with to_json on every miss
+        return estimate_bytes(getattr(value, '_data', [])) + estimate_bytes(getattr(value, '_layout', {}))
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU cache for derived frames and figures.
+
+    Keys are built from the normalized filter state. Entries are evicted
+    least-recently-used first once either ``max_entries`` or ``max_bytes`` is
+    exceeded. Cached values are shared between sessions and must not be
+    mutated by callers.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock; concurrent misses on one key just race
+        value = compute()
+        size = estimate_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self.bytes += size
+                self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def filter_key(entity_type, gestora, depositaria, date_range, search_term=''):
+    # Normalized filter state: dates as ISO strings, search normalized as
+    # the search itself does, so "S.C.R." and "scr" share an entry
+    dates = tuple(pd.Timestamp(d).date().isoformat() for d in date_range) if date_range else ()
+    return (entity_type, gestora, depositaria, dates, normalize(search_term) if search_term else '')
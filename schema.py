@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# Fund-level fields, repeated on every share class row of the CSV
+ENTITY_COLS = [
+    'entity_type',
+    'entity_name',
+    'entity_value',
+    'registro_oficial',
+    'fecha_registro',
+    'fecha_ultimo_folleto',
+    'folleto_url'
+]
+GESTORA_COLS = ['gestora_nombre', 'gestora_registro', 'gestora_domicilio', 'gestora_url']
+DEPOSITARIA_COLS = ['depositaria_nombre', 'depositaria_registro', 'depositaria_domicilio', 'depositaria_url']
+CLASS_COLS = ['numero', 'denominacion', 'fecha_alta', 'dfi', 'isin']
+
+
+def _first_rows(codes):
+    # Position of the first row for each code (codes follow order of appearance)
+    uniques, first_rows = np.unique(codes, return_index=True)
+    return first_rows[uniques >= 0]
+
+
+def _dimension(df, cols, key):
+    # One row per distinct company name; -1 marks rows without a company
+    codes, _ = pd.factorize(df[cols[0]], sort=False)
+    table = df.iloc[_first_rows(codes)][cols].reset_index(drop=True)
+    table.insert(0, key, np.arange(len(table), dtype=np.int32))
+    return table, codes.astype(np.int32)
+
+
+def _take(values, ids):
+    # Positional take where -1 becomes a missing value
+    return pd.api.extensions.take(values, ids, allow_fill=True)
+
+
+def count_distinct(ids):
+    ids = np.asarray(ids)
+    return np.unique(ids[ids >= 0]).size
+
+
+def _class_rollup(entities, classes):
+    # Entity-level summary of the class columns, as shown by "Agrupar por entidad"
+    n_rows = entities['n_rows'].to_numpy()
+    rollup = pd.DataFrame(index=entities['entity_id'])
+    clases = pd.Series(n_rows).astype(str) + ' clases'
+    rollup['numero'] = clases.to_numpy()
+    rollup['denominacion'] = clases.to_numpy()
+
+    isins = classes.loc[classes['isin'].notna(), ['entity_id', 'isin']].drop_duplicates()
+    n_isins = isins.groupby('entity_id').size()
+    first_isins = isins[isins.groupby('entity_id').cumcount() < 3].groupby('entity_id')['isin'].agg(', '.join)
+    more = (n_isins > 3).reindex(rollup.index, fill_value=False).to_numpy()
+    rollup['isin'] = first_isins.reindex(rollup.index, fill_value='').to_numpy()
+    rollup.loc[more, 'isin'] += '...'
+
+    for col in ['fecha_alta', 'dfi']:
+        rollup[col] = classes.groupby('entity_id')[col].first().reindex(rollup.index)
+    return rollup
+
+
+class Registry:
+    """Star schema of the registry: one row per entity, class, gestora and depositaria.
+
+    ``row_entity`` and ``row_class`` map every row of the original CSV to its
+    entity and class (-1 when the row carries no class), so the denormalized
+    frame can be rebuilt for any subset of rows.
+    """
+
+    def __init__(self, entities, classes, gestoras, depositarias, row_entity, row_class, columns):
+        self.entities = entities
+        self.classes = classes
+        self.gestoras = gestoras
+        self.depositarias = depositarias
+        self.row_entity = row_entity
+        self.row_class = row_class
+        self.columns = columns
+        # Rows grouped by entity, so the rows of a set of entities are a few slices
+        self.entity_rows = np.argsort(row_entity, kind='stable').astype(np.int32)
+        self.entity_row_ptr = np.concatenate([[0], np.cumsum(entities['n_rows'].to_numpy())])
+        self.class_rollup = _class_rollup(entities, classes)
+        self.gestora_ids = dict(zip(gestoras['gestora_nombre'], gestoras['gestora_id']))
+        self.depositaria_ids = dict(zip(depositarias['depositaria_nombre'], depositarias['depositaria_id']))
+
+    @property
+    def n_rows(self):
+        return len(self.row_entity)
+
+    @property
+    def n_entities(self):
+        return len(self.entities)
+
+    def rows_for(self, entity_ids):
+        # Original row positions (in file order) of the given entities
+        starts = self.entity_row_ptr[entity_ids]
+        lengths = self.entity_row_ptr[np.asarray(entity_ids) + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.sort(self.entity_rows[np.repeat(starts, lengths) + offsets])
+
+    def to_frame(self, rows=None, columns=None):
+        # Denormalized rows, optionally restricted to ``columns`` so only those are gathered
+        columns = self.columns if columns is None else columns
+        if rows is None:
+            rows = np.arange(self.n_rows)
+        entity_ids = self.row_entity[rows]
+        class_ids = self.row_class[rows]
+        gestora_ids = self.entities['gestora_id'].to_numpy()[entity_ids]
+        depositaria_ids = self.entities['depositaria_id'].to_numpy()[entity_ids]
+
+        data = {}
+        for col in columns:
+            if col in ENTITY_COLS:
+                data[col] = self.entities[col].array.take(entity_ids)
+            elif col in GESTORA_COLS:
+                data[col] = _take(self.gestoras[col].array, gestora_ids)
+            elif col in DEPOSITARIA_COLS:
+                data[col] = _take(self.depositarias[col].array, depositaria_ids)
+            else:
+                data[col] = _take(self.classes[col].array, class_ids)
+        return pd.DataFrame(data, columns=list(columns))
+
+
+def build_registry(df):
+    df = df.reset_index(drop=True)
+    row_entity, _ = pd.factorize(df['entity_value'], sort=False)
+    row_entity = row_entity.astype(np.int32)
+    if (row_entity < 0).any():
+        raise ValueError('Hay filas sin entity_value; read_registry_csv las descarta')
+
+    gestoras, row_gestora = _dimension(df, GESTORA_COLS, 'gestora_id')
+    depositarias, row_depositaria = _dimension(df, DEPOSITARIA_COLS, 'depositaria_id')
+
+    # Fund-level fields are constant per entity, so the first row is enough
+    first_rows = _first_rows(row_entity)
+    entities = df.iloc[first_rows][ENTITY_COLS].reset_index(drop=True)
+    entities.insert(0, 'entity_id', np.arange(len(entities), dtype=np.int32))
+    entities['gestora_id'] = row_gestora[first_rows]
+    entities['depositaria_id'] = row_depositaria[first_rows]
+
+    has_class = df[CLASS_COLS].notna().any(axis=1).to_numpy()
+    classes = df.loc[has_class, CLASS_COLS].reset_index(drop=True)
+    classes.insert(0, 'entity_id', row_entity[has_class])
+    classes.insert(0, 'class_id', np.arange(len(classes), dtype=np.int32))
+    row_class = np.full(len(df), -1, dtype=np.int32)
+    row_class[has_class] = classes['class_id'].to_numpy()
+
+    entities['n_rows'] = np.bincount(row_entity, minlength=len(entities)).astype(np.int32)
+    entities['n_classes'] = np.bincount(classes['entity_id'], minlength=len(entities)).astype(np.int32)
+
+    return Registry(entities, classes, gestoras, depositarias, row_entity, row_class, df.columns.tolist())
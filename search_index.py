@@ -0,0 +1,107 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Fields searched for every entity; ISINs come from its share classes
+SEARCH_FIELDS = ['entity_name', 'gestora_nombre', 'depositaria_nombre', 'entity_value', 'isin']
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    # "S.C.R., S.A." and "SCR SA" both become "scr sa"; accents are dropped
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION.sub('', text.lower())
+    return _SPACES.sub(' ', text).strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Trigram inverted index over the normalized search fields of each entity.
+
+    A query matches the entities holding all of its trigrams. When there are
+    none, it falls back to those holding at least ``min_score`` of them, which
+    tolerates typos. Results are ranked by the share of trigrams matched;
+    among full matches, those whose name contains the query come first, then
+    those holding it in another field, then the rest (trigrams scattered
+    over the fields), each shortest document first.
+    """
+
+    def __init__(self, registry, min_score=0.6):
+        self.min_score = min_score
+        entities = registry.entities
+        gestoras = registry.gestoras['gestora_nombre'].astype(object).to_numpy()
+        depositarias = registry.depositarias['depositaria_nombre'].astype(object).to_numpy()
+
+        isins = registry.classes.loc[registry.classes['isin'].notna(), ['entity_id', 'isin']]
+        isins_by_entity = isins.groupby('entity_id')['isin'].agg(' '.join)
+
+        docs = []
+        for entity_id, name, value, gestora_id, depositaria_id in zip(
+            entities['entity_id'], entities['entity_name'], entities['entity_value'],
+            entities['gestora_id'], entities['depositaria_id']
+        ):
+            fields = [name, value, isins_by_entity.get(entity_id)]
+            if gestora_id >= 0:
+                fields.append(gestoras[gestora_id])
+            if depositaria_id >= 0:
+                fields.append(depositarias[depositaria_id])
+            docs.append(' | '.join(normalize(f) for f in fields if isinstance(f, str)))
+        # Arrow strings rather than Python objects: one contiguous buffer that
+        # pickles out of band, so it is mapped rather than copied (see engine_cache.py)
+        self.docs = pd.Series(docs, dtype='string[pyarrow]')
+
+        postings = {}
+        for entity_id, doc in enumerate(docs):
+            grams = set()
+            for field in doc.split(' | '):
+                grams |= trigrams(' ' + field + ' ')
+            for gram in grams:
+                postings.setdefault(gram, []).append(entity_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def search(self, query, limit=None):
+        # Returns (entity ids, scores), best match first
+        query = normalize(query)
+        if not query:
+            return np.array([], dtype=np.int32), np.array([], dtype=float)
+
+        grams = trigrams(query)
+        if not grams:
+            # Too short for trigrams: plain substring match on the documents
+            ids = np.flatnonzero(self.docs.str.contains(query, regex=False).to_numpy(dtype=bool))
+            ids = self._rank_exact(ids, query)[:limit].astype(np.int32)
+            return ids, np.ones(len(ids))
+
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return np.array([], dtype=np.int32), np.array([], dtype=float)
+        hits = np.bincount(np.concatenate(lists), minlength=len(self.docs))
+        scores = hits / len(grams)
+        # Typo tolerance only kicks in when nothing holds every query trigram
+        exact = np.flatnonzero(scores == 1)
+        if len(exact):
+            ids = self._rank_exact(exact, query)
+        else:
+            ids = np.flatnonzero(scores >= self.min_score)
+            ids = ids[np.argsort(-scores[ids], kind='stable')]
+        ids = ids[:limit].astype(np.int32)
+        return ids, scores[ids]
+
+    def _rank_exact(self, ids, query):
+        # Name holds the query, then another field does, then neither; ties
+        # by document length. The name is each document's first field
+        docs = self.docs.iloc[ids]
+        position = docs.str.find(query).to_numpy(dtype=np.int64)
+        name_end = docs.str.find(' | ').to_numpy(dtype=np.int64)
+        length = docs.str.len().to_numpy(dtype=np.int64)
+        name_end = np.where(name_end < 0, length, name_end)
+        tier = np.where((position >= 0) & (position < name_end), 0, np.where(position >= 0, 1, 2))
+        return ids[np.lexsort((length, tier))]
@@ -0,0 +1,422 @@
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+from data_store import CSV_PATH, DATE_COLS, EXCLUDE_TYPES
+from export import EXPORT_FORMATS, write_export
+from filter_index import FilterOptions
+from network import RelationshipGraph
+from schema import CLASS_COLS, DEPOSITARIA_COLS, ENTITY_COLS, GESTORA_COLS
+from search_index import normalize
+
+try:
+    import duckdb
+except ImportError:  # optional: only the SQL backend needs it
+    duckdb = None
+
+# Parquet dataset, one directory per entity_type (entity_type=<name>/*.parquet)
+PARQUET_DIR = os.environ.get('DASHBOARD_PARQUET_DIR', 'registry_parquet')
+# Cap on DuckDB's memory; past it sorts and aggregations spill to disk
+MEMORY_LIMIT = os.environ.get('DASHBOARD_SQL_MEMORY', '1GB')
+
+# Columns read as numbers, as pandas infers them from the CSV
+NUMERIC_COLS = ['registro_oficial', 'gestora_registro', 'depositaria_registro', 'numero', 'fecha_alta', 'dfi']
+# Same normalization as search_index.normalize, applied to every row once on ingest
+SEARCH_COLS = ['entity_name', 'entity_value', 'isin', 'gestora_nombre', 'depositaria_nombre']
+
+ENTITY_FIELDS = [
+    'entity_name', 'entity_type', 'entity_value', 'registro_oficial', 'fecha_registro',
+    'fecha_ultimo_folleto', 'folleto_url'
+]
+
+# Rows that hold a share class, as schema.build_registry counts them
+_HAS_CLASS = ' OR '.join(f'{col} IS NOT NULL' for col in CLASS_COLS)
+# Class columns of an entity when the explorer groups by entity, as in the registry's class_rollup
+_CLASS_ROLLUP = {
+    'numero': "count(*) || ' clases'",
+    'denominacion': "count(*) || ' clases'",
+    'isin': (
+        "coalesce(array_to_string((list(DISTINCT isin ORDER BY isin) FILTER (WHERE isin IS NOT NULL))[1:3], ', '), '')"
+        " || CASE WHEN count(DISTINCT isin) > 3 THEN '...' ELSE '' END"
+    )
+}
+# COPY options per export file extension; the rest go through export.write_export
+_COPY_OPTIONS = {
+    'csv': 'FORMAT csv, HEADER',
+    'csv.gz': 'FORMAT csv, HEADER, COMPRESSION gzip',
+    'parquet': 'FORMAT parquet, COMPRESSION zstd'
+}
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise RuntimeError("El backend SQL necesita duckdb: pip install duckdb")
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _normalized(expr):
+    return (
+        f"trim(regexp_replace(regexp_replace(strip_accents(lower({expr})), '[^\\w\\s]', '', 'g'), '\\s+', ' ', 'g'))"
+    )
+
+
+def build_parquet(csv_paths=(CSV_PATH,), out_dir=PARQUET_DIR, exclude_types=EXCLUDE_TYPES):
+    """Convert registry extracts into a Parquet dataset partitioned by entity_type.
+
+    Runs entirely inside DuckDB, which streams the CSVs and spills to disk
+    past ``MEMORY_LIMIT``, so extracts larger than RAM (every CNMV registry,
+    with ``exclude_types=()``) convert as well. Dates and numbers are typed
+    as ``read_registry_csv`` types them, and each row gets a normalized
+    ``search_text`` so searches are a substring scan.
+
+    The dataset is written to a fresh directory that then replaces
+    ``out_dir``, so partitions of types no longer in the extract (or no
+    longer included) do not linger from an earlier build.
+    """
+    _require_duckdb()
+    columns = []
+    for col in pd.read_csv(csv_paths[0], nrows=0).columns:
+        if col in DATE_COLS:
+            columns.append(f"try_strptime({col}, '%d/%m/%Y')::DATE AS {col}")
+        elif col in NUMERIC_COLS:
+            columns.append(f"TRY_CAST({col} AS DOUBLE) AS {col}")
+        else:
+            columns.append(col)
+    search_text = " || ' | ' || ".join(f"coalesce({_normalized(col)}, '')" for col in SEARCH_COLS)
+    # As read_registry_csv: rows without an entity_value are dropped too
+    conditions = ['entity_value IS NOT NULL']
+    if exclude_types:
+        conditions.append(f"entity_type NOT IN ({', '.join(_literal(t) for t in exclude_types)})")
+    where = 'WHERE ' + ' AND '.join(conditions)
+
+    out_dir = os.path.normpath(out_dir)
+    tmp_dir = f'{out_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = {_literal(MEMORY_LIMIT)}")
+    paths = '[' + ', '.join(_literal(path) for path in csv_paths) + ']'
+    try:
+        con.execute(f"""
+            COPY (
+                SELECT {', '.join(columns)}, {search_text} AS search_text
+                FROM read_csv({paths}, header = true, all_varchar = true, union_by_name = true)
+                {where}
+            ) TO {_literal(tmp_dir)} (FORMAT parquet, PARTITION_BY (entity_type), COMPRESSION zstd)
+        """)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        con.close()
+
+    # Old dataset moved aside, new one in, old one removed
+    old_dir = f'{out_dir}.{os.getpid()}.old'
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def parquet_version(path=PARQUET_DIR):
+    # Names, sizes and mtimes of the dataset's files; a rewrite changes it
+    digest = hashlib.sha256()
+    for name in sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)):
+        stat = os.stat(name)
+        digest.update(f"{os.path.relpath(name, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class SqlEngine:
+    """The registry queried in place, as a Parquet dataset, with DuckDB.
+
+    The out-of-core counterpart of ``engine.Engine`` for registries too large
+    for memory: nothing but the sidebar option lists is held in RAM. Every
+    filter, search and aggregation becomes a SQL query over the dataset, and
+    a filter on entity_type reads only that type's partition.
+
+    Filters are given the way the sidebar shows them and ``filter_args``
+    turns them into the keyword arguments the query methods take, to which
+    a search ``query`` can be added. Results
+    have the shapes the pandas path returns, so callers can format them the
+    same way. Searches match entities whose name, NIF, ISINs or companies
+    contain every word of the query; unlike ``SearchIndex`` there is no typo
+    tolerance, and matches come back in name order.
+
+    The dashboard runs on it with ``DASHBOARD_BACKEND=sql`` (see main.py),
+    and the API with ``--parquet``.
+    """
+
+    def __init__(self, path=PARQUET_DIR):
+        _require_duckdb()
+        if not glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True):
+            raise FileNotFoundError(f"No hay ficheros Parquet en {path}; genéralos con python sql_backend.py")
+        self.path = path
+        self._con = duckdb.connect()
+        self._con.execute(f"SET memory_limit = {_literal(MEMORY_LIMIT)}")
+        self._con.execute(f"""
+            CREATE VIEW registry AS
+            SELECT * FROM read_parquet({_literal(os.path.join(path, '**', '*.parquet'))}, hive_partitioning = true)
+        """)
+        self._local = threading.local()
+        described = set(self.query("DESCRIBE registry")['column_name'])
+        self.columns = [col for col in ENTITY_COLS + GESTORA_COLS + DEPOSITARIA_COLS + CLASS_COLS if col in described]
+        self.filter_options = FilterOptions.from_frame(self._option_frame())
+        self._gestoras = set(self.filter_options.gestoras('Todos')[1:])
+        self._depositarias = set(self.filter_options.depositarias('Todos', 'Todas')[1:])
+
+    def _cursor(self):
+        # A DuckDB connection is not safe to share between threads; each
+        # thread queries through its own cursor on the same database
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._con.cursor()
+        return cursor
+
+    def query(self, sql):
+        return self._cursor().execute(sql).df()
+
+    def _option_frame(self):
+        # One row per (type, gestora, depositaria) for each of its earliest and
+        # latest registration date: the min/max per group are those of all rows
+        return self.query("""
+            SELECT entity_type, gestora_nombre AS gestora, depositaria_nombre AS depositaria,
+                   unnest([min(fecha_registro), max(fecha_registro)]) AS fecha_registro
+            FROM registry
+            GROUP BY ALL
+        """).astype({'entity_type': object, 'gestora': object, 'depositaria': object})
+
+    def filter_args(self, entity_type='Todos', gestora='Todas', depositaria='Todas', date_range=None):
+        # Unknown names raise KeyError, as Engine.filter_args does
+        if gestora != 'Todas' and gestora not in self._gestoras:
+            raise KeyError(gestora)
+        if depositaria != 'Todas' and depositaria not in self._depositarias:
+            raise KeyError(depositaria)
+        return dict(
+            entity_type=entity_type if entity_type != 'Todos' else None,
+            gestora=gestora if gestora != 'Todas' else None,
+            depositaria=depositaria if depositaria != 'Todas' else None,
+            date_range=tuple(date_range) if date_range is not None and len(date_range) == 2 else None
+        )
+
+    def _where(self, entity_type=None, gestora=None, depositaria=None, date_range=None, query=''):
+        # Literals rather than parameters: the entity_type comparison must be
+        # known when the query is planned for the partitions to be pruned
+        conditions = ['TRUE']
+        if entity_type is not None:
+            conditions.append(f"entity_type = {_literal(entity_type)}")
+        if gestora is not None:
+            conditions.append(f"gestora_nombre = {_literal(gestora)}")
+        if depositaria is not None:
+            conditions.append(f"depositaria_nombre = {_literal(depositaria)}")
+        if date_range is not None:
+            start, end = (pd.Timestamp(value).date().isoformat() for value in date_range)
+            conditions.append(f"fecha_registro BETWEEN DATE {_literal(start)} AND DATE {_literal(end)}")
+        words = normalize(query).split() if query else []
+        if words:
+            # A match on any row selects the entity with all of its rows
+            matches = ' AND '.join(f"contains(search_text, {_literal(word)})" for word in words)
+            conditions.append(f"entity_value IN (SELECT entity_value FROM registry WHERE {matches})")
+        return ' AND '.join(conditions)
+
+    def metrics(self, **filter_args):
+        # Same keys as cube.totals
+        result = self.query(f"""
+            SELECT count(DISTINCT entity_value) AS n_entities, count(*) AS n_rows, count(isin) AS n_isin,
+                   count(folleto_url) AS n_folleto, count(gestora_nombre) AS n_rows_gestora,
+                   count(depositaria_nombre) AS n_rows_depositaria, count(DISTINCT entity_type) AS n_types,
+                   count(DISTINCT gestora_nombre) AS n_gestoras, count(DISTINCT depositaria_nombre) AS n_depositarias,
+                   max(fecha_registro) AS latest
+            FROM registry WHERE {self._where(**filter_args)}
+        """).iloc[0].to_dict()
+        return {k: pd.Timestamp(v) if k == 'latest' else int(v) for k, v in result.items()}
+
+    def cells(self, **filter_args):
+        """Counts per (entity_type, gestora, depositaria, fecha_registro), as ``RegistrationCube.slice`` returns them.
+
+        Company ids are codes of the names within the result, -1 without a
+        company, so ``cube``'s rollups and ``concentration_over_time`` apply
+        unchanged. Only the cells come back, never the rows.
+        """
+        frame = self.query(f"""
+            SELECT entity_type, gestora_nombre, depositaria_nombre, fecha_registro,
+                   count(DISTINCT entity_value) AS n_entities, count(*) AS n_rows, count(isin) AS n_isin,
+                   count(folleto_url) AS n_folleto
+            FROM registry WHERE {self._where(**filter_args)}
+            GROUP BY ALL
+        """)
+        cells = pd.DataFrame({
+            'entity_type': frame['entity_type'].astype(object),
+            'gestora_id': pd.factorize(frame['gestora_nombre'])[0],
+            'depositaria_id': pd.factorize(frame['depositaria_nombre'])[0],
+            'fecha_registro': pd.to_datetime(frame['fecha_registro'])
+        })
+        for measure in ['n_entities', 'n_rows', 'n_isin', 'n_folleto']:
+            cells[measure] = frame[measure].astype('int64')
+        cells['month'] = cells['fecha_registro'].dt.to_period('M').dt.to_timestamp()
+        return cells
+
+    def counts_by_type(self, **filter_args):
+        frame = self.query(f"""
+            SELECT entity_type, count(*) AS n_rows FROM registry WHERE {self._where(**filter_args)}
+            GROUP BY entity_type ORDER BY n_rows DESC, entity_type
+        """)
+        return frame.set_index('entity_type')['n_rows']
+
+    def monthly_counts(self, **filter_args):
+        frame = self.query(f"""
+            SELECT date_trunc('month', fecha_registro) AS month, count(*) AS n_rows FROM registry
+            WHERE {self._where(**filter_args)} AND fecha_registro IS NOT NULL
+            GROUP BY month ORDER BY month
+        """)
+        return frame.set_index(pd.to_datetime(frame['month']).rename('month'))['n_rows']
+
+    def year_type_counts(self, **filter_args):
+        frame = self.query(f"""
+            SELECT year(fecha_registro) AS year, entity_type, count(*) AS n_rows FROM registry
+            WHERE {self._where(**filter_args)} AND fecha_registro IS NOT NULL
+            GROUP BY ALL
+        """)
+        return frame.pivot_table(index='entity_type', columns='year', values='n_rows', fill_value=0, aggfunc='sum')
+
+    def gestora_counts(self, **filter_args):
+        # Rows per gestora, largest first; one row per gestora comes back
+        frame = self.query(f"""
+            SELECT gestora_nombre, count(*) AS n_rows FROM registry
+            WHERE {self._where(**filter_args)} AND gestora_nombre IS NOT NULL
+            GROUP BY gestora_nombre ORDER BY n_rows DESC, gestora_nombre
+        """)
+        return frame.set_index('gestora_nombre')['n_rows']
+
+    def relationship_counts(self, **filter_args):
+        # As engine.relationship_counts
+        result = self.query(f"""
+            SELECT count(*), count(DISTINCT gestora_nombre), count(DISTINCT depositaria_nombre) FROM registry
+            WHERE {self._where(**filter_args)}
+              AND entity_name IS NOT NULL AND gestora_nombre IS NOT NULL AND depositaria_nombre IS NOT NULL
+        """).iloc[0]
+        return tuple(int(v) for v in result)
+
+    def top_connected(self, n=5, **filter_args):
+        # As network.top_connected: distinct depositarias per gestora, then funds, then name
+        frame = self.query(f"""
+            SELECT gestora_nombre, count(DISTINCT depositaria_nombre) AS depositarias,
+                   count(DISTINCT entity_value) AS funds
+            FROM registry
+            WHERE {self._where(**filter_args)} AND gestora_nombre IS NOT NULL AND depositaria_nombre IS NOT NULL
+            GROUP BY gestora_nombre ORDER BY depositarias DESC, funds DESC, gestora_nombre LIMIT {int(n)}
+        """)
+        return pd.Series(frame['depositarias'].to_numpy(), index=frame['gestora_nombre'].to_numpy(), name='depositarias')
+
+    def relationship_graph(self, **filter_args):
+        """``(graph, weights)`` of the matching funds, as ``RelationshipGraph.weights`` gives them in memory."""
+        edges = self.query(f"""
+            SELECT gestora_nombre, depositaria_nombre, count(DISTINCT entity_value) AS funds FROM registry
+            WHERE {self._where(**filter_args)} AND gestora_nombre IS NOT NULL AND depositaria_nombre IS NOT NULL
+            GROUP BY ALL
+        """)
+        return RelationshipGraph.from_edges(edges)
+
+    def company_stats(self, company='gestora', **filter_args):
+        """As ``company_stats.company_stats``, without company ids, largest first."""
+        name_col = f'{company}_nombre'
+        return self.query(f"""
+            WITH entities AS (
+                SELECT entity_value, any_value(entity_type) AS entity_type, any_value({name_col}) AS nombre,
+                       any_value(fecha_registro) AS fecha_registro, count(*) AS n_rows,
+                       count(*) FILTER (WHERE {_HAS_CLASS}) AS n_classes
+                FROM registry WHERE {self._where(**filter_args)} AND {name_col} IS NOT NULL
+                GROUP BY entity_value
+            ), types AS (
+                SELECT nombre, entity_type, sum(n_rows) AS n_rows FROM entities GROUP BY ALL
+            )
+            SELECT nombre, count(*) AS entidades, sum(n_classes)::BIGINT AS clases, sum(n_rows)::BIGINT AS registros,
+                   any_value(tipo_principal) AS tipo_principal,
+                   min(fecha_registro) AS primer_registro, max(fecha_registro) AS ultimo_registro
+            FROM entities
+            JOIN (
+                SELECT nombre, first(entity_type ORDER BY n_rows DESC, entity_type) AS tipo_principal
+                FROM types GROUP BY nombre
+            ) USING (nombre)
+            GROUP BY nombre ORDER BY entidades DESC, nombre
+        """)
+
+    def entity_page(self, offset=0, limit=100, **filter_args):
+        """``(total, page)``: the number of matching entities and one page of them, in name order."""
+        where = self._where(**filter_args)
+        total = int(self.query(f"SELECT count(DISTINCT entity_value) FROM registry WHERE {where}").iloc[0, 0])
+        fields = ', '.join(f'any_value({col}) AS {col}' for col in ENTITY_FIELDS if col != 'entity_value')
+        page = self.query(f"""
+            SELECT entity_value, {fields}, count(*) FILTER (WHERE {_HAS_CLASS}) AS n_classes, count(*) AS n_rows,
+                   any_value(gestora_nombre) AS gestora_nombre, any_value(depositaria_nombre) AS depositaria_nombre
+            FROM registry WHERE {where}
+            GROUP BY entity_value ORDER BY entity_name, entity_value
+            LIMIT {int(limit)} OFFSET {int(offset)}
+        """)
+        return total, page[ENTITY_FIELDS + ['n_classes', 'n_rows', 'gestora_nombre', 'depositaria_nombre']]
+
+    def _explorer_sql(self, columns, sort_by=None, ascending=True, grouped=False, **filter_args):
+        # The data explorer's rows, or one row per entity when grouped, with
+        # class columns rolled up. Missing values sort last either way, as in
+        # pandas; ties in NIF order
+        for col in list(columns) + ([sort_by] if sort_by else []):
+            if col not in self.columns:
+                raise KeyError(col)
+        columns = list(columns) or ['entity_value']
+        direction = 'ASC' if ascending else 'DESC'
+        where = self._where(**filter_args)
+        if not grouped:
+            order = f"{sort_by} {direction} NULLS LAST, " if sort_by else ''
+            return f"""
+                SELECT {', '.join(columns)} FROM registry WHERE {where}
+                ORDER BY {order}entity_value, numero NULLS FIRST
+            """
+        # A group sorts where its first row would in the row order
+        order = f"{'min' if ascending else 'max'}({sort_by}) {direction} NULLS LAST, " if sort_by else ''
+        selected = ', '.join(f"{_CLASS_ROLLUP.get(col, f'any_value({col})')} AS {col}" for col in columns)
+        return f"""
+            SELECT {selected} FROM registry WHERE {where}
+            GROUP BY entity_value ORDER BY {order}entity_value
+        """
+
+    def explorer_page(self, columns, offset=0, limit=100, sort_by=None, ascending=True, grouped=False, **filter_args):
+        """One page of the data explorer: rows (one per entity when ``grouped``) with ``columns``, sorted by ``sort_by``.
+
+        The number of rows or entities to page through is ``metrics``'
+        ``n_rows`` or ``n_entities`` for the same filters.
+        """
+        sql = self._explorer_sql(columns, sort_by, ascending, grouped, **filter_args)
+        return self.query(f"{sql} LIMIT {int(limit)} OFFSET {int(offset)}")[list(columns)]
+
+    def export(self, path, label, columns, sort_by=None, ascending=True, **filter_args):
+        """Write the explorer's rows to ``path``, in ``export.EXPORT_FORMATS`` format ``label``.
+
+        Every row, never grouped by entity, as the in-memory dashboard
+        exports them. CSV and Parquet stream out of DuckDB's COPY; Excel,
+        which has no COPY writer, goes through a frame (a sheet holds at
+        most a million rows).
+        """
+        sql = self._explorer_sql(columns, sort_by, ascending, **filter_args)
+        options = _COPY_OPTIONS.get(EXPORT_FORMATS[label][0])
+        if options is None:
+            write_export(self.query(sql), path, label)
+        else:
+            self._cursor().execute(f"COPY ({sql}) TO {_literal(path)} ({options})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Registro en Parquet particionado por tipo de entidad, para el backend SQL')
+    parser.add_argument('csv', nargs='*', default=[CSV_PATH], help='Extractos CSV del registro')
+    parser.add_argument('--out', default=PARQUET_DIR)
+    parser.add_argument('--all-types', action='store_true', help='Incluye los tipos que el panel excluye en memoria')
+    args = parser.parse_args()
+
+    build_parquet(args.csv, args.out, () if args.all_types else EXCLUDE_TYPES)
+    print(f"Dataset {parquet_version(args.out)} en {args.out}")
@@ -0,0 +1,55 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from schema import CLASS_COLS, DEPOSITARIA_COLS, ENTITY_COLS, GESTORA_COLS  # noqa: E402
+
+REGISTRY_COLUMNS = ENTITY_COLS + GESTORA_COLS + DEPOSITARIA_COLS + CLASS_COLS
+
+
+class ExtractBuilder:
+    """Writes small registry CSV extracts into a test's ``tmp_path``.
+
+    ``entity(...)`` gives the CSV rows of one entity, one per share class
+    number; calling the builder writes a list of those as a CSV and
+    returns its path.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def entity(nif, n, gestora='GESTORA UNO, SGEIC, S.A.', classes=(1,), entity_type='Fondos de capital-riesgo', name=None):
+        entity = {
+            'entity_type': entity_type,
+            'entity_name': name or f'FONDO {nif}, FCR',
+            'entity_value': nif,
+            'registro_oficial': n,
+            'fecha_registro': f'{n % 28 + 1:02d}/03/2020',
+            'fecha_ultimo_folleto': '01/06/2024',
+            'folleto_url': f'https://www.cnmv.es/webservices/verdocumento/ver?e={nif}',
+            'gestora_nombre': gestora,
+            'gestora_registro': 10,
+            'depositaria_nombre': 'DEPOSITARIA UNO, S.A.',
+            'depositaria_registro': 20
+        }
+        return [{**entity, 'numero': i, 'denominacion': f'CLASE {i}', 'isin': f'ES{n:05d}{i:05d}'} for i in classes]
+
+    @staticmethod
+    def frame(entities):
+        return pd.DataFrame([row for rows in entities for row in rows], columns=REGISTRY_COLUMNS)
+
+    def __call__(self, name, entities):
+        path = self.directory / name
+        self.frame(entities).to_csv(path, index=False)
+        return str(path)
+
+
+@pytest.fixture
+def extract(tmp_path):
+    return ExtractBuilder(tmp_path)
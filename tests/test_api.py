@@ -0,0 +1,51 @@
+import pytest
+
+import api
+from data_store import CSV_PATH
+from engine import Engine
+from result_cache import ResultCache
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    return Engine.load(CSV_PATH, str(tmp_path_factory.mktemp('api') / 'registry.arrow'))
+
+
+@pytest.mark.parametrize('params', [{'date_from': ''}, {'date_to': ''}, {'date_from': 'NaT'}, {'date_to': '2020-13-45'}])
+def test_empty_or_invalid_dates_are_bad_requests(engine, params):
+    with pytest.raises(api.BadRequest):
+        api.metrics(engine, ResultCache(), params)
+
+
+def test_search_narrows_every_aggregate(engine):
+    cache = ResultCache()
+    params = {'entity_type': 'Fondos de capital-riesgo', 'q': 'altamar'}
+    hits = api._entity_ids(engine, cache, params, api._filters(engine, params))
+    rows = engine.frame(engine.rows(hits))
+    assert 0 < len(hits) < len(engine.select(**api._filters(engine, params)))
+
+    metrics = api.metrics(engine, cache, params)
+    assert metrics['n_entities'] == len(hits)
+    assert metrics['n_rows'] == len(rows)
+    assert sum(item['count'] for item in api.by_type(engine, cache, params)) == len(rows)
+    assert sum(item['count'] for item in api.timeline(engine, cache, params)) == rows['fecha_registro'].notna().sum()
+    heatmap = api.heatmap(engine, cache, params)
+    assert sum(map(sum, heatmap['counts'])) == rows['fecha_registro'].notna().sum()
+    assert heatmap['years'] == sorted(rows['fecha_registro'].dt.year.dropna().astype(int).unique().tolist())
+
+
+def test_sql_search_narrows_every_aggregate(tmp_path):
+    pytest.importorskip('duckdb')
+    from sql_backend import SqlEngine, build_parquet
+
+    build_parquet([CSV_PATH], str(tmp_path / 'parquet'))
+    engine = SqlEngine(str(tmp_path / 'parquet'))
+    cache = ResultCache()
+    params = {'q': 'altamar'}
+    total, _ = engine.entity_page(**api._sql_filters(engine, params))
+    metrics = api.sql_metrics(engine, cache, params)
+    assert 0 < metrics['n_entities'] == total < api.sql_metrics(engine, cache, {})['n_entities']
+    assert sum(item['count'] for item in api.sql_by_type(engine, cache, params)) == metrics['n_rows']
+    assert sum(map(sum, api.sql_heatmap(engine, cache, params)['counts'])) == sum(
+        item['count'] for item in api.sql_timeline(engine, cache, params)
+    )
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from engine_cache import code_version, load_engine, read_mapped
+
+
+class Engine:
+    def __init__(self, n):
+        self.values = np.arange(n, dtype=np.int64)
+
+
+def _build(calls, n=1000):
+    def build():
+        calls.append(n)
+        return Engine(n)
+    return build
+
+
+def test_builds_once_then_maps(tmp_path):
+    calls = []
+    first = load_engine('v1', _build(calls), str(tmp_path))
+    second = load_engine('v1', _build(calls), str(tmp_path))
+    assert calls == [1000]
+    assert np.array_equal(second.values, first.values)
+    assert not second.values.flags.writeable
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: b'',
+    lambda data: b'NOTANENGINE' + data[11:],
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:24] + b'\xff' * (len(data) - 24)
+])
+def test_unreadable_file_is_rebuilt_and_replaced(tmp_path, damage):
+    calls = []
+    load_engine('v1', _build(calls), str(tmp_path))
+    path = os.path.join(tmp_path, f'engine-v1-{code_version()}.bin')
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    with open(path, 'wb') as handle:
+        handle.write(damage(data))
+
+    engine = load_engine('v1', _build(calls), str(tmp_path))
+    assert calls == [1000, 1000]
+    assert np.array_equal(engine.values, np.arange(1000))
+    assert np.array_equal(read_mapped(path).values, np.arange(1000))
+
+
+def test_file_of_a_class_that_no_longer_loads_is_rebuilt(tmp_path, monkeypatch):
+    calls = []
+    load_engine('v1', _build(calls), str(tmp_path))
+    # The pickled class is gone, as after a rename between releases
+    monkeypatch.delattr(sys.modules[__name__], 'Engine')
+    engine = load_engine('v1', lambda: calls.append('rebuilt') or {'values': np.arange(3)}, str(tmp_path))
+    assert calls == [1000, 'rebuilt']
+    assert np.array_equal(engine['values'], np.arange(3))
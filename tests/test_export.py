@@ -0,0 +1,99 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import export
+from export import export_file, row_chunks
+
+FRAME = pd.DataFrame({'entity_name': [f'FONDO {i}, FCR' for i in range(1000)], 'numero': range(1000)})
+
+
+@pytest.fixture(autouse=True)
+def tmp_dir(tmp_path_factory, monkeypatch):
+    # Temporary files go next to, never into, the exports' directory
+    monkeypatch.setattr(export, 'EXPORT_TMP_DIR', str(tmp_path_factory.mktemp('export_tmp')))
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    # Every export is over budget; only age protects the recent ones
+    monkeypatch.setattr(export, 'EXPORT_CACHE_MAX_BYTES', 1)
+    monkeypatch.setattr(export, 'EXPORT_MIN_AGE_SECONDS', 60)
+
+
+def _age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_returned_export_survives_its_own_prune(tmp_path, budget, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_MIN_AGE_SECONDS', 0)
+    path = export_file(lambda: [FRAME], ('a',), 'CSV', str(tmp_path))
+    assert pd.read_csv(path).equals(FRAME)
+
+
+def test_prune_drops_old_exports_but_not_recent_ones(tmp_path, budget):
+    old = export_file(lambda: [FRAME], ('old',), 'CSV', str(tmp_path))
+    _age(old, 3600)
+    recent = export_file(lambda: [FRAME], ('recent',), 'Parquet', str(tmp_path))
+    newest = export_file(lambda: [FRAME], ('newest',), 'CSV (gzip)', str(tmp_path))
+    assert not os.path.exists(old)
+    assert os.path.exists(recent) and os.path.exists(newest)
+
+
+def test_export_removed_by_another_session_is_rebuilt(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return [FRAME]
+
+    path = export_file(build, ('a',), 'CSV', str(tmp_path))
+    assert export_file(build, ('a',), 'CSV', str(tmp_path)) == path and len(calls) == 1
+    os.remove(path)
+    assert export_file(build, ('a',), 'CSV', str(tmp_path)) == path and len(calls) == 2
+    assert pd.read_csv(path).equals(FRAME)
+
+
+def test_writer_callback_replaces_the_frame(tmp_path):
+    path = export_file(None, ('sql',), 'CSV', str(tmp_path), write=lambda path, label: FRAME.to_csv(path, index=False))
+    assert pd.read_csv(path).equals(FRAME)
+    assert export.export_url(path) == f"app/static/exports/{os.path.basename(path)}"
+
+
+class FrameSource:
+    """Stands in for a Registry: ``to_frame`` rows of ``FRAME``, recording how many it built at once."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def to_frame(self, rows, columns):
+        self.sizes.append(len(rows))
+        return FRAME.iloc[rows][columns].reset_index(drop=True)
+
+
+@pytest.mark.parametrize('label', ['CSV', 'CSV (gzip)', 'Parquet'])
+def test_exports_are_built_a_chunk_at_a_time(tmp_path, monkeypatch, label):
+    monkeypatch.setattr(export, 'CHUNK_ROWS', 300)
+    source = FrameSource()
+    directory = tmp_path / 'exports'
+
+    def chunks():
+        # Nothing half-written is ever in the served directory
+        assert os.listdir(directory) == []
+        return row_chunks(source, np.arange(len(FRAME)), list(FRAME.columns))
+
+    path = export_file(chunks, ('chunks',), label, str(directory), tmp_dir=str(tmp_path / 'tmp'))
+    assert source.sizes == [300, 300, 300, 100]
+    exported = pd.read_parquet(path) if label == 'Parquet' else pd.read_csv(path)
+    assert exported.equals(FRAME)
+    assert os.listdir(tmp_path / 'tmp') == []
+
+
+def test_empty_export_keeps_its_header(tmp_path):
+    path = export_file(lambda: row_chunks(FrameSource(), np.arange(0), ['entity_name']), ('empty',), 'CSV', str(tmp_path))
+    with open(path, encoding='utf-8') as handle:
+        assert handle.read().strip() == 'entity_name'
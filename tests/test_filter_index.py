@@ -0,0 +1,31 @@
+import pandas as pd
+
+from filter_index import FilterOptions
+
+FRAME = pd.DataFrame({
+    'entity_type': ['FCR', 'FCR', 'FCR', 'SCR', 'SCR', None],
+    'gestora': ['G2', 'G1', 'G2', 'G1', None, 'G3'],
+    'depositaria': ['D2', 'D1', 'D1', None, 'D3', 'D4'],
+    'fecha_registro': pd.to_datetime(['2020-01-01', '2018-05-01', '2021-01-01', '2015-01-01', '2016-01-01', '2010-01-01'])
+})
+
+
+def test_options_cascade_on_type_and_gestora():
+    options = FilterOptions.from_frame(FRAME)
+    assert options.entity_types == ['Todos', 'FCR', 'SCR']
+    assert options.gestoras('Todos') == ['Todas', 'G1', 'G2', 'G3']
+    assert options.gestoras('SCR') == ['Todas', 'G1']
+    assert options.depositarias('Todos', 'Todas') == ['Todas', 'D1', 'D2', 'D3', 'D4']
+    assert options.depositarias('FCR', 'Todas') == ['Todas', 'D1', 'D2']
+    assert options.depositarias('FCR', 'G2') == ['Todas', 'D1', 'D2']
+    assert options.depositarias('Todos', 'G1') == ['Todas', 'D1']
+    # No depositaria, or an unknown pair
+    assert options.depositarias('SCR', 'G1') == ['Todas']
+    assert options.depositarias('SCR', 'G2') == ['Todas']
+
+
+def test_date_bounds_per_type():
+    options = FilterOptions.from_frame(FRAME)
+    assert options.date_bounds('Todos') == (pd.Timestamp('2010-01-01'), pd.Timestamp('2021-01-01'))
+    assert options.date_bounds('SCR') == (pd.Timestamp('2015-01-01'), pd.Timestamp('2016-01-01'))
+    assert options.date_bounds('Otro') == options.date_bounds('Todos')
@@ -0,0 +1,141 @@
+import asyncio
+import glob
+import os
+
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from folletos import FolletoCache, fetch_folletos
+
+FOLLETO_URL = 'https://www.cnmv.es/webservices/verdocumento/ver?e={}'
+DOCUMENTS = {
+    'compartido': b'%PDF-1.4 folleto compartido por dos fondos' + b'\0' * 1000,
+    'gamma': b'%PDF-1.4 folleto del fondo gamma' + b'\0' * 1000,
+    'delta': b'%PDF-1.4 folleto del fondo delta' + b'\0' * 1000,
+    'aviso': b'<html>Aviso de cookies</html>'
+}
+# Never answered until the fetch is over, to interrupt a run part way
+HANGS = 'colgado'
+
+
+class PdfServer:
+    """Local stand-in for the CNMV document service, serving ``DOCUMENTS`` by their ``e`` parameter."""
+
+    def __init__(self):
+        self.hits = []
+
+    async def handle(self, request):
+        document = request.query.get('e')
+        self.hits.append(document)
+        if document == HANGS:
+            await self.released.wait()
+        if document not in DOCUMENTS:
+            raise web.HTTPNotFound()
+        return web.Response(body=DOCUMENTS[document], content_type='application/pdf')
+
+    async def fetch(self, cache, funds, timeout=None, **options):
+        self.released = asyncio.Event()
+        app = web.Application()
+        app.router.add_get('/webservices/verdocumento/ver', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        options = {'concurrency': 2, 'rate': 1000, 'retries': 0, **options}
+        try:
+            return await asyncio.wait_for(fetch_folletos(cache, funds, f'http://{host}:{port}', **options), timeout)
+        finally:
+            self.released.set()
+            await runner.cleanup()
+
+
+def fetch(server, cache, funds, **options):
+    server.hits.clear()
+    return asyncio.run(server.fetch(cache, funds, **options))
+
+
+def _funds(*funds):
+    # (entity_value, document, fecha_ultimo_folleto) rows, as funds_with_folleto returns them
+    return pd.DataFrame({
+        'entity_value': [fund[0] for fund in funds],
+        'folleto_url': [FOLLETO_URL.format(fund[1]) for fund in funds],
+        'fecha_ultimo_folleto': [fund[2] for fund in funds]
+    })
+
+
+def _objects(cache):
+    return sorted(glob.glob(os.path.join(cache.directory, 'objects', '*', '*.pdf')))
+
+
+def test_shared_documents_are_stored_once(tmp_path):
+    server, cache = PdfServer(), FolletoCache(str(tmp_path))
+    funds = _funds(('V1', 'compartido', '2024-01-01'), ('V2', 'compartido', '2024-01-01'), ('V3', 'gamma', '2024-01-01'))
+
+    assert fetch(server, cache, funds) == (3, 0)
+    assert len(_objects(cache)) == 2
+    urls = cache.local_urls(['V1', 'V2', 'V3', 'V9'])
+    assert urls[0] == urls[1] != urls[2] and urls[3] is None
+    with open(cache.object_path(cache.manifest()['V3']['sha256']), 'rb') as handle:
+        assert handle.read() == DOCUMENTS['gamma']
+
+
+def test_refetches_only_when_the_prospectus_date_changes(tmp_path):
+    server, cache = PdfServer(), FolletoCache(str(tmp_path))
+    funds = _funds(('V1', 'compartido', '2024-01-01'), ('V3', 'gamma', '2024-01-01'))
+    fetch(server, cache, funds)
+
+    assert fetch(server, cache, funds) == (0, 0)
+    assert server.hits == []
+
+    funds.loc[funds['entity_value'] == 'V3', 'fecha_ultimo_folleto'] = '2025-06-30'
+    assert fetch(server, cache, funds) == (1, 0)
+    assert server.hits == ['gamma']
+    assert cache.manifest()['V3']['fecha_ultimo_folleto'] == '2025-06-30'
+
+
+def test_evicts_least_recently_fetched_past_the_size_budget(tmp_path):
+    server = PdfServer()
+    # Room for two of the documents, not three
+    cache = FolletoCache(str(tmp_path), max_bytes=int(len(DOCUMENTS['gamma']) * 2.5))
+    fetch(server, cache, _funds(('V1', 'compartido', '2024-01-01')))
+    fetch(server, cache, _funds(('V3', 'gamma', '2024-01-01')))
+    fetch(server, cache, _funds(('V4', 'delta', '2024-01-01')))
+
+    assert len(_objects(cache)) == 2
+    assert set(cache.manifest()) == {'V3', 'V4'}
+    assert cache.local_urls(['V1']) == [None]
+    # The evicted fund is pending again
+    assert cache.pending(_funds(('V1', 'compartido', '2024-01-01'), ('V3', 'gamma', '2024-01-01')))['entity_value'].tolist() == ['V1']
+
+
+def test_non_pdf_responses_are_not_cached(tmp_path):
+    server, cache = PdfServer(), FolletoCache(str(tmp_path))
+    assert fetch(server, cache, _funds(('V5', 'aviso', '2024-01-01'), ('V6', 'no-existe', '2024-01-01'))) == (0, 2)
+    assert _objects(cache) == [] and cache.manifest() == {}
+
+
+def test_deleted_manifest_means_nothing_is_cached(tmp_path):
+    server, cache = PdfServer(), FolletoCache(str(tmp_path))
+    funds = _funds(('V1', 'compartido', '2024-01-01'))
+    fetch(server, cache, funds)
+    assert cache.local_urls(['V1'])[0] is not None
+
+    os.remove(cache.manifest_path)
+    assert cache.manifest() == {}
+    assert cache.local_urls(['V1']) == [None]
+    assert len(cache.pending(funds)) == 1
+    assert fetch(server, cache, funds) == (1, 0)
+
+
+def test_interrupted_fetch_keeps_the_completed_batches(tmp_path):
+    server, cache = PdfServer(), FolletoCache(str(tmp_path))
+    # One at a time, so the hanging download comes after the other two
+    funds = _funds(('V1', 'compartido', '2024-01-01'), ('V3', 'gamma', '2024-01-01'), ('V7', HANGS, '2024-01-01'))
+    with pytest.raises(TimeoutError):
+        fetch(server, cache, funds, timeout=2, concurrency=1, batch=1)
+
+    assert set(FolletoCache(str(tmp_path)).manifest()) == {'V1', 'V3'}
+    assert cache.pending(funds)['entity_value'].tolist() == ['V7']
+    assert glob.glob(os.path.join(cache.directory, '**', '*.tmp'), recursive=True) == []
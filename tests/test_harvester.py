@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+from aiohttp import web
+
+from data_store import CSV_PATH, read_registry_csv
+from harvester import COLUMNS, Harvester
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'cnmv')
+LIST_PAGES = {
+    'Fondos de capital-riesgo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=1',
+    'Sociedades de capital-riesgo': '/portal/Consultas/ListadoEntidad.aspx?id=2&tipoent=0'
+}
+DETAIL = '/portal/Consultas/ECR/ECR.aspx?nif={}'
+GESTORA_101 = '/portal/Consultas/iic/gestora.aspx?numero=101'
+
+
+class FixtureServer:
+    """Local stand-in for cnmv.es serving the recorded pages in ``fixtures/cnmv``.
+
+    ``failures`` maps a path to the number of 503 responses it gives before
+    the page (-1: always); ``truncated`` does the same with responses whose
+    body is cut short. Every request is logged with its time.
+    """
+
+    def __init__(self, failures=None, truncated=None):
+        with open(os.path.join(FIXTURES, 'index.json'), encoding='utf-8') as handle:
+            self.pages = json.load(handle)
+        self.failures = dict(failures or {})
+        self.truncated = dict(truncated or {})
+        self.hits = []
+
+    @staticmethod
+    def _take(counts, path):
+        remaining = counts.get(path, 0)
+        if remaining:
+            counts[path] = remaining - 1 if remaining > 0 else remaining
+        return bool(remaining)
+
+    async def handle(self, request):
+        path = request.path_qs
+        self.hits.append((path, time.monotonic()))
+        if path not in self.pages:
+            raise web.HTTPNotFound()
+        if self._take(self.failures, path):
+            return web.Response(status=503)
+        with open(os.path.join(FIXTURES, self.pages[path]), encoding='utf-8') as handle:
+            text = handle.read()
+        if self._take(self.truncated, path):
+            # Announces the whole page, sends half of it and hangs up
+            body = text.encode('utf-8')
+            response = web.StreamResponse(headers={'Content-Type': 'text/html', 'Content-Length': str(len(body))})
+            await response.prepare(request)
+            await response.write(body[:len(body) // 2])
+            request.transport.close()
+            return response
+        return web.Response(text=text, content_type='text/html')
+
+    def count(self, path):
+        return sum(hit == path for hit, _ in self.hits)
+
+    async def harvest(self, **options):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        harvester = Harvester(f'http://{host}:{port}', rate=1000, timeout=5, **options)
+        try:
+            return await harvester.run(LIST_PAGES), harvester.stats
+        finally:
+            await runner.cleanup()
+
+
+def harvest(server, **options):
+    return asyncio.run(server.harvest(**options))
+
+
+def test_harvest_emits_registry_schema(tmp_path):
+    df, stats = harvest(FixtureServer())
+
+    assert list(df.columns) == COLUMNS
+    assert set(df.columns) == set(pd.read_csv(CSV_PATH, nrows=0).columns)
+    assert stats['failed'] == 0
+    # One row per share class, or one row for entities without classes;
+    # listing order across pages is kept
+    assert df['entity_value'].tolist() == ['V11111111', 'V11111111', 'V22222222', 'V33333333', 'A44444444']
+    assert df['isin'].tolist()[:3] == ['ES0100000001', 'ES0100000019', 'ES0100000027']
+
+    alfa = df.iloc[0]
+    assert alfa['entity_type'] == 'Fondos de capital-riesgo'
+    assert alfa['entity_name'] == 'ALFA CAPITAL I, FCR'
+    assert alfa['fecha_registro'] == '15/03/2019'
+    assert alfa['gestora_nombre'] == 'ALFA GESTION, SGEIC, S.A.'
+    assert alfa['gestora_domicilio'] == 'CL. SERRANO, 1 - 28001 MADRID'
+    assert alfa['depositaria_registro'] == '238'
+    # Links point at cnmv.es, not at the server the pages came from
+    assert alfa['folleto_url'] == 'https://www.cnmv.es/webservices/verdocumento/ver?e=ALFA1'
+    assert alfa['gestora_url'] == 'https://www.cnmv.es' + GESTORA_101
+    assert pd.isna(df.iloc[4]['gestora_nombre'])
+
+    # The written extract loads like the real one
+    path = tmp_path / 'extract.csv'
+    df.to_csv(path, index=False)
+    loaded = read_registry_csv(path)
+    assert loaded['fecha_registro'].notna().all()
+    assert len(loaded) == len(df)
+
+
+def test_retries_5xx_with_backoff():
+    server = FixtureServer({DETAIL.format('V22222222'): 2})
+    df, stats = harvest(server, retries=3)
+
+    assert stats['failed'] == 0
+    assert stats['retries'] == 2
+    assert 'V22222222' in df['entity_value'].tolist()
+    times = [t for path, t in server.hits if path == DETAIL.format('V22222222')]
+    assert len(times) == 3
+    # Exponential backoff: at least 0.5 s, then 1 s between attempts
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert gaps[0] >= 0.5 and gaps[1] >= 1.0
+
+
+def test_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.jsonl')
+    failing = DETAIL.format('V33333333')
+    df, stats = harvest(FixtureServer({failing: -1}), retries=0, checkpoint=checkpoint)
+    assert stats['failed'] == 1
+    assert 'V33333333' not in df['entity_value'].tolist()
+    with open(checkpoint, encoding='utf-8') as handle:
+        assert len(handle.readlines()) == 3
+
+    # Only the entity that failed is fetched again
+    server = FixtureServer()
+    resumed, stats = harvest(server, retries=0, checkpoint=checkpoint)
+    assert stats['failed'] == 0
+    assert server.count(failing) == 1
+    for nif in ['V11111111', 'V22222222', 'A44444444']:
+        assert server.count(DETAIL.format(nif)) == 0
+    full, _ = harvest(FixtureServer())
+    pd.testing.assert_frame_equal(resumed, full)
+
+
+def test_failed_company_page_is_fetched_again():
+    # One entity at a time: the first one of the gestora sees its page fail,
+    # the second one fetches it again instead of reusing the failure
+    server = FixtureServer({GESTORA_101: 1})
+    df, stats = harvest(server, retries=0, concurrency=1)
+
+    assert stats['failed'] == 1
+    assert server.count(GESTORA_101) == 2
+    beta = df[df['entity_value'] == 'V22222222'].iloc[0]
+    assert beta['gestora_nombre'] == 'ALFA GESTION, SGEIC, S.A.'
+
+
+def test_truncated_pages_are_retried_then_count_as_one_failure():
+    # A body cut short (aiohttp.ClientPayloadError) is retried like a dropped connection
+    server = FixtureServer(truncated={DETAIL.format('V22222222'): 1})
+    df, stats = harvest(server, retries=1)
+    assert stats['failed'] == 0 and stats['retries'] == 1
+    assert 'V22222222' in df['entity_value'].tolist()
+
+    # Past the retries it fails that entity only, not the whole harvest
+    server = FixtureServer(truncated={DETAIL.format('V22222222'): -1})
+    df, stats = harvest(server, retries=1)
+    assert stats['failed'] == 1
+    assert server.count(DETAIL.format('V22222222')) == 2
+    assert df['entity_value'].tolist() == ['V11111111', 'V11111111', 'V33333333', 'A44444444']
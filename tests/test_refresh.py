@@ -0,0 +1,99 @@
+import os
+
+import pandas as pd
+import pytest
+
+from data_store import content_hash, load_registry, read_registry_csv, snapshot_hash, snapshot_is_stale
+from refresh import Delta, apply_delta, refresh
+from schema import build_registry
+
+def _before(extract):
+    return extract('before.csv', [
+        extract.entity('V00000001', 1, classes=(1, 2)),
+        extract.entity('V00000002', 2, classes=(1, 2, 3)),
+        extract.entity('V00000003', 3),
+        extract.entity('V00000005', 5),
+        # Excluded from the dashboard, but part of the extract
+        extract.entity('A00000009', 9, entity_type='Fondo de inversión a largo plazo europeo')
+    ])
+
+
+def _after(extract):
+    return extract('after.csv', [
+        extract.entity('V00000001', 1, classes=(1, 2, 3)),                  # one class added
+        extract.entity('V00000002', 2, classes=(1, 3)),                     # one class removed
+        extract.entity('V00000003', 3, gestora='GESTORA DOS, SGEIC, S.A.'),  # one row changed
+        extract.entity('V00000004', 4, classes=(1, 2)),                     # new entity
+        # V00000005 removed
+        extract.entity('A00000009', 9, entity_type='Fondo de inversión a largo plazo europeo')
+    ])
+
+
+def test_delta_summary(extract):
+    delta = Delta(read_registry_csv(_before(extract)), read_registry_csv(_after(extract)))
+    assert delta.summary() == {
+        'added': 3, 'removed': 2, 'changed': 1, 'unchanged': 4, 'entities_added': 1, 'entities_removed': 1
+    }
+    assert delta.entities_added == ['V00000004']
+    assert delta.entities_removed == ['V00000005']
+
+
+def test_apply_delta_matches_new_extract(extract):
+    old, new = read_registry_csv(_before(extract)), read_registry_csv(_after(extract))
+    merged = apply_delta(old, new, Delta(old, new))
+    assert content_hash(merged) == content_hash(new)
+    # Each entity's rows stay contiguous
+    assert merged.groupby('entity_value', sort=False).ngroup().is_monotonic_increasing
+
+
+def test_refresh_updates_csv_and_snapshot(tmp_path, extract):
+    csv_path, snapshot_path = str(tmp_path / 'registry.csv'), str(tmp_path / 'registry.arrow')
+    os.replace(_before(extract), csv_path)
+    load_registry(csv_path, snapshot_path)
+    after = _after(extract)
+
+    delta, version = refresh(after, csv_path, snapshot_path)
+    assert not delta.empty
+    assert version == content_hash(read_registry_csv(after)) == snapshot_hash(snapshot_path)
+    # The CSV is the new extract, so the snapshot is not rebuilt from the old one
+    with open(after, 'rb') as new, open(csv_path, 'rb') as registry:
+        assert new.read() == registry.read()
+    assert not snapshot_is_stale(csv_path, snapshot_path)
+
+    # A second run with the same extract changes nothing
+    mtime = os.path.getmtime(snapshot_path)
+    delta, second = refresh(after, csv_path, snapshot_path)
+    assert delta.empty
+    assert second == version
+    assert os.path.getmtime(snapshot_path) == mtime
+
+
+def test_touched_csv_keeps_snapshot(tmp_path, extract):
+    csv_path, snapshot_path = str(tmp_path / 'registry.csv'), str(tmp_path / 'registry.arrow')
+    os.replace(_before(extract), csv_path)
+    refresh(_after(extract), csv_path, snapshot_path)
+    version = snapshot_hash(snapshot_path)
+
+    # A checkout or pull rewrites the file's mtime without changing it
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 10))
+    assert not snapshot_is_stale(csv_path, snapshot_path)
+    assert content_hash(load_registry(csv_path, snapshot_path)) == version
+
+    # Different contents do make it stale
+    with open(csv_path, 'a', encoding='utf-8') as handle:
+        handle.write(extract.frame([extract.entity('V00000006', 6)]).to_csv(header=False, index=False))
+    assert snapshot_is_stale(csv_path, snapshot_path)
+
+
+def test_rows_without_entity_value_are_dropped(extract):
+    orphan = extract.entity('V00000006', 6)[0]
+    orphan['entity_value'] = None
+    path = extract('orphan.csv', [extract.entity('V00000001', 1, classes=(1, 2)), [orphan]])
+    df = read_registry_csv(path)
+    assert df['entity_value'].tolist() == ['V00000001', 'V00000001']
+    registry = build_registry(df)
+    assert len(registry.entities) == 1 and (registry.row_entity >= 0).all()
+
+    with pytest.raises(ValueError):
+        build_registry(pd.concat([df, df.iloc[:1].assign(entity_value=None)], ignore_index=True))
@@ -0,0 +1,22 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from result_cache import ResultCache, estimate_bytes, filter_key
+
+
+def test_equivalent_searches_share_a_key():
+    key = filter_key('Todos', 'Todas', 'Todas', None, 'S.C.R., S.A.')
+    assert key == filter_key('Todos', 'Todas', 'Todas', None, '  scr sa ')
+    assert key != filter_key('Todos', 'Todas', 'Todas', None, 'scr')
+    assert filter_key('Todos', 'Todas', 'Todas', None, None) == filter_key('Todos', 'Todas', 'Todas', None, '')
+
+
+def test_figures_are_sized_without_serializing(monkeypatch):
+    small = go.Figure(go.Scatter(x=np.arange(10), y=np.arange(10.0)))
+    large = go.Figure(go.Scatter(x=np.arange(100_000), y=np.arange(100_000.0)))
+    monkeypatch.setattr(go.Figure, 'to_json', lambda self, *args, **kwargs: 1 / 0)
+    assert estimate_bytes(large) - estimate_bytes(small) >= 2 * 8 * (100_000 - 10)
+
+    cache = ResultCache()
+    cache.get_or_compute(('fig',), lambda: large)
+    assert cache.bytes == estimate_bytes(large)
@@ -0,0 +1,33 @@
+from data_store import read_registry_csv
+from schema import build_registry
+from search_index import SearchIndex
+
+
+def _index(extract, entities):
+    # Index over (entity_name, gestora_nombre) entities, with their names by entity id
+    path = extract('registry.csv', [
+        extract.entity(f'V{n:08d}', n, gestora, name=name) for n, (name, gestora) in enumerate(entities, start=1)
+    ])
+    registry = build_registry(read_registry_csv(path))
+    return SearchIndex(registry), registry.entities['entity_name'].astype(object).to_numpy()
+
+
+def test_name_hits_rank_before_other_fields_and_shorter_first(extract):
+    index, names = _index(extract, [
+        ('ALFA INVERSIONES, FCR', 'NOVA GESTION, SGEIC, S.A.'),
+        ('NOVA TECNOLOGIA Y CRECIMIENTO SOSTENIBLE, FCR', 'GESTORA UNO, SGEIC, S.A.'),
+        ('NOVA, FCR', 'GESTORA UNO, SGEIC, S.A.'),
+        ('BETA, FCR', 'GESTORA UNO, SGEIC, S.A.')
+    ])
+    for query in ['nova', 'NOVA', 'Nová']:
+        ids, scores = index.search(query)
+        assert list(names[ids]) == ['NOVA, FCR', 'NOVA TECNOLOGIA Y CRECIMIENTO SOSTENIBLE, FCR', 'ALFA INVERSIONES, FCR']
+        assert (scores == 1).all()
+    ids, _ = index.search('nova', limit=1)
+    assert list(names[ids]) == ['NOVA, FCR']
+
+
+def test_typos_still_match(extract):
+    index, names = _index(extract, [('TECNOLOGIA AVANZADA, FCR', 'GESTORA UNO, SGEIC, S.A.')])
+    ids, scores = index.search('tecnologai avanzada')
+    assert list(names[ids]) == ['TECNOLOGIA AVANZADA, FCR'] and scores[0] < 1
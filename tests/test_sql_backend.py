@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from concentration import concentration_over_time
+from cube import timeline_counts, totals, year_type_counts
+from data_store import CSV_PATH, read_registry_csv
+from engine import Engine, gestora_counts, graph_tables, relationship_counts, sort_rows
+from export import write_export
+
+pytest.importorskip('duckdb')
+from sql_backend import SqlEngine, build_parquet  # noqa: E402
+
+FILTERS = [
+    {},
+    {'entity_type': 'Fondos de capital-riesgo'},
+    {'entity_type': 'Fondos de capital-riesgo', 'date_range': (pd.Timestamp('2015-01-01'), pd.Timestamp('2020-12-31'))}
+]
+
+
+@pytest.fixture(scope='module')
+def engines(tmp_path_factory):
+    # The repository's extract, in memory and as a Parquet dataset
+    tmp_path = tmp_path_factory.mktemp('sql')
+    build_parquet([CSV_PATH], str(tmp_path / 'parquet'))
+    return Engine.load(CSV_PATH, str(tmp_path / 'registry.arrow')), SqlEngine(str(tmp_path / 'parquet'))
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_cells_roll_up_as_the_cube(engines, filters):
+    memory, sql = engines
+    memory_cells = memory.cells(**memory.filter_args(**filters))
+    sql_cells = sql.cells(**sql.filter_args(**filters))
+    assert totals(sql_cells) == totals(memory_cells)
+    pd.testing.assert_series_equal(timeline_counts(sql_cells)[0], timeline_counts(memory_cells)[0])
+    assert year_type_counts(sql_cells).to_dict() == year_type_counts(memory_cells).to_dict()
+    pd.testing.assert_frame_equal(concentration_over_time(sql_cells), concentration_over_time(memory_cells), check_dtype=False)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_relationship_graph_matches_memory(engines, filters):
+    memory, sql = engines
+    graph, weights = sql.relationship_graph(**sql.filter_args(**filters))
+    sql_nodes = graph.nodes(weights).set_index('name').sort_index()
+    memory_nodes, _ = graph_tables(memory.graph, memory.select(**memory.filter_args(**filters)))
+    memory_nodes = memory_nodes.set_index('name').sort_index()
+    pd.testing.assert_frame_equal(sql_nodes[['kind', 'degree', 'funds']], memory_nodes[['kind', 'degree', 'funds']])
+    assert np.allclose(sql_nodes['centrality'], memory_nodes['centrality'])
+
+
+def test_explorer_pages_and_export(engines, tmp_path):
+    _, sql = engines
+    filter_args = sql.filter_args('Fondos de capital-riesgo')
+    n_rows = sql.metrics(**filter_args)['n_rows']
+    page = sql.explorer_page(['entity_name', 'isin'], 0, 50, 'entity_name', **filter_args)
+    assert list(page.columns) == ['entity_name', 'isin'] and len(page) == 50
+    assert page['entity_name'].is_monotonic_increasing
+
+    grouped = sql.explorer_page(['entity_name', 'numero'], 0, 10_000, grouped=True, **filter_args)
+    assert len(grouped) == sql.metrics(**filter_args)['n_entities']
+    assert grouped['numero'].str.endswith(' clases').all()
+
+    path = tmp_path / 'export.csv'
+    sql.export(str(path), 'CSV', ['entity_name', 'isin'], 'entity_name', **filter_args)
+    exported = pd.read_csv(path)
+    assert len(exported) == n_rows
+    pd.testing.assert_frame_equal(exported.head(50), page.astype(object).where(page.notna(), np.nan), check_dtype=False)
+
+    with pytest.raises(KeyError):
+        sql.explorer_page(['entity_name; DROP TABLE registry'], **filter_args)
+
+
+def test_rows_without_entity_value_are_dropped(tmp_path):
+    # As read_registry_csv drops them
+    df = pd.read_csv(CSV_PATH, nrows=20)
+    df.loc[[3, 7], 'entity_value'] = None
+    df.to_csv(tmp_path / 'orphans.csv', index=False)
+    build_parquet([str(tmp_path / 'orphans.csv')], str(tmp_path / 'parquet'))
+    sql = SqlEngine(str(tmp_path / 'parquet'))
+    expected = read_registry_csv(str(tmp_path / 'orphans.csv'))
+    assert sql.metrics(**sql.filter_args())['n_rows'] == len(expected)
+
+
+def test_export_matches_memory(engines, tmp_path):
+    # The explorer's download for one filter state, from either backend
+    memory, sql = engines
+    filters = FILTERS[2]
+    columns = ['entity_name', 'gestora_nombre', 'fecha_registro', 'isin']
+    rows = sort_rows(memory.registry, memory.rows(memory.select(**memory.filter_args(**filters))), 'fecha_registro')
+    write_export(memory.registry.to_frame(rows, columns), str(tmp_path / 'memory.csv'), 'CSV')
+    sql.export(str(tmp_path / 'sql.csv'), 'CSV', columns, 'fecha_registro', **sql.filter_args(**filters))
+
+    memory_export, sql_export = pd.read_csv(tmp_path / 'memory.csv'), pd.read_csv(tmp_path / 'sql.csv')
+    assert memory_export['fecha_registro'].tolist() == sql_export['fecha_registro'].tolist()
+    # Rows tied on the sort column may come in either order
+    pd.testing.assert_frame_equal(
+        memory_export.sort_values(columns, ignore_index=True), sql_export.sort_values(columns, ignore_index=True)
+    )
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_market_counts_match_memory(engines, filters):
+    memory, sql = engines
+    entity_ids = memory.select(**memory.filter_args(**filters))
+    sql_args = sql.filter_args(**filters)
+    pd.testing.assert_series_equal(
+        gestora_counts(memory.registry, entity_ids), sql.gestora_counts(**sql_args), check_names=False, check_dtype=False
+    )
+    assert relationship_counts(memory.registry, entity_ids) == sql.relationship_counts(**sql_args)
@@ -0,0 +1,24 @@
+from data_store import content_hash, read_registry_csv
+from versions import VersionStore
+
+UNO, DOS = 'GESTORA UNO, SGEIC, S.A.', 'GESTORA DOS, SGEIC, S.A.'
+
+
+def test_every_version_round_trips_through_a_fresh_store(tmp_path, extract):
+    a = read_registry_csv(extract('a.csv', [extract.entity('V00000001', 1, UNO, (1, 2)), extract.entity('V00000002', 2, UNO)]))
+    b = read_registry_csv(extract('b.csv', [extract.entity('V00000001', 1, DOS, (1, 2, 3)), extract.entity('V00000003', 3, UNO)]))
+    c = read_registry_csv(extract('c.csv', [extract.entity('V00000002', 2, UNO, (1, 2))]))
+    store = VersionStore(str(tmp_path / 'snapshots'))
+    # The registry returns to earlier content: A, B, A, C, A
+    for day, df in enumerate([a, b, a, c, a], start=1):
+        store.add(df, f'2024-01-{day:02d}')
+
+    versions = store.versions
+    assert [entry['version'] for entry in versions] == [content_hash(df) for df in [a, b, a, c, a]]
+    assert len({entry['file'] for entry in versions}) == len(versions)
+
+    # Nothing in memory: every version is replayed from the files
+    fresh = VersionStore(str(tmp_path / 'snapshots'))
+    for entry in reversed(versions):
+        assert content_hash(fresh.frame(entry['version'])) == entry['version']
+        assert content_hash(VersionStore(str(tmp_path / 'snapshots')).as_of(entry['as_of'])) == entry['version']
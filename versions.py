@@ -0,0 +1,280 @@
+import argparse
+import collections
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_store import content_hash, read_registry_csv
+from refresh import ROW_KEY, Delta, apply_delta, row_keys
+
+VERSIONS_DIR = 'snapshots'
+MANIFEST = 'versions.json'
+# Delta files: upserted rows carry every column, removed rows only the key
+OP_COL = '_op'
+UPSERT, REMOVE = 'upsert', 'remove'
+# Rebuilt versions kept in memory, so nearby as-of queries replay few deltas
+CACHED_STATES = 4
+
+# Entity-level columns compared by the diff
+DIFF_COLS = ['entity_name', 'entity_type', 'gestora_nombre', 'depositaria_nombre', 'fecha_ultimo_folleto', 'folleto_url']
+
+
+class StoredDelta:
+    """A delta read back from the store, positioned against the state it applies to.
+
+    Has the attributes ``apply_delta`` uses: ``added`` and ``changed`` are
+    positions in ``rows``, ``removed`` and ``changed_old`` positions in the
+    state.
+    """
+
+    def __init__(self, state, rows, removed_keys):
+        positions = row_keys(state).get_indexer(row_keys(rows))
+        self.added = np.flatnonzero(positions < 0)
+        self.changed = np.flatnonzero(positions >= 0)
+        self.changed_old = positions[self.changed]
+        removed = row_keys(state).get_indexer(row_keys(removed_keys))
+        self.removed = removed[removed >= 0]
+
+
+class VersionStore:
+    """Successive registry extracts: the first in full, every later one as a delta.
+
+    Each version is identified by its content hash and dated by ``as_of``,
+    the day its extract was taken. The first version is stored whole; the
+    rest store only the rows added or changed since the version before and
+    the keys of the rows removed, as zstd-compressed Arrow files, so the
+    store grows with the number of changes rather than with the number of
+    extracts. ``versions.json`` lists them in date order.
+
+    ``frame(version)`` rebuilds a version by replaying the deltas on top of
+    the nearest version already in memory (or the first one) with
+    ``refresh.apply_delta``, the same merge the live snapshot goes through.
+    The rebuilt versions are shared by every thread using the store.
+    """
+
+    def __init__(self, path=VERSIONS_DIR):
+        self.path = path
+        self._states = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def versions(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST), encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, versions):
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(versions, handle, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def _write_table(self, df, name):
+        # Row subsets keep their parent's full category lists; only the used
+        # categories are stored
+        df = df.assign(**{
+            col: df[col].cat.remove_unused_categories()
+            for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+        })
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        path = os.path.join(self.path, name)
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.OSFile(path + '.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(path + '.tmp', path)
+        return os.path.getsize(path)
+
+    def _read_table(self, name):
+        with pa.OSFile(os.path.join(self.path, name), 'rb') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+    def add(self, df, as_of):
+        """Store ``df`` as the version of ``as_of``; returns its manifest entry.
+
+        An extract identical to the latest version is not stored again, and
+        a second extract on the latest version's day replaces it.
+        """
+        as_of = pd.Timestamp(as_of).date().isoformat()
+        versions = self.versions
+        version = content_hash(df)
+        if versions and versions[-1]['version'] == version:
+            return versions[-1]
+        if versions and as_of < versions[-1]['as_of']:
+            raise ValueError(f"La versión debe ser posterior a la última ({versions[-1]['as_of']})")
+        if versions and as_of == versions[-1]['as_of']:
+            replaced = versions.pop()
+            with self._lock:
+                self._states.pop(replaced['version'], None)
+            os.remove(os.path.join(self.path, replaced['file']))
+
+        os.makedirs(self.path, exist_ok=True)
+        entry = {'version': version, 'as_of': as_of, 'rows': len(df)}
+        if not versions:
+            entry['file'] = f'base-{version}.arrow'
+            entry['bytes'] = self._write_table(df, entry['file'])
+        else:
+            previous = self.frame(versions[-1]['version'])
+            delta = Delta(previous, df)
+            rows = df.iloc[np.concatenate([delta.added, delta.changed])][previous.columns]
+            removed = previous.iloc[delta.removed][ROW_KEY]
+            stored = pd.concat([
+                rows.assign(**{OP_COL: UPSERT}),
+                removed.assign(**{OP_COL: REMOVE})
+            ], ignore_index=True)
+            # An extract can return to an earlier version's content; the
+            # day keeps each entry's file its own
+            entry['file'] = f'delta-{as_of}-{version}.arrow'
+            entry['bytes'] = self._write_table(stored, entry['file'])
+            entry['parent'] = versions[-1]['version']
+            entry['changes'] = delta.summary()
+        self._write_manifest(versions + [entry])
+        self._remember(version, df)
+        return entry
+
+    def _remember(self, version, df):
+        with self._lock:
+            self._states[version] = df
+            self._states.move_to_end(version)
+            while len(self._states) > CACHED_STATES:
+                self._states.popitem(last=False)
+
+    def frame(self, version):
+        """The registry frame of ``version``; the caller must not mutate it."""
+        with self._lock:
+            state = self._states.get(version)
+            if state is not None:
+                self._states.move_to_end(version)
+                return state
+        versions = self.versions
+        index = next((i for i, entry in enumerate(versions) if entry['version'] == version), None)
+        if index is None:
+            raise KeyError(f"Versión desconocida: {version}")
+
+        # Latest earlier version still in memory, else the stored base; the
+        # deltas are replayed outside the lock
+        with self._lock:
+            start = next((i for i in range(index, -1, -1) if versions[i]['version'] in self._states), None)
+            if start is not None:
+                state = self._states[versions[start]['version']]
+        if start is None:
+            start = 0
+            state = self._read_table(versions[0]['file'])
+        for entry in versions[start + 1:index + 1]:
+            stored = self._read_table(entry['file'])
+            upsert = (stored[OP_COL] == UPSERT).to_numpy()
+            rows = stored[upsert].drop(columns=OP_COL)
+            removed = stored.loc[~upsert, ROW_KEY]
+            state = apply_delta(state, rows, StoredDelta(state, rows, removed))
+        self._remember(version, state)
+        return state
+
+    def version_at(self, as_of):
+        """Manifest entry of the latest version taken on or before ``as_of``; None if there is none."""
+        as_of = pd.Timestamp(as_of).date().isoformat()
+        candidates = [entry for entry in self.versions if entry['as_of'] <= as_of]
+        return candidates[-1] if candidates else None
+
+    def as_of(self, as_of):
+        entry = self.version_at(as_of)
+        return None if entry is None else self.frame(entry['version'])
+
+
+def _entity_table(df):
+    # First row of each entity; entity-level columns repeat on every class row
+    return df.drop_duplicates('entity_value')[['entity_value'] + DIFF_COLS].reset_index(drop=True)
+
+
+def _changed(old, new, col):
+    before = old[col].astype(object).to_numpy()
+    after = new[col].astype(object).to_numpy()
+    return ~(pd.isna(before) & pd.isna(after)) & (before != after)
+
+
+def registry_diff(old, new):
+    """What changed between two registry frames, as one frame per kind of change.
+
+    Entities are matched on ``entity_value`` and share classes on ``isin``
+    with hash joins (``Index.get_indexer``, ``Series.isin``), so the diff is
+    linear in the size of both frames. Keys are 'altas', 'bajas', 'gestora', 'depositaria',
+    'folletos', 'clases_altas' and 'clases_bajas'.
+    """
+    old_entities, new_entities = _entity_table(old), _entity_table(new)
+    positions = pd.Index(old_entities['entity_value']).get_indexer(new_entities['entity_value'])
+    matched = positions >= 0
+    removed = np.ones(len(old_entities), dtype=bool)
+    removed[positions[matched]] = False
+
+    before = old_entities.iloc[positions[matched]].reset_index(drop=True)
+    after = new_entities[matched].reset_index(drop=True)
+
+    def moves(col):
+        changed = _changed(before, after, col)
+        return pd.DataFrame({
+            'entity_value': after['entity_value'][changed],
+            'entity_name': after['entity_name'][changed],
+            'antes': before[col][changed].astype(object),
+            'despues': after[col][changed].astype(object)
+        }).reset_index(drop=True)
+
+    # A new prospectus: a later prospectus date, or a different document
+    dated = before['fecha_ultimo_folleto'].isna() | (after['fecha_ultimo_folleto'] > before['fecha_ultimo_folleto'])
+    folletos = (after['fecha_ultimo_folleto'].notna() & dated.to_numpy()) | _changed(before, after, 'folleto_url')
+    folletos &= after['folleto_url'].notna()
+
+    # ISINs can repeat across rows, so classes are an anti-join on hashed sets
+    old_isins = old.loc[old['isin'].notna(), ['isin', 'entity_value', 'entity_name', 'denominacion']]
+    new_isins = new.loc[new['isin'].notna(), ['isin', 'entity_value', 'entity_name', 'denominacion']]
+
+    return {
+        'altas': new_entities[~matched].reset_index(drop=True),
+        'bajas': old_entities[removed].reset_index(drop=True),
+        'gestora': moves('gestora_nombre'),
+        'depositaria': moves('depositaria_nombre'),
+        'folletos': after.loc[folletos, ['entity_value', 'entity_name', 'fecha_ultimo_folleto', 'folleto_url']].reset_index(drop=True),
+        'clases_altas': new_isins[~new_isins['isin'].isin(old_isins['isin'])].reset_index(drop=True),
+        'clases_bajas': old_isins[~old_isins['isin'].isin(new_isins['isin'])].reset_index(drop=True)
+    }
+
+
+def diff_summary(diff):
+    return {kind: len(frame) for kind, frame in diff.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Versiones del registro: alta de extractos y diferencias entre fechas')
+    parser.add_argument('--store', default=VERSIONS_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_parser = commands.add_parser('add', help='Guarda un extracto como nueva versión')
+    add_parser.add_argument('extract')
+    add_parser.add_argument('--as-of', default=datetime.date.today().isoformat(), help='Fecha del extracto (AAAA-MM-DD)')
+    commands.add_parser('list', help='Lista las versiones guardadas')
+    diff_parser = commands.add_parser('diff', help='Cambios entre dos fechas')
+    diff_parser.add_argument('start')
+    diff_parser.add_argument('end')
+    args = parser.parse_args()
+
+    store = VersionStore(args.store)
+    if args.command == 'add':
+        entry = store.add(read_registry_csv(args.extract), args.as_of)
+        print(f"Versión {entry['version']} a {entry['as_of']}: {entry['bytes']:,} bytes en {entry['file']}")
+    elif args.command == 'list':
+        for entry in store.versions:
+            changes = entry.get('changes')
+            detail = (
+                f"+{changes['added']:,} ~{changes['changed']:,} -{changes['removed']:,} filas" if changes else 'completa'
+            )
+            print(f"{entry['as_of']}  {entry['version']}  {entry['rows']:>9,} filas  {entry['bytes']:>11,} bytes  {detail}")
+    else:
+        start, end = store.as_of(args.start), store.as_of(args.end)
+        if start is None or end is None:
+            parser.error(f"No hay versiones anteriores a {args.start if start is None else args.end}")
+        for kind, count in diff_summary(registry_diff(start, end)).items():
+            print(f"{kind:<14}{count:>8,}")